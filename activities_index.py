@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+import logging
+
+from weather import WEATHER_TYPES
+
+# Индекс рекомендаций занятий: activities.json ("погода_настроение_бюджет_люди"
+# -> список занятий) при загрузке компилируется в плоский массив по всем
+# сочетаниям значений осей. Для сочетаний, которых нет в файле, варианты
+# подбираются заранее по цепочке ослаблений: сначала любой бюджет, затем
+# любое число людей, затем любая погода, поэтому поиск - одно обращение
+# к массиву по индексу и никогда не пустой (если в файле есть хоть что-то).
+#
+# ActivityCatalog следит за изменением файла и перекомпилирует индекс
+# без перезапуска; читатели не берут блокировок - новый индекс просто
+# подменяет старый.
+
+# Значения осей в порядке близости (для ослабления - соседние значения)
+MOODS = ('активное', 'расслабленное', 'экстремальное')
+BUDGETS = ('низкий', 'средний', 'неограниченный')
+PEOPLE = ('один', 'пара', 'компания')
+ACTIVITY_AXES = (WEATHER_TYPES, MOODS, BUDGETS, PEOPLE)
+
+NO_OPTIONS = ("К сожалению, нет подходящих вариантов",)
+ACTIVITIES_CHECK_INTERVAL = 2.0
+
+# Порядок ослабления: индексы осей (погода, настроение, бюджет, люди)
+RELAX_ORDER = ((), (2,), (2, 3), (2, 3, 0))
+MATCH_LEVELS = ('exact', 'budget', 'people', 'weather', 'any')
+
+
+def dedupe(options):
+    return tuple(dict.fromkeys(options))
+
+
+# Близкие значения оси: сначала соседние по порядку, меньшие - раньше
+def nearest_values(values, index):
+    return sorted(range(len(values)), key=lambda j: (abs(j - index), j))
+
+
+class ActivityIndex:
+    def __init__(self, activities, axes):
+        self.axes = [list(values) for values in axes]
+        for key in activities:
+            parts = key.split('_')
+            if len(parts) != len(self.axes):
+                logging.warning("Активности: ключ %s не разбирается на %d частей", key, len(self.axes))
+                continue
+            for axis, value in zip(self.axes, parts):
+                if value not in axis:
+                    axis.append(value)
+
+        self.codes = [{value: i for i, value in enumerate(axis)} for axis in self.axes]
+        # Последняя ячейка каждой оси - для значений, которых нет в осях
+        self.sizes = [len(axis) + 1 for axis in self.axes]
+        exact = {}
+        for key, options in activities.items():
+            parts = key.split('_')
+            if len(parts) == len(self.axes) and options:
+                exact[tuple(self.codes[i][v] for i, v in enumerate(parts))] = dedupe(options)
+        self.exact_count = len(exact)
+
+        everything = dedupe(option for options in exact.values() for option in options) or NO_OPTIONS
+        self.cells = []
+        self.levels = []
+        for combo in self._combinations():
+            options, level = self._resolve(combo, exact)
+            if options is None:
+                options, level = everything, len(MATCH_LEVELS) - 1
+            self.cells.append(options)
+            self.levels.append(level)
+
+    def _combinations(self):
+        combos = [()]
+        for size in self.sizes:
+            combos = [combo + (i,) for combo in combos for i in range(size)]
+        return combos
+
+    def _resolve(self, combo, exact):
+        for level, relaxed in enumerate(RELAX_ORDER):
+            candidates = [()]
+            for axis, code in enumerate(combo):
+                if code == len(self.axes[axis]):
+                    alternatives = range(code)
+                elif axis in relaxed:
+                    alternatives = nearest_values(self.axes[axis], code)
+                else:
+                    alternatives = [code]
+                candidates = [c + (j,) for c in candidates for j in alternatives]
+            for candidate in candidates:
+                options = exact.get(candidate)
+                if options:
+                    return options, level
+        return None, None
+
+    def _offset(self, values):
+        offset = 0
+        for codes, size, value in zip(self.codes, self.sizes, values):
+            offset = offset * size + codes.get(value, size - 1)
+        return offset
+
+    # Варианты и уровень совпадения ('exact', 'budget', ... 'any')
+    def match(self, weather, mood, budget, people):
+        offset = self._offset((weather, mood, budget, people))
+        return self.cells[offset], MATCH_LEVELS[self.levels[offset]]
+
+    def lookup(self, weather, mood, budget, people):
+        return self.match(weather, mood, budget, people)[0]
+
+    def stats(self):
+        counts = {}
+        for level in self.levels:
+            counts[MATCH_LEVELS[level]] = counts.get(MATCH_LEVELS[level], 0) + 1
+        return {'combinations': len(self.cells), 'exact': self.exact_count, 'levels': counts}
+
+
+class ActivityCatalog:
+    def __init__(self, path, axes=ACTIVITY_AXES, check_interval=ACTIVITIES_CHECK_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.axes = axes
+        self.check_interval = check_interval
+        self.clock = clock
+        self._reload_lock = threading.Lock()
+        self._signature = None
+        self._checked_at = clock()
+        self.index = ActivityIndex({}, axes)
+        self.reload()
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def reload(self):
+        signature = self._file_signature()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                activities = json.load(f)
+        except Exception as e:
+            # Остаётся прежний индекс
+            logging.error("Ошибка при загрузке из %s: %s", self.path, e)
+            self._signature = signature
+            return False
+        self.index = ActivityIndex(activities, self.axes)
+        self._signature = signature
+        logging.info("Активности загружены: %s комбинаций", len(activities))
+        return True
+
+    # Проверка файла не чаще раза в check_interval секунд; перекомпилирует
+    # один поток, остальные продолжают читать прежний индекс
+    def current(self):
+        now = self.clock()
+        if now - self._checked_at >= self.check_interval and self._reload_lock.acquire(blocking=False):
+            try:
+                self._checked_at = now
+                if self._file_signature() != self._signature:
+                    self.reload()
+            finally:
+                self._reload_lock.release()
+        return self.index
+
+    def lookup(self, weather, mood, budget, people):
+        return self.current().lookup(weather, mood, budget, people)
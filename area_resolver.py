@@ -0,0 +1,189 @@
+import json
+import re
+import sqlite3
+import difflib
+import threading
+import time
+import logging
+from dataclasses import dataclass
+
+from overpass import ql_string
+
+# Разрешение названия города в стабильную область OSM: id области,
+# ограничивающий прямоугольник и центр. Результат сохраняется в локальной
+# SQLite-базе, повторные запросы (в том числе с другим написанием:
+# "г. Москва", "москва", "Москва") обходятся без Overpass. Близкое по
+# написанию известное название (опечатка) - только подсказка: она
+# используется, когда Overpass не нашёл город с введённым названием, и не
+# сохраняется как синоним (иначе "Омск" навсегда стал бы "Томском").
+# Для офлайн-проверки базу можно заполнить из JSON-фикстуры через
+# load_fixture().
+
+AREAS_DB = 'areas.db'
+AREA_FUZZY_CUTOFF = 0.85
+AREA_NEGATIVE_TTL = 24 * 3600
+OSM_AREA_OFFSET = 3600000000
+
+CITY_PREFIXES = re.compile(r'^(г\.|г |город |пгт\.?\s*|пос\.?\s*|с\.\s*)', re.IGNORECASE)
+
+
+@dataclass(slots=True)
+class AreaInfo:
+    area_id: int
+    name: str
+    south: float
+    west: float
+    north: float
+    east: float
+
+    @property
+    def center(self):
+        return ((self.south + self.north) / 2, (self.west + self.east) / 2)
+
+    @property
+    def bbox(self):
+        return (self.south, self.west, self.north, self.east)
+
+
+# Ключ города для кэшей, индексов и статистики спроса
+def normalize_city(city):
+    return " ".join(city.split()).casefold()
+
+
+def normalize_area_name(city):
+    name = normalize_city(city).replace('ё', 'е')
+    return CITY_PREFIXES.sub('', name).strip(" .,-")
+
+
+def build_area_query(city):
+    city = ql_string(city)
+    return f"""
+        [out:json][timeout:10];
+        (
+          relation["boundary"="administrative"]["name"="{city}"];
+          relation["place"~"^(city|town|village)$"]["name"="{city}"];
+        );
+        out tags bb 10;
+        """
+
+
+# Выбор наиболее вероятной области среди одноимённых: сначала города,
+# затем по населению, затем по уровню административного деления
+def pick_area(elements):
+    def rank(element):
+        tags = element.get("tags", {})
+        try:
+            population = int(str(tags.get("population", "0")).replace(" ", ""))
+        except ValueError:
+            population = 0
+        try:
+            admin_level = int(tags.get("admin_level", 99))
+        except ValueError:
+            admin_level = 99
+        is_city = tags.get("place") == "city"
+        return (is_city, population, -abs(admin_level - 6))
+
+    candidates = [e for e in elements if e.get("type") == "relation" and e.get("bounds")]
+    if not candidates:
+        return None
+    best = max(candidates, key=rank)
+    bounds = best["bounds"]
+    return AreaInfo(
+        area_id=OSM_AREA_OFFSET + best["id"],
+        name=best.get("tags", {}).get("name", ""),
+        south=bounds["minlat"], west=bounds["minlon"],
+        north=bounds["maxlat"], east=bounds["maxlon"]
+    )
+
+
+class AreaResolver:
+    def __init__(self, fetch=None, db_path=AREAS_DB, fuzzy_cutoff=AREA_FUZZY_CUTOFF,
+                 negative_ttl=AREA_NEGATIVE_TTL, clock=time.time):
+        self.fetch = fetch
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS areas ("
+            " key TEXT PRIMARY KEY,"
+            " area_id INTEGER,"
+            " name TEXT,"
+            " south REAL, west REAL, north REAL, east REAL,"
+            " resolved_at REAL NOT NULL)"
+        )
+        self._memory = {}
+        for row in self._conn.execute("SELECT key, area_id, name, south, west, north, east, resolved_at FROM areas"):
+            self._memory[row[0]] = self._from_row(row)
+
+    @staticmethod
+    def _from_row(row):
+        key, area_id, name, south, west, north, east, resolved_at = row
+        info = AreaInfo(area_id, name, south, west, north, east) if area_id else None
+        return info, resolved_at
+
+    # Только локальный кэш, точное совпадение нормализованного названия.
+    # found=True и info=None - Overpass недавно не нашёл такой город
+    def lookup(self, city):
+        key = normalize_area_name(city)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                info, resolved_at = cached
+                if info is not None or self.clock() - resolved_at < self.negative_ttl:
+                    return info, True
+        return None, False
+
+    # Известная область с близким названием; в кэш не записывается
+    def suggest(self, city):
+        key = normalize_area_name(city)
+        with self._lock:
+            known = {k: info for k, (info, _) in self._memory.items() if info is not None}
+        match = difflib.get_close_matches(key, list(known), n=1, cutoff=self.fuzzy_cutoff)
+        if not match:
+            return None
+        logging.debug("Город %s не найден, используется похожий: %s", city, match[0])
+        return known[match[0]]
+
+    def resolve(self, city):
+        info, found = self.lookup(city)
+        if not found:
+            if self.fetch is None:
+                return None
+            try:
+                info = self.fetch(city)
+            except Exception as e:
+                logging.error("Ошибка при определении области для %s: %s", city, e)
+                return None
+            self._store(normalize_area_name(city), info)
+            if info is not None:
+                logging.info("Город %s -> область %s", city, info.area_id)
+        if info is None:
+            return self.suggest(city)
+        return info
+
+    def _store(self, key, info):
+        now = self.clock()
+        with self._lock:
+            self._memory[key] = (info, now)
+            if info is None:
+                values = (key, None, None, None, None, None, None, now)
+            else:
+                values = (key, info.area_id, info.name, info.south, info.west, info.north, info.east, now)
+            self._conn.execute("INSERT OR REPLACE INTO areas VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values)
+
+    # Фикстура: [{"name": ..., "area_id": ..., "bbox": [s, w, n, e], "aliases": [...]}, ...]
+    def load_fixture(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        for entry in entries:
+            south, west, north, east = entry["bbox"]
+            info = AreaInfo(entry["area_id"], entry["name"], south, west, north, east)
+            for name in [entry["name"]] + entry.get("aliases", []):
+                self._store(normalize_area_name(name), info)
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
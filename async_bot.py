@@ -0,0 +1,693 @@
+import asyncio
+import logging
+
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+from http_client import AsyncHttpClient
+from log_setup import Payload, sampled
+from overpass import PLACES_LIMIT, ElementStream, PlaceCollector, build_overpass_query, merge_places
+from send_queue import AsyncSendGate
+from botbotbotbot import (
+    bot_token, configure, flush_stores, user_data, send_limits, metrics, start_metrics, ICONS, CATEGORY_MAPPING, OVERPASS_URL, PLACES_ORDER, PLACES_MULTI_QUERY, PLACES_DEADLINE,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, OWM_URL, LOG_PAYLOAD_SAMPLE,
+    WELCOME_TEXT, CityNotFoundError, WeatherError, log_weather_error, area_resolver, places_cache, weather_cache, favorites_store,
+    normalize_city, resolve_city_alias, search_local_places, demand_tracker, prewarmer, start_prewarm,
+    owm_params, parse_weather_response,
+    get_weather_description,
+    get_user_history, get_favorites, add_favorite, save_history, cleanup_user_data,
+    build_history_text, build_favorites_text, build_weather_text, build_weather_error_text,
+    build_place_details_text, build_venue_data, build_map_url, find_current_place,
+    result_sets, build_places_page, PLACES_PAGE_SIZE, RESULTS_EXPIRED_TEXT,
+    get_activity_options, build_recommendations_text, create_recommendations_keyboard,
+    new_query_id, create_main_keyboard, create_categories_keyboard,
+    create_place_details_keyboard, create_inline_keyboard
+)
+
+# Асинхронный режим бота: тот же набор обработчиков на AsyncTeleBot,
+# внешние API вызываются через aiohttp. Синхронный режим (botbotbotbot.py)
+# продолжает работать и может сравниваться с этим.
+# Запуск: python async_bot.py
+
+bot = AsyncTeleBot(bot_token or '', validate_token=False)
+
+# Те же лимиты исходящих запросов, что и в синхронном режиме
+send_gate = AsyncSendGate(send_limits)
+asyncio_helper._process_request = send_gate.wrap(asyncio_helper._process_request)
+
+overpass_client = AsyncHttpClient(
+    'overpass-async',
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=HTTP_READ_TIMEOUT,
+    retries=HTTP_RETRIES
+)
+owm_client = AsyncHttpClient(
+    'owm-async',
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=HTTP_READ_TIMEOUT,
+    retries=HTTP_RETRIES
+)
+
+# В AsyncTeleBot нет register_next_step_handler, поэтому ожидание ввода
+# города хранится в user_data как отдельный шаг
+AWAIT_CITY_PLACES = 'await_city_places'
+AWAIT_CITY_ACTIVITIES = 'await_city_activities'
+
+
+# Сессии, история и избранное - синхронные хранилища поверх SQLite или
+# Redis, поэтому из обработчиков они вызываются в пуле потоков
+# (asyncio.to_thread): цикл событий не ждёт обращений к диску и сети
+async def get_session(chat_id):
+    return await asyncio.to_thread(user_data.get, chat_id, {})
+
+
+async def require_session(chat_id):
+    return await asyncio.to_thread(user_data.__getitem__, chat_id)
+
+
+async def set_session(chat_id, data):
+    await asyncio.to_thread(user_data.__setitem__, chat_id, data)
+
+
+async def set_step(chat_id, step):
+    session = await asyncio.to_thread(user_data.setdefault, chat_id, {})
+    session['step'] = step
+
+
+async def awaiting_city_places(message):
+    return (await get_session(message.chat.id)).get('step') == AWAIT_CITY_PLACES
+
+
+async def awaiting_city_activities(message):
+    return (await get_session(message.chat.id)).get('step') == AWAIT_CITY_ACTIVITIES
+
+
+@metrics.timed('call')
+async def search_places(city, category):
+    if category not in CATEGORY_MAPPING:
+        logging.warning("Категория не найдена: %s", category)
+        return []
+
+    demand_tracker.record(city, category)
+    # Локальный индекс мест и кэш областей - SQLite, обращения к ним
+    # тоже выполняются в пуле потоков
+    local = await asyncio.to_thread(search_local_places, city, category)
+    if local is not None:
+        return local
+
+    key = (normalize_city(city), category)
+    try:
+        return await places_cache.aget_or_load(key, lambda: fetch_places(city, category))
+    except Exception as e:
+        logging.error("Ошибка при запросе к Overpass API: %s", e)
+        return []
+
+
+# Ответ разбирается по мере получения, как в синхронном режиме: чтение
+# прекращается, когда мест набрано достаточно
+async def run_overpass_query(city, queries, area, center):
+    overpass_query = build_overpass_query(city, queries, PLACES_LIMIT, PLACES_ORDER, area=area)
+    response = await overpass_client.post(OVERPASS_URL, data=overpass_query.encode('utf-8'), stream=True)
+    collector = PlaceCollector([], PLACES_LIMIT, PLACES_ORDER, center)
+    try:
+        response.raise_for_status()
+        stream = ElementStream()
+        async for chunk in response.iter_chunked(8192):
+            if collector.add_all(stream.feed(chunk)) or stream.finished:
+                break
+    finally:
+        response.close()
+    results = collector.finish()
+    logging.debug("Overpass: %s мест для %s в %s", len(results), queries, city)
+    return results
+
+
+@metrics.timed('call')
+async def fetch_places(city, category):
+    queries = CATEGORY_MAPPING[category]
+    area, found = await asyncio.to_thread(area_resolver.lookup, city)
+    if area is None:
+        area = await asyncio.to_thread(area_resolver.resolve, city)
+    center = area.center if area is not None else None
+
+    if PLACES_MULTI_QUERY == 'parallel' and len(queries) > 1:
+        return await fetch_places_parallel(city, queries, area, center)
+    return await run_overpass_query(city, queries, area, center)
+
+
+async def fetch_places_parallel(city, queries, area, center):
+    tasks = [asyncio.create_task(run_overpass_query(city, query, area, center)) for query in queries]
+    done, pending = await asyncio.wait(tasks, timeout=PLACES_DEADLINE)
+    for task in pending:
+        task.cancel()
+
+    place_lists = []
+    error = None
+    for task in tasks:
+        if task not in done:
+            continue
+        if task.exception() is not None:
+            error = task.exception()
+            logging.error("Ошибка при запросе к Overpass API: %s", error)
+        else:
+            place_lists.append(task.result())
+    if pending:
+        logging.warning("Overpass: %d из %d запросов не уложились в %s с для %s",
+                        len(pending), len(tasks), PLACES_DEADLINE, city)
+
+    if not place_lists:
+        raise error or TimeoutError(f"Overpass: нет ответа за {PLACES_DEADLINE} с")
+    return merge_places(place_lists, PLACES_LIMIT, PLACES_ORDER, center)
+
+
+@metrics.timed('call')
+async def get_weather_data(city):
+    demand_tracker.record(city)
+    key, query_city = resolve_city_alias(city)
+    return await weather_cache.aget_or_load(key, lambda: fetch_weather_data(query_city))
+
+
+@metrics.timed('call')
+async def fetch_weather_data(city):
+    logging.debug("Запрос погоды для города: %s", city)
+    try:
+        response = await owm_client.get(OWM_URL, params=owm_params(city))
+        if response.status_code == 404:
+            raise CityNotFoundError(f"город не найден: {city}")
+        response.raise_for_status()
+        data = response.json()
+        if sampled(LOG_PAYLOAD_SAMPLE):
+            logging.debug("Ответ API: %s", Payload(data))
+        return parse_weather_response(data)
+    except CityNotFoundError:
+        logging.warning("Город не найден в OpenWeatherMap: %s", city)
+        raise
+    except Exception as e:
+        log_weather_error(city, e)
+        raise WeatherError(f"Ошибка при получении погоды для {city}") from None
+
+
+# Ввод города обрабатывается раньше остальных обработчиков сообщений,
+# как next step handler в синхронном режиме
+@bot.message_handler(func=awaiting_city_places)
+async def process_city_for_places(message):
+    await set_session(message.chat.id, {
+        "city": message.text.strip(),
+        "step": "places_category"
+    })
+    await bot.send_message(message.chat.id, "Выберите категорию:", reply_markup=create_categories_keyboard())
+    logging.debug("Сохранён город %s для chat_id: %s", message.text.strip(), message.chat.id)
+
+
+@bot.message_handler(func=awaiting_city_activities)
+async def process_city_for_activities(message):
+    city = (message.text or '').strip()
+    try:
+        logging.debug("Обработка города: %s", city)
+
+        weather = await get_weather_data(city)
+        weather_desc = get_weather_description(weather['weather_code'])
+
+        await set_session(message.chat.id, {
+            'step': 'mood',
+            'city': city,
+            'weather': weather_desc,
+            'temp': weather['temp']
+        })
+
+        keyboard = create_inline_keyboard(['активное', 'расслабленное', 'экстремальное'], 'mood', add_back=True, add_cancel=True)
+        await bot.send_message(
+            message.chat.id,
+            build_weather_text(city, weather, weather_desc),
+            reply_markup=keyboard
+        )
+        logging.info("Отправлено сообщение с клавиатурой настроений для chat_id: %s", message.chat.id)
+
+    except Exception as e:
+        await bot.send_message(message.chat.id, build_weather_error_text(city))
+        await bot.send_message(message.chat.id, "Введите название вашего города:")
+        await set_step(message.chat.id, AWAIT_CITY_ACTIVITIES)
+        logging.error("Ошибка в process_city_for_activities: %s", e)
+
+
+@bot.message_handler(commands=['start', 'help'])
+async def send_welcome(message):
+    await bot.send_message(message.chat.id, WELCOME_TEXT, reply_markup=create_main_keyboard())
+    logging.info("Отправлено приветственное сообщение для chat_id: %s", message.chat.id)
+
+
+@bot.message_handler(commands=['history'])
+async def show_history_command(message):
+    history = await asyncio.to_thread(get_user_history, message.chat.id)
+    if not history:
+        await bot.send_message(message.chat.id, "У вас пока нет истории запросов.")
+        logging.info("История пуста для chat_id: %s", message.chat.id)
+        return
+
+    await bot.send_message(message.chat.id, build_history_text(history))
+    logging.info("Отправлена история для chat_id: %s", message.chat.id)
+
+
+@bot.message_handler(commands=['favorites'])
+async def show_favorites_command(message):
+    await show_favorites(message)
+
+
+@bot.message_handler(func=lambda msg: msg.text == "⭐ Избранное")
+async def show_favorites(message):
+    favorites = await asyncio.to_thread(get_favorites, message.chat.id)
+    if not any(favorites.values()):
+        await bot.send_message(message.chat.id, "У вас пока нет избранного.")
+        logging.info("Избранное пусто для chat_id: %s", message.chat.id)
+        return
+
+    await bot.send_message(message.chat.id, build_favorites_text(favorites), parse_mode="HTML")
+    logging.info("Отправлено избранное для chat_id: %s", message.chat.id)
+
+
+@bot.message_handler(func=lambda msg: msg.text == "🏢 Найти заведения")
+async def ask_city_for_places(message):
+    await bot.send_message(message.chat.id, "В каком городе ищем заведения?")
+    await set_step(message.chat.id, AWAIT_CITY_PLACES)
+    logging.info("Запрошен город для поиска заведений, chat_id: %s", message.chat.id)
+
+
+@bot.message_handler(func=lambda msg: msg.text == "🎯 Найти занятия")
+async def ask_city_for_activities(message):
+    await bot.send_message(message.chat.id, "Введите название вашего города:")
+    await set_step(message.chat.id, AWAIT_CITY_ACTIVITIES)
+    logging.info("Запрошен город для поиска занятий, chat_id: %s", message.chat.id)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('category_'))
+async def show_places(call):
+    category = call.data.split('_')[1]
+    chat_id = call.message.chat.id
+    session = await get_session(chat_id)
+    city = session.get("city")
+
+    if not city:
+        await bot.answer_callback_query(call.id, "Город не указан")
+        logging.warning("Город не указан для chat_id: %s", chat_id)
+        return
+
+    await bot.answer_callback_query(call.id, f"Ищем {category.lower()} в {city}...")
+    logging.info("Поиск заведений: %s в %s для chat_id: %s", category, city, chat_id)
+
+    try:
+        places = await search_places(city, category)
+        if not places:
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=call.message.message_id,
+                text=f"Не найдено {category.lower()} в {city}",
+                reply_markup=None
+            )
+            logging.info("Заведения не найдены: %s в %s", category, city)
+            return
+
+        result_set = result_sets.put(chat_id, city, category, places)
+        session["current_query"] = {
+            "id": result_set.handle,
+            "category": category
+        }
+
+        text, keyboard = build_places_page(result_set)
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            text=text,
+            reply_markup=keyboard
+        )
+
+    except Exception as e:
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            text=f"Ошибка при поиске: {str(e)}",
+            reply_markup=None
+        )
+        logging.error("Ошибка при поиске заведений: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('place_'))
+async def show_place_details(call):
+    try:
+        _, query_id, place_type, place_id = call.data.split('_')
+        chat_id = call.message.chat.id
+
+        result_set = result_sets.get(query_id, chat_id)
+        if result_set is None:
+            await bot.answer_callback_query(call.id, RESULTS_EXPIRED_TEXT)
+            logging.info("Устаревший набор результатов: %s для chat_id: %s", query_id, chat_id)
+            return
+
+        place = result_set.find(place_type, place_id)
+        if not place:
+            await bot.answer_callback_query(call.id, "Место не найдено")
+            logging.warning("Место не найдено: %s, type: %s", place_id, place_type)
+            return
+
+        is_favorite = await asyncio.to_thread(favorites_store.has_venue, chat_id, place_type, place["id"])
+        text = build_place_details_text(place, result_set.category)
+        page = result_set.page_of(place_type, place_id, PLACES_PAGE_SIZE)
+
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            text=text,
+            parse_mode="HTML",
+            reply_markup=create_place_details_keyboard(place["id"], place_type, query_id, is_favorite, page)
+        )
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в show_place_details: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('favplace_'))
+async def add_place_to_favorites(call):
+    try:
+        _, query_id, place_type, place_id = call.data.split('_')
+        chat_id = call.message.chat.id
+
+        result_set = result_sets.get(query_id, chat_id)
+        if result_set is None:
+            await bot.answer_callback_query(call.id, RESULTS_EXPIRED_TEXT)
+            logging.info("Устаревший набор результатов: %s для chat_id: %s", query_id, chat_id)
+            return
+
+        place = result_set.find(place_type, place_id)
+        if not place:
+            await bot.answer_callback_query(call.id, "Место не найдено")
+            logging.warning("Место не найдено для добавления в избранное: %s", place_id)
+            return
+
+        venue_data = build_venue_data(result_set, place, place_type)
+
+        if await asyncio.to_thread(add_favorite, chat_id, "venues", venue_data):
+            await bot.answer_callback_query(call.id, "Добавлено в избранное!")
+            page = result_set.page_of(place_type, place_id, PLACES_PAGE_SIZE)
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=call.message.message_id,
+                text=call.message.text,
+                parse_mode="HTML",
+                reply_markup=create_place_details_keyboard(place["id"], place_type, query_id, True, page)
+            )
+            logging.info("Место добавлено в избранное для chat_id: %s", chat_id)
+        else:
+            await bot.answer_callback_query(call.id, "Уже в избранном")
+            logging.info("Место уже в избранном для chat_id: %s", chat_id)
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в add_place_to_favorites: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('map_'))
+async def show_on_map(call):
+    try:
+        _, place_type, place_id = call.data.split('_')
+        chat_id = call.message.chat.id
+
+        place = find_current_place(await get_session(chat_id), place_type, place_id)
+        if not place:
+            place = await asyncio.to_thread(favorites_store.find_venue, chat_id, place_type, place_id)
+
+        if place and "lat" in place and "lon" in place:
+            await bot.answer_callback_query(call.id, "Открываю карту...", url=build_map_url(place))
+        else:
+            await bot.answer_callback_query(call.id, "Координаты места не найдены")
+            logging.warning("Координаты не найдены для места: %s", place_id)
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в show_on_map: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('back_to_'))
+async def handle_back(call):
+    try:
+        action = call.data.split('_')[2]
+        chat_id = call.message.chat.id
+
+        if action == "categories":
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=call.message.message_id,
+                text="Выберите категорию:",
+                reply_markup=create_categories_keyboard()
+            )
+        elif action == "places":
+            parts = call.data.split('_')
+            query_id = parts[3]
+            page = int(parts[4]) if len(parts) > 4 else 0
+            result_set = result_sets.get(query_id, chat_id)
+            if result_set is None:
+                await bot.answer_callback_query(call.id, RESULTS_EXPIRED_TEXT)
+                return
+
+            text, keyboard = build_places_page(result_set, page)
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=call.message.message_id,
+                text=text,
+                reply_markup=keyboard
+            )
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в handle_back: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('page_'))
+async def show_places_page(call):
+    try:
+        _, query_id, page = call.data.split('_')
+        chat_id = call.message.chat.id
+
+        result_set = result_sets.get(query_id, chat_id)
+        if result_set is None:
+            await bot.answer_callback_query(call.id, RESULTS_EXPIRED_TEXT)
+            return
+
+        text, keyboard = build_places_page(result_set, int(page))
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            text=text,
+            reply_markup=keyboard
+        )
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в show_places_page: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == 'back')
+async def handle_back_button(call):
+    await bot.edit_message_text(
+        chat_id=call.message.chat.id,
+        message_id=call.message.message_id,
+        text="Введите название вашего города:",
+        reply_markup=None
+    )
+    await set_step(call.message.chat.id, AWAIT_CITY_ACTIVITIES)
+    logging.info("Обработка кнопки 'Назад' для chat_id: %s", call.message.chat.id)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == 'cancel')
+async def handle_cancel_button(call):
+    await bot.edit_message_text(
+        chat_id=call.message.chat.id,
+        message_id=call.message.message_id,
+        text="Действие отменено. Выберите действие:",
+        reply_markup=create_main_keyboard()
+    )
+    await asyncio.to_thread(cleanup_user_data, call.message.chat.id)
+    logging.info("Обработка кнопки 'Отмена' для chat_id: %s", call.message.chat.id)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('mood_'))
+async def process_mood(call):
+    try:
+        mood = call.data.split('_')[1]
+        chat_id = call.message.chat.id
+
+        session = await require_session(chat_id)
+        session['mood'] = mood
+        session['step'] = 'budget'
+
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            text=f"{call.message.text}\n\nВыбрано: {ICONS['mood'][mood]} {mood.capitalize()}",
+            reply_markup=None
+        )
+
+        await bot.send_message(
+            chat_id,
+            f"{ICONS['actions']['budget']} Выберите ваш бюджет:",
+            reply_markup=create_inline_keyboard(['низкий', 'средний', 'неограниченный'], 'budget', add_back=True, add_cancel=True)
+        )
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в process_mood: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('budget_'))
+async def process_budget(call):
+    try:
+        budget = call.data.split('_')[1]
+        chat_id = call.message.chat.id
+
+        session = await require_session(chat_id)
+        session['budget'] = budget
+        session['step'] = 'people'
+
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            text=f"{call.message.text}\n\nВыбрано: {ICONS['budget'][budget]} {budget.capitalize()}",
+            reply_markup=None
+        )
+
+        await bot.send_message(
+            chat_id,
+            f"{ICONS['actions']['people']} Сколько человек будет участвовать?",
+            reply_markup=create_inline_keyboard(['один', 'пара', 'компания'], 'people', add_back=True, add_cancel=True)
+        )
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в process_budget: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('people_'))
+async def process_people(call):
+    try:
+        people = call.data.split('_')[1]
+        chat_id = call.message.chat.id
+        data = await require_session(chat_id)
+
+        data['people'] = people
+
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            text=f"{call.message.text}\n\nВыбрано: {ICONS['people'][people]} {people.capitalize()}",
+            reply_markup=None
+        )
+
+        options = get_activity_options(data)
+        data['activities'] = options
+
+        query_id = new_query_id(short=True)
+        data['query_id'] = query_id
+        data['current_activities'] = {
+            'options': options,
+            'query_id': query_id
+        }
+
+        await bot.send_message(
+            chat_id,
+            build_recommendations_text(data, options),
+            reply_markup=create_recommendations_keyboard(options, query_id)
+        )
+        await asyncio.to_thread(save_history, chat_id, call.from_user.username or call.from_user.first_name, data)
+        logging.info("Отправлены рекомендации для chat_id: %s", chat_id)
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в process_people: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "restart")
+async def restart_bot(call):
+    await send_welcome(call.message)
+    await asyncio.to_thread(cleanup_user_data, call.message.chat.id)
+    logging.info("Перезапуск бота для chat_id: %s", call.message.chat.id)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "show_history")
+async def show_history_callback(call):
+    await show_history_command(call.message)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('fav_'))
+async def handle_fav_activity(call):
+    try:
+        _, query_id, option_idx = call.data.split('_')
+        chat_id = call.message.chat.id
+
+        activities_data = (await get_session(chat_id)).get('current_activities', {})
+        if str(query_id) != activities_data.get('query_id', ''):
+            await bot.answer_callback_query(call.id, "Данные устарели, выполните новый поиск")
+            logging.warning("Устаревший query_id: %s для chat_id: %s", query_id, chat_id)
+            return
+
+        activity = activities_data['options'][int(option_idx)]
+
+        if await asyncio.to_thread(add_favorite, chat_id, "activities", activity):
+            await bot.answer_callback_query(call.id, "Добавлено в избранное!")
+        else:
+            await bot.answer_callback_query(call.id, "Уже в избранном")
+
+    except (IndexError, ValueError) as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: неверный вариант ({str(e)})")
+        logging.error("Ошибка в handle_fav_activity: %s", e)
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в handle_fav_activity: %s", e)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('venues_'))
+async def show_venues_for_query(call):
+    try:
+        query_id = call.data.split('_')[1]
+        chat_id = call.message.chat.id
+
+        data = await get_session(chat_id)
+        if 'city' not in data or str(data.get('query_id', '')) != query_id:
+            await bot.answer_callback_query(call.id, "Данные устарели, выполните новый поиск")
+            logging.warning("Устаревшие данные для query_id: %s для chat_id: %s", query_id, chat_id)
+            return
+
+        await set_session(chat_id, {
+            "city": data['city'],
+            "step": "places_category",
+            "from_query_id": query_id
+        })
+
+        await bot.send_message(chat_id, f"Выберите категорию заведений в {data['city']}:",
+                               reply_markup=create_categories_keyboard())
+
+    except Exception as e:
+        await bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в show_venues_for_query: %s", e)
+
+
+metrics.instrument_handlers(bot)
+
+
+async def main():
+    configure()
+    logging.info("Бот запущен (OSM версия, asyncio)...")
+    start_metrics()
+    # Прогрев работает в своём потоке через синхронные загрузчики,
+    # кэши общие с этим режимом
+    start_prewarm()
+    try:
+        await bot.infinity_polling(timeout=10, request_timeout=15)
+    finally:
+        prewarmer.stop()
+        await overpass_client.close()
+        await owm_client.close()
+        await bot.close_session()
+        flush_stores()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import os
+import sys
+import timeit
+import logging
+import argparse
+
+from telebot import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyboards import (
+    ICONS, create_main_keyboard, create_categories_keyboard, create_places_keyboard,
+    create_inline_keyboard
+)
+
+# Время процессора на клавиатуры за одно обновление: прежние построители
+# (объекты кнопок + DEBUG-лог на каждую кнопку + to_json при отправке)
+# против закэшированного JSON и шаблона клавиатуры мест. Перед замером
+# проверяется, что JSON совпадает байт в байт.
+# Логирование настроено как в боте на уровне DEBUG, но пишет в никуда,
+# чтобы учитывалось форматирование записей, а не диск.
+# Пример: python benchmarks/bench_keyboards.py --level DEBUG
+
+
+def legacy_main_keyboard():
+    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add("🎯 Найти занятия", "🏢 Найти заведения")
+    keyboard.add("⭐ Избранное", "📜 История")
+    logging.debug("Основная клавиатура создана")
+    return keyboard
+
+
+def legacy_categories_keyboard():
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    categories = ["Кафе", "Рестораны", "Кинотеатры", "Парки", "Музеи", "Торговые центры"]
+    buttons = [types.InlineKeyboardButton(text=cat, callback_data=f"category_{cat}") for cat in categories]
+    keyboard.add(*buttons)
+    logging.debug("Клавиатура категорий создана")
+    return keyboard
+
+
+def legacy_places_keyboard(places, query_id):
+    keyboard = types.InlineKeyboardMarkup(row_width=1)
+    for place in places:
+        callback_data = f"place_{query_id}_{place['type']}_{place['id']}"
+        keyboard.add(types.InlineKeyboardButton(
+            text=f"🏢 {place['name']}",
+            callback_data=callback_data
+        ))
+    keyboard.add(types.InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_categories"))
+    logging.debug("Клавиатура мест создана для query_id: %s", query_id)
+    return keyboard
+
+
+def legacy_inline_keyboard(items, prefix="", add_back=False, add_cancel=False):
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    for item in items:
+        callback_data = f"{prefix}_{item}"
+        buttons.append(types.InlineKeyboardButton(
+            text=f"{ICONS.get(prefix, {}).get(item, '')} {item.capitalize()}",
+            callback_data=callback_data
+        ))
+        logging.debug("Добавлена кнопка: %s, callback_data: %s", item, callback_data)
+    if add_back:
+        buttons.append(types.InlineKeyboardButton(text="🔙 Назад", callback_data="back"))
+        logging.debug("Добавлена кнопка 'Назад'")
+    if add_cancel:
+        buttons.append(types.InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"))
+        logging.debug("Добавлена кнопка 'Отмена'")
+    keyboard.add(*buttons)
+    logging.debug("Клавиатура создана для %s: %s", prefix, items)
+    return keyboard
+
+
+# Форматирует запись, как QueueHandler бота, но никуда её не пишет
+class FormatOnlyHandler(logging.Handler):
+    def emit(self, record):
+        self.format(record)
+
+
+PLACES = [{"type": "node", "id": 1000000 + i, "name": f'Кафе "Место {i}"'} for i in range(15)]
+
+
+# Типичный набор клавиатур за одно обновление - по одной каждого вида
+def update_work(main, categories, places, inline):
+    return [
+        main().to_json(),
+        categories().to_json(),
+        places(PLACES, "a1b2c3d4").to_json(),
+        inline(['активное', 'расслабленное', 'экстремальное'], 'mood', add_back=True, add_cancel=True).to_json(),
+        inline(['низкий', 'средний', 'неограниченный'], 'budget', add_back=True, add_cancel=True).to_json(),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--level', default='DEBUG')
+    args = parser.parse_args(argv)
+
+    root = logging.getLogger()
+    root.addHandler(FormatOnlyHandler())
+    root.setLevel(args.level)
+
+    legacy = (legacy_main_keyboard, legacy_categories_keyboard, legacy_places_keyboard, legacy_inline_keyboard)
+    cached = (create_main_keyboard, create_categories_keyboard, create_places_keyboard, create_inline_keyboard)
+    if update_work(*legacy) != update_work(*cached):
+        print("JSON клавиатур различается")
+        return 1
+
+    for name, builders in (("прежние", legacy), ("кэш/шаблон", cached)):
+        elapsed = min(timeit.repeat(lambda: update_work(*builders), number=args.number, repeat=5))
+        print(f"{name:12} {elapsed / args.number * 1e6:8.1f} мкс на обновление")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import MetricsRegistry
+
+# Накладные расходы инструментирования на одно обновление: обработчик
+# плюс два вызова (search_places/get_weather_data) с обёртками и без.
+# Обработчики-заглушки почти ничего не делают, поэтому разница - это
+# и есть стоимость метрик. Отдельно - время рендеринга /metrics.
+# Пример: python benchmarks/bench_metrics.py --max-overhead-us 5
+
+
+def handler(call):
+    return None
+
+
+def search_places(city, category):
+    return [city, category]
+
+
+def get_weather_data(city):
+    return {'weather_code': 800}
+
+
+def update_work(handle, search, weather):
+    handle(None)
+    search("Москва", "Кафе")
+    weather("Москва")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=100000)
+    parser.add_argument('--max-overhead-us', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    registry = MetricsRegistry()
+    instrumented = (
+        registry.instrument(handler, 'handler'),
+        registry.instrument(search_places, 'call'),
+        registry.instrument(get_weather_data, 'call'),
+    )
+    plain = (handler, search_places, get_weather_data)
+
+    results = {}
+    for name, funcs in (("без метрик", plain), ("с метриками", instrumented)):
+        elapsed = min(timeit.repeat(lambda: update_work(*funcs), number=args.number, repeat=5))
+        results[name] = elapsed / args.number * 1e6
+        print(f"{name:12} {results[name]:8.2f} мкс на обновление")
+
+    overhead = results["с метриками"] - results["без метрик"]
+    print(f"накладные расходы: {overhead:.2f} мкс на обновление (3 обёрнутых вызова)")
+
+    elapsed = min(timeit.repeat(registry.render, number=100, repeat=3))
+    print(f"/metrics: {elapsed / 100 * 1e6:.0f} мкс на рендеринг")
+    return 0 if overhead <= args.max_overhead_us else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
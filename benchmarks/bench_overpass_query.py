@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import argparse
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from overpass import (
+    PLACES_LIMIT, build_legacy_overpass_query, build_overpass_query,
+    collect_places, iter_overpass_elements, parse_overpass_elements
+)
+
+# Сравнение старого запроса к Overpass (все элементы, "out center") с новым
+# (только элементы с названием, "out center qt N", потоковый разбор):
+# объём переданных данных и время до готового списка мест.
+# Пример: python benchmarks/bench_overpass_query.py --city Москва --tag amenity=cafe
+
+OVERPASS_URL = os.getenv('OVERPASS_URL', "https://overpass-api.de/api/interpreter")
+
+
+def run_legacy(session, city, tag):
+    started = time.perf_counter()
+    response = session.post(OVERPASS_URL, data=build_legacy_overpass_query(city, tag).encode('utf-8'), timeout=120)
+    response.raise_for_status()
+    places = parse_overpass_elements(response.json(), [], PLACES_LIMIT)
+    return time.perf_counter() - started, len(response.content), len(places)
+
+
+def run_limited(session, city, tag, order):
+    started = time.perf_counter()
+    query = build_overpass_query(city, tag, PLACES_LIMIT, order)
+    response = session.post(OVERPASS_URL, data=query.encode('utf-8'), timeout=120, stream=True)
+    response.raise_for_status()
+    received = 0
+
+    def chunks():
+        nonlocal received
+        for chunk in response.iter_content(chunk_size=8192):
+            received += len(chunk)
+            yield chunk
+
+    places = collect_places(iter_overpass_elements(chunks()), [], PLACES_LIMIT, order)
+    response.close()
+    return time.perf_counter() - started, received, len(places)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--city', default='Москва')
+    parser.add_argument('--tag', default='amenity=cafe')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    runs = {
+        'legacy': lambda: run_legacy(session, args.city, args.tag),
+        'limited': lambda: run_limited(session, args.city, args.tag, 'qt'),
+        'nearest': lambda: run_limited(session, args.city, args.tag, 'nearest'),
+    }
+    print(f"{'запрос':<10}{'время, с':>12}{'байт':>14}{'мест':>8}")
+    for name, run in runs.items():
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, size, count = run()
+            timings.append(elapsed)
+        print(f"{name:<10}{min(timings):>12.2f}{size:>14}{count:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeServices
+
+# Нагрузочный прогон бота на настоящих обработчиках: синтетические сценарии
+# (приветствие, подбор занятий, поиск заведений, избранное и история) или
+# записанные обновления Telegram (JSONL, по одному Update на строку)
+# проходят через bot.process_new_updates и пул ChatDispatcher. Внешние
+# сервисы - локальные заглушки (fake_services.py) с задержкой из аргументов.
+# Обновления подаются волнами: в волне не больше одного обновления на чат,
+# следующая волна - после обработки предыдущей (как пользователь, который
+# ждёт ответа), иначе шаги register_next_step_handler не успевают сработать.
+#
+# По каждому сценарию: обновлений в секунду, p50/p95/p99 задержки от
+# постановки в очередь до конца обработки, прирост RSS, запись на диск
+# (/proc/self/io) и прирост файлов данных, вызовы внешних сервисов.
+# Сравнение с базовой линией: --save-baseline base.json, затем
+# --baseline base.json --threshold 0.15 (код возврата 1 при регрессии).
+#   python benchmarks/bench_replay.py --chats 200 --telegram-latency 20 --overpass-latency 300
+
+CITIES = ('Москва', 'Казань', 'Самара', 'Томск', 'Пермь', 'Омск', 'Тула', 'Сочи')
+DEFAULT_FLOWS = ('welcome', 'activities', 'places', 'favorites')
+DISPATCH_BATCH = 100
+
+
+def text(value):
+    return lambda b, chat_id: ('message', value)
+
+
+def data(value):
+    return lambda b, chat_id: ('callback', value)
+
+
+def city(b, chat_id):
+    return 'message', CITIES[chat_id % len(CITIES)]
+
+
+# Кнопки, которые зависят от результата предыдущего шага (хэндл набора мест,
+# query_id рекомендаций), берутся из состояния бота для этого чата
+def place(template):
+    def step(b, chat_id):
+        query = b.user_data.get(chat_id, {}).get('current_query')
+        result_set = b.result_sets.get(query['id']) if query else None
+        if result_set is None or not result_set.places:
+            return None
+        first = result_set.places[0]
+        return 'callback', template.format(handle=result_set.handle, type=first['type'], id=first['id'])
+    return step
+
+
+def activity(template):
+    def step(b, chat_id):
+        current = b.user_data.get(chat_id, {}).get('current_activities')
+        if not current or not current.get('query_id'):
+            return None
+        return 'callback', template.format(query_id=current['query_id'])
+    return step
+
+
+FLOWS = {
+    'welcome': [text('/start')],
+    'activities': [
+        text('🎯 Найти занятия'), city, data('mood_активное'), data('budget_средний'), data('people_пара')
+    ],
+    'places': [
+        text('🏢 Найти заведения'), city, data('category_Кафе'),
+        place('place_{handle}_{type}_{id}'), place('back_to_places_{handle}_0'), place('page_{handle}_1')
+    ],
+    'favorites': [
+        activity('fav_{query_id}_0'), place('favplace_{handle}_{type}_{id}'), text('⭐ Избранное'), text('/history')
+    ],
+}
+
+
+def make_update(update_id, chat_id, kind, value):
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'}
+    chat = {'id': chat_id, 'type': 'private'}
+    if kind == 'message':
+        return {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': value
+        }}
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'chat_instance': str(chat_id), 'from': user, 'data': value,
+        'message': {'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': '…'}
+    }}
+
+
+def update_chat_id(update):
+    for key in ('message', 'edited_message', 'callback_query'):
+        if key in update:
+            body = update[key]
+            chat = (body.get('message') or {}).get('chat') if key == 'callback_query' else body.get('chat')
+            return (chat or {}).get('id', body.get('from', {}).get('id'))
+    return None
+
+
+# Записанные обновления -> волны: n-е обновление чата попадает в n-ю волну
+def recorded_waves(path):
+    waves = []
+    seen = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            update = json.loads(line)
+            chat_id = update_chat_id(update)
+            n = seen.get(chat_id, 0)
+            seen[chat_id] = n + 1
+            if n == len(waves):
+                waves.append([])
+            waves[n].append(update)
+    return waves
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def io_counters():
+    try:
+        with open('/proc/self/io') as f:
+            return {k: int(v) for k, v in (line.split(':') for line in f)}
+    except OSError:
+        return {}
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class Harness:
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.services = FakeServices(
+            telegram_latency=args.telegram_latency / 1000,
+            owm_latency=args.owm_latency / 1000,
+            overpass_latency=args.overpass_latency / 1000
+        )
+        self.update_id = 0
+        self.bot = None
+
+    # Бот импортируется после подготовки окружения: конфигурация читается
+    # при импорте, файлы данных создаются в текущем каталоге
+    def start(self):
+        base = self.services.start()
+        os.chdir(self.workdir)
+        os.environ.update({
+            'TELEGRAM_BOT_TOKEN': '123456:BENCH', 'OPENWEATHERMAP_API_KEY': 'bench',
+            'PREWARM_ENABLED': '0', 'LOG_LEVEL': self.args.log_level,
+            'BOT_WORKERS': str(self.args.workers),
+        })
+        if not self.args.telegram_limits:
+            os.environ.update({'TG_GLOBAL_RATE': '1000000', 'TG_CHAT_RATE': '1000000', 'TG_CHAT_BURST': '1000000'})
+
+        from telebot import apihelper
+        from dispatcher import ChatDispatcher
+        import botbotbotbot as b
+
+        class TimedDispatcher(ChatDispatcher):
+            latencies = []
+
+            def put(self, func, *args, **kwargs):
+                queued = time.perf_counter()
+                latencies = self.latencies
+
+                def timed(*a, **kw):
+                    try:
+                        return func(*a, **kw)
+                    finally:
+                        latencies.append(time.perf_counter() - queued)
+
+                return super().put(timed, *args, **kwargs)
+
+        apihelper.API_URL = base + '/bot{0}/{1}'
+        b.OWM_URL = base + '/owm'
+        b.OVERPASS_URL = base + '/overpass'
+        b.create_app()
+        b.bot.worker_pool.close()
+        b.bot.worker_pool = TimedDispatcher(b.bot, num_threads=b.BOT_WORKERS, max_pending=b.BOT_MAX_PENDING)
+        self.bot = b
+
+    def stop(self):
+        b = self.bot
+        b.bot.worker_pool.close()
+        b.send_queue.close()
+        b.flush_stores()
+        self.services.stop()
+
+    def run_waves(self, waves):
+        from telebot import types
+        b = self.bot
+        pool = b.bot.worker_pool
+        pool.latencies = latencies = []
+        elapsed = 0.0
+        count = 0
+        for wave in waves:
+            updates = [types.Update.de_json(update) for update in wave(b)]
+            started = time.perf_counter()
+            for i in range(0, len(updates), DISPATCH_BATCH):
+                b.bot.process_new_updates(updates[i:i + DISPATCH_BATCH])
+            pool.join()
+            elapsed += time.perf_counter() - started
+            count += len(updates)
+        return count, elapsed, latencies
+
+    def synthetic_waves(self, steps, chats):
+        def wave_for(step):
+            def build(b):
+                updates = []
+                for chat_id in chats:
+                    spec = step(b, chat_id)
+                    if spec is not None:
+                        self.update_id += 1
+                        updates.append(make_update(self.update_id, chat_id, *spec))
+                return updates
+            return build
+        return [wave_for(step) for step in steps]
+
+    def measure(self, name, waves):
+        rss_before = rss_bytes()
+        io_before = io_counters()
+        data_before = dir_size(self.workdir)
+        calls_before = self.services.snapshot()
+
+        count, elapsed, latencies = self.run_waves(waves)
+
+        io_after = io_counters()
+        calls = {k: v - calls_before.get(k, 0) for k, v in self.services.snapshot().items()}
+        telegram = sum(v for k, v in calls.items() if k not in ('owm', 'overpass'))
+        return {
+            'flow': name,
+            'updates': count,
+            'seconds': round(elapsed, 4),
+            'updates_per_sec': round(count / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'rss_delta_mb': round((rss_bytes() - rss_before) / 2 ** 20, 2),
+            'write_kb': round((io_after.get('write_bytes', 0) - io_before.get('write_bytes', 0)) / 1024, 1),
+            'data_delta_kb': round((dir_size(self.workdir) - data_before) / 1024, 1),
+            'telegram_calls': telegram,
+            'owm_calls': calls.get('owm', 0),
+            'overpass_calls': calls.get('overpass', 0),
+        }
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    failures = []
+    base = {r['flow']: r for r in baseline}
+    for result in results:
+        old = base.get(result['flow'])
+        if old is None:
+            continue
+        if result['updates_per_sec'] < old['updates_per_sec'] * (1 - threshold):
+            failures.append(f"{result['flow']}: {result['updates_per_sec']} обн/с < {old['updates_per_sec']}")
+        if result['p95_ms'] > old['p95_ms'] * (1 + threshold) and result['p95_ms'] - old['p95_ms'] > min_delta_ms:
+            failures.append(f"{result['flow']}: p95 {result['p95_ms']} мс > {old['p95_ms']} мс")
+    return failures
+
+
+def print_table(results):
+    columns = (('flow', 'сценарий', 12), ('updates', 'обн.', 7), ('updates_per_sec', 'обн/с', 9),
+               ('p50_ms', 'p50 мс', 9), ('p95_ms', 'p95 мс', 9), ('p99_ms', 'p99 мс', 9),
+               ('rss_delta_mb', 'RSS Δ МБ', 10), ('write_kb', 'запись КБ', 11), ('data_delta_kb', 'данные КБ', 11),
+               ('telegram_calls', 'tg', 6), ('owm_calls', 'owm', 5), ('overpass_calls', 'ovp', 5))
+    print(''.join(f"{title:>{width}}" if key != 'flow' else f"{title:<{width}}" for key, title, width in columns))
+    for result in results:
+        print(''.join(f"{result[key]:>{width}}" if key != 'flow' else f"{result[key]:<{width}}"
+                      for key, _, width in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота на локальных заглушках")
+    parser.add_argument('--flows', default=','.join(DEFAULT_FLOWS), help="сценарии через запятую: " + ', '.join(FLOWS))
+    parser.add_argument('--updates', help="записанные обновления (JSONL) вместо синтетических сценариев")
+    parser.add_argument('--chats', type=int, default=100, help="пользователей в синтетических сценариях")
+    parser.add_argument('--workers', type=int, default=8, help="BOT_WORKERS")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="задержка Bot API, мс")
+    parser.add_argument('--owm-latency', type=float, default=0.0, help="задержка OpenWeatherMap, мс")
+    parser.add_argument('--overpass-latency', type=float, default=0.0, help="задержка Overpass, мс")
+    parser.add_argument('--telegram-limits', action='store_true', help="оставить лимиты отправки Telegram")
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--workdir', help="каталог для файлов бота (по умолчанию временный)")
+    parser.add_argument('--json', help="записать результаты в файл")
+    parser.add_argument('--save-baseline', help="сохранить результаты как базовую линию")
+    parser.add_argument('--baseline', help="сравнить с базовой линией")
+    parser.add_argument('--threshold', type=float, default=0.15, help="допустимое ухудшение (доля)")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="игнорировать рост p95 меньше этого")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench-replay-')
+    cwd = os.getcwd()
+    harness = Harness(args, workdir)
+    harness.start()
+    results = []
+    try:
+        if args.updates:
+            waves = [lambda b, wave=wave: wave for wave in recorded_waves(os.path.join(cwd, args.updates))]
+            results.append(harness.measure('recorded', waves))
+        else:
+            chats = range(1, args.chats + 1)
+            for name in args.flows.split(','):
+                results.append(harness.measure(name, harness.synthetic_waves(FLOWS[name], chats)))
+    finally:
+        harness.stop()
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            failures = compare(results, json.load(f), args.threshold, args.min_delta_ms)
+        if failures:
+            print("Регрессия относительно базовой линии:")
+            for failure in failures:
+                print(" -", failure)
+            return 1
+        print(f"Без регрессий относительно {args.baseline} (порог {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeServices
+from bench_replay import make_update
+
+# Время запуска бота, каждый замер - в новом процессе интерпретатора:
+# - import: импорт botbotbotbot без токенов в пустом каталоге (время,
+#   потоки, созданные файлы, загружен ли aiohttp);
+# - first response: от запуска процесса (python botbotbotbot.py, режим
+#   polling на заглушках fake_services.py) до первого sendMessage в ответ
+#   на обновление, ожидающее в getUpdates.
+# --repo - другая копия репозитория (например, git worktree старой версии)
+# для сравнения.
+#   python benchmarks/bench_startup.py --runs 10
+#   python benchmarks/bench_startup.py --repo /tmp/bot-old --no-preload
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREDENTIALS = ('TELEGRAM_BOT_TOKEN', 'OPENWEATHERMAP_API_KEY')
+FIRST_RESPONSE_TIMEOUT = 60
+STOP_TIMEOUT = 15
+
+IMPORT_CODE = """
+import sys, json, time, threading
+sys.path.insert(0, {repo!r})
+started = time.perf_counter()
+try:
+    import botbotbotbot
+    error = None
+except Exception as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+print(json.dumps({{
+    'ms': (time.perf_counter() - started) * 1000, 'error': error,
+    'threads': threading.active_count(), 'aiohttp': 'aiohttp' in sys.modules
+}}))
+"""
+
+RUN_CODE = """
+import os, sys
+sys.path.insert(0, {repo!r})
+from telebot import apihelper
+base = os.environ['BENCH_FAKE_BASE']
+apihelper.API_URL = base + '/bot{{0}}/{{1}}'
+import botbotbotbot as b
+b.OWM_URL = base + '/owm'
+b.OVERPASS_URL = base + '/overpass'
+b.main(['--mode', 'polling'])
+"""
+
+
+def clean_env(**extra):
+    env = {name: value for name, value in os.environ.items() if name not in CREDENTIALS}
+    env.update(extra)
+    return env
+
+
+def measure_import(repo):
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_CODE.format(repo=repo)],
+            cwd=workdir, env=clean_env(), capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['files'] = sorted(os.listdir(workdir))
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def stop_bot(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def measure_first_response(repo, services, update_id, text, preload):
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = clean_env(
+        TELEGRAM_BOT_TOKEN='123456:BENCH', OPENWEATHERMAP_API_KEY='bench',
+        BENCH_FAKE_BASE=services.base_url, PREWARM_ENABLED='0', LOG_LEVEL='WARNING',
+        PRELOAD_ENABLED='1' if preload else '0'
+    )
+    sent = services.snapshot().get('sendMessage', 0)
+    services.push_update(make_update(update_id, update_id, 'message', text))
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', RUN_CODE.format(repo=repo)], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        deadline = started + FIRST_RESPONSE_TIMEOUT
+        while services.snapshot().get('sendMessage', 0) <= sent:
+            if process.poll() is not None:
+                raise RuntimeError("бот завершился до ответа: " + process.stderr.read().decode('utf-8', 'replace'))
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"нет ответа за {FIRST_RESPONSE_TIMEOUT} с")
+            time.sleep(0.001)
+        return (time.perf_counter() - started) * 1000
+    finally:
+        stop_bot(process)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def summary(values):
+    return {'p50': round(statistics.median(values), 1), 'min': round(min(values), 1), 'max': round(max(values), 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Время импорта и холодного старта бота")
+    parser.add_argument('--repo', default=REPO, help="каталог с botbotbotbot.py")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--text', default="🎯 Найти занятия", help="первое сообщение боту")
+    parser.add_argument('--no-preload', action='store_true', help="PRELOAD_ENABLED=0")
+    parser.add_argument('--json', help="записать результаты в файл")
+    args = parser.parse_args(argv)
+    repo = os.path.abspath(args.repo)
+
+    imports = [measure_import(repo) for _ in range(args.runs)]
+    first = imports[0]
+    results = {'import': summary([r['ms'] for r in imports]), 'import_error': first['error'],
+               'import_threads': first['threads'], 'import_files': first['files'],
+               'import_aiohttp': first['aiohttp']}
+    if first['error']:
+        print(f"импорт без токенов: ошибка {first['error']}")
+    else:
+        print(f"импорт без токенов: p50 {results['import']['p50']} мс, потоков {first['threads']}, "
+              f"файлов создано {len(first['files'])}, aiohttp {'загружен' if first['aiohttp'] else 'нет'}")
+
+    services = FakeServices()
+    services.start()
+    try:
+        latencies = [measure_first_response(repo, services, run + 1, args.text, not args.no_preload)
+                     for run in range(args.runs)]
+    finally:
+        services.stop()
+    results['first_response'] = summary(latencies)
+    print(f"запуск до первого ответа: p50 {results['first_response']['p50']} мс "
+          f"(мин {results['first_response']['min']}, макс {results['first_response']['max']})")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
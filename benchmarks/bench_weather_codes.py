@@ -0,0 +1,56 @@
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from weather import WeatherCodes
+
+# Сравнение старой цепочки if/elif (проверки "in [...]" по спискам)
+# с таблицей WeatherCodes на всех кодах OWM. Совпадение категорий со
+# старой функцией проверяет tests/test_weather.py.
+# Пример: python benchmarks/bench_weather_codes.py --number 200
+
+
+def legacy_weather_description(weather_code):
+    if weather_code == 800:
+        return "ясно"
+    elif weather_code in [801, 802]:
+        return "облачно"
+    elif weather_code in [803, 804]:
+        return "пасмурно"
+    elif weather_code in [300, 301, 302, 310, 311, 312, 313, 314, 321, 500, 501, 502, 503, 504, 511, 520, 521, 522, 531]:
+        return "дождь"
+    elif weather_code in [600, 601, 602, 611, 612, 613, 615, 616, 620, 621, 622]:
+        return "снег"
+    else:
+        return "разнообразно"
+
+
+# Коды, которые реально присылает OWM
+OWM_CODES = (
+    list(range(200, 203)) + list(range(210, 213)) + [221] + list(range(230, 233))
+    + list(range(300, 303)) + list(range(310, 315)) + [321]
+    + list(range(500, 505)) + [511] + list(range(520, 523)) + [531]
+    + list(range(600, 603)) + [611, 612, 613, 615, 616, 620, 621, 622]
+    + [701, 711, 721, 731, 741, 751, 761, 762, 771, 781]
+    + list(range(800, 805))
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=200, help="проходов по всем кодам OWM")
+    args = parser.parse_args(argv)
+
+    describe = WeatherCodes().describe
+    calls = args.number * len(OWM_CODES)
+    for name, func in (("if/elif", legacy_weather_description), ("таблица", describe)):
+        elapsed = min(timeit.repeat(lambda: [func(code) for code in OWM_CODES], number=args.number, repeat=5))
+        print(f"{name:10} {elapsed / calls * 1e9:8.1f} нс/вызов")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
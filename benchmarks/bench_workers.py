@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeServices, FakeRedis
+from bench_replay import FLOWS, make_update
+from workers import WorkerPool
+
+# Масштабирование по процессам: те же сценарии, что в bench_replay.py
+# (без шагов, зависящих от состояния бота), подаются волнами в WorkerPool
+# с 1, 2, ... процессами-обработчиками - как в режиме webhook с
+# --processes N. Состояние - общее хранилище (SQLite по умолчанию или
+# --redis: локальная заглушка FakeRedis либо --redis-url). Заглушки
+# внешних сервисов работают в отдельном процессе, чтобы не делить GIL
+# с маршрутизатором.
+#   python benchmarks/bench_workers.py --processes 1,2,4 --chats 400
+
+DEFAULT_FLOWS = ('welcome', 'activities')
+
+
+def serve_fake_services(ready, stop, telegram_latency, owm_latency, overpass_latency):
+    services = FakeServices(telegram_latency, owm_latency, overpass_latency)
+    ready.put(services.start())
+    stop.wait()
+    services.stop()
+
+
+# Процесс-обработчик: бот с адресами заглушек, после каждого
+# обработанного обновления увеличивает done[index]
+def bench_worker(index, updates, done):
+    from telebot import apihelper
+    import botbotbotbot as b
+
+    base = os.environ['BENCH_FAKE_BASE']
+    apihelper.API_URL = base + '/bot{0}/{1}'
+    b.OWM_URL = base + '/owm'
+    b.OVERPASS_URL = base + '/overpass'
+    b.create_app()
+
+    put = b.bot.worker_pool.put
+
+    def counted_put(func, *args, **kwargs):
+        def counted(*a, **kw):
+            try:
+                return func(*a, **kw)
+            finally:
+                done[index] += 1
+        return put(counted, *args, **kwargs)
+
+    b.bot.worker_pool.put = counted_put
+    b.run_worker(index, updates)
+
+
+def wait_done(done, expected, timeout):
+    deadline = time.monotonic() + timeout
+    while sum(done) < expected:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"обработано {sum(done)} из {expected} обновлений за {timeout} с")
+        time.sleep(0.002)
+
+
+def run(processes, args, flows):
+    context = multiprocessing.get_context('spawn')
+    done = context.RawArray('q', processes)
+    pool = WorkerPool(bench_worker, processes, args=(done,))
+    pool.start()
+    update_id = 0
+    try:
+        # Первое обновление каждому процессу - прогрев (импорт бота)
+        warmup = [make_update(i + 1, i, 'message', '/start') for i in range(processes)]
+        for update in warmup:
+            pool.route(json.dumps(update).encode('utf-8'))
+        wait_done(done, processes, args.timeout)
+
+        chats = range(processes + 1, processes + 1 + args.chats)
+        expected = sum(done)
+        started = time.perf_counter()
+        for name in flows:
+            for step in FLOWS[name]:
+                for chat_id in chats:
+                    update_id += 1
+                    update = make_update(update_id, chat_id, *step(None, chat_id))
+                    pool.route(json.dumps(update, ensure_ascii=False).encode('utf-8'))
+                expected += len(chats)
+                wait_done(done, expected, args.timeout)
+        elapsed = time.perf_counter() - started
+        count = expected - processes
+    finally:
+        pool.stop()
+    return {
+        'processes': processes,
+        'updates': count,
+        'seconds': round(elapsed, 3),
+        'updates_per_sec': round(count / elapsed, 1),
+        'per_process': [done[i] for i in range(processes)],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Масштабирование бота по процессам на локальных заглушках")
+    parser.add_argument('--processes', default='1,2,4', help="числа процессов через запятую")
+    parser.add_argument('--flows', default=','.join(DEFAULT_FLOWS))
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="задержка Bot API, мс")
+    parser.add_argument('--owm-latency', type=float, default=0.0, help="задержка OpenWeatherMap, мс")
+    parser.add_argument('--overpass-latency', type=float, default=0.0, help="задержка Overpass, мс")
+    parser.add_argument('--redis', action='store_true', help="общее состояние в FakeRedis вместо SQLite")
+    parser.add_argument('--redis-url', help="общее состояние в настоящем Redis")
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--json', help="записать результаты в файл")
+    args = parser.parse_args(argv)
+    flows = args.flows.split(',')
+
+    context = multiprocessing.get_context('spawn')
+    ready, stop = context.Queue(), context.Event()
+    services = context.Process(target=serve_fake_services, args=(
+        ready, stop, args.telegram_latency / 1000, args.owm_latency / 1000, args.overpass_latency / 1000
+    ), daemon=True)
+    services.start()
+    base = ready.get()
+
+    redis = None
+    if args.redis and not args.redis_url:
+        redis = FakeRedis()
+        args.redis_url = redis.start()
+
+    cwd = os.getcwd()
+    results = []
+    try:
+        for processes in (int(n) for n in args.processes.split(',')):
+            workdir = tempfile.mkdtemp(prefix='bench-workers-')
+            os.chdir(workdir)
+            os.environ.update({
+                'TELEGRAM_BOT_TOKEN': '123456:BENCH', 'OPENWEATHERMAP_API_KEY': 'bench',
+                'BENCH_FAKE_BASE': base, 'PREWARM_ENABLED': '0', 'LOG_LEVEL': 'WARNING',
+                'STATE_BACKEND': args.redis_url or os.path.join(workdir, 'state.db'),
+                'TG_GLOBAL_RATE': '1000000', 'TG_CHAT_RATE': '1000000', 'TG_CHAT_BURST': '1000000',
+            })
+            try:
+                results.append(run(processes, args, flows))
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(workdir, ignore_errors=True)
+            result = results[-1]
+            print(f"процессов {processes:>2}: {result['updates']} обн. за {result['seconds']} с, "
+                  f"{result['updates_per_sec']} обн/с, по процессам {result['per_process']}")
+    finally:
+        stop.set()
+        services.join(5)
+        if redis is not None:
+            redis.stop()
+
+    if len(results) > 1:
+        base_rate = results[0]['updates_per_sec']
+        for result in results[1:]:
+            print(f"x{result['processes']}: ускорение {result['updates_per_sec'] / base_rate:.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
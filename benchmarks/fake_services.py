@@ -0,0 +1,330 @@
+import json
+import time
+import socket
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Локальные заглушки внешних сервисов для нагрузочных тестов:
+# Bot API (отвечает как Telegram и считает вызовы по методам),
+# OpenWeatherMap (/owm) и Overpass (/overpass) с настраиваемой задержкой.
+# Все на одном порту 127.0.0.1, без обращений в сеть.
+#   services = FakeServices(telegram_latency=0.02, overpass_latency=0.3)
+#   base = services.start()  # http://127.0.0.1:PORT
+# Для режима polling обновления кладутся в очередь push_update(), getUpdates
+# отдаёт их с учётом offset (ожидание - не дольше UPDATES_WAIT).
+# flood(count, retry_after) - следующие count вызовов Bot API, кроме
+# getUpdates/getMe, получают 429 с parameters.retry_after, как от Telegram.
+# FakeRedis - сервер с подмножеством протокола Redis (RESP) для
+# RedisBackend (state_backend.py): GET/SET (NX, PX)/DEL, RPUSH/LTRIM/LRANGE.
+# Обрывы: close_clients() закрывает открытые соединения (как сервер после
+# простоя), drop_replies(n) - n команд выполняются, но соединение рвётся
+# вместо ответа.
+#   redis_url = FakeRedis().start()  # redis://127.0.0.1:PORT/0
+
+FAKE_PLACES = 40
+UNKNOWN_CITY = 'Nowhere'
+UPDATES_WAIT = 1.0
+
+
+class FakeServices:
+    def __init__(self, telegram_latency=0.0, owm_latency=0.0, overpass_latency=0.0, places=FAKE_PLACES):
+        self.telegram_latency = telegram_latency
+        self.owm_latency = owm_latency
+        self.overpass_latency = overpass_latency
+        self.places = places
+        self.calls = {}
+        self.updates = []
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._message_id = 0
+        self._floods = 0
+        self._retry_after = 1
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self._message_id += 1
+            return self._message_id
+
+    def flood(self, count, retry_after=1):
+        with self._lock:
+            self._floods = count
+            self._retry_after = retry_after
+
+    def take_flood(self):
+        with self._lock:
+            if not self._floods:
+                return None
+            self._floods -= 1
+            self.calls['429'] = self.calls.get('429', 0) + 1
+            return self._retry_after
+
+    def push_update(self, update):
+        with self._updates_ready:
+            self.updates.append(update)
+            self._updates_ready.notify_all()
+
+    # Обновления с update_id >= offset; подтверждённые (меньше offset) удаляются
+    def take_updates(self, offset, timeout):
+        with self._updates_ready:
+            self._updates_ready.wait_for(lambda: any(u['update_id'] >= offset for u in self.updates), timeout)
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+            return list(self.updates)
+
+    def overpass_elements(self, query):
+        # Запрос границ города (area_resolver)
+        if '"boundary"="administrative"' in query:
+            return [{'type': 'relation', 'id': 2555133,
+                     'tags': {'name': 'Город', 'place': 'city', 'admin_level': '4'},
+                     'bounds': {'minlat': 55.49, 'minlon': 37.32, 'maxlat': 56.01, 'maxlon': 37.95}}]
+        return [
+            {'type': 'node', 'id': 1000 + i, 'lat': 55.75 + i * 0.001, 'lon': 37.61 + i * 0.001,
+             'tags': {'name': f'Место {i}', 'addr:street': 'Тверская', 'addr:housenumber': str(i + 1)}}
+            for i in range(self.places)
+        ]
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело уходят отдельными send(): без этого keep-alive
+            # упирается в Nagle + delayed ACK (~40 мс на ответ)
+            disable_nagle_algorithm = True
+
+            def _reply(self, payload, code=200):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _params(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode('utf-8', 'replace') if length else ''
+                return url.path, params, body
+
+            def do_GET(self):
+                self.do_POST()
+
+            def do_POST(self):
+                path, params, body = self._params()
+                if path.startswith('/owm'):
+                    services.count('owm')
+                    time.sleep(services.owm_latency)
+                    if params.get('q') == UNKNOWN_CITY:
+                        return self._reply({'cod': '404', 'message': 'city not found'}, 404)
+                    return self._reply({
+                        'cod': 200, 'main': {'temp': 18.5, 'humidity': 60},
+                        'weather': [{'id': 800, 'description': 'ясно'}], 'wind': {'speed': 3.0}
+                    })
+                if path.startswith('/overpass'):
+                    services.count('overpass')
+                    time.sleep(services.overpass_latency)
+                    query = parse_qs(body).get('data', [body])[0]
+                    return self._reply({'elements': services.overpass_elements(query)})
+
+                method = path.rsplit('/', 1)[-1]
+                params.update({k: v[0] for k, v in parse_qs(body).items()})
+                message_id = services.count(method)
+                time.sleep(services.telegram_latency)
+                if method == 'getUpdates':
+                    timeout = min(float(params.get('timeout') or 0), UPDATES_WAIT)
+                    updates = services.take_updates(int(params.get('offset') or 0), timeout)
+                    return self._reply({'ok': True, 'result': updates})
+                if method == 'getMe':
+                    return self._reply({'ok': True, 'result': {
+                        'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'
+                    }})
+                retry_after = services.take_flood()
+                if retry_after is not None:
+                    return self._reply({
+                        'ok': False, 'error_code': 429,
+                        'description': f'Too Many Requests: retry after {retry_after}',
+                        'parameters': {'retry_after': retry_after}
+                    }, 429)
+                if method in ('answerCallbackQuery', 'deleteWebhook', 'setWebhook'):
+                    return self._reply({'ok': True, 'result': True})
+                chat_id = int(params.get('chat_id', 0) or 0)
+                return self._reply({'ok': True, 'result': {
+                    'message_id': message_id, 'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')
+                }})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fake-services", daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.calls)
+
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.commands = 0
+        self.clients = set()
+        self._drops = 0
+        self._lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.server.server_address[1]}/0"
+
+    def close_clients(self):
+        with self._lock:
+            clients, self.clients = list(self.clients), set()
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def drop_replies(self, count):
+        with self._lock:
+            self._drops = count
+
+    def take_drop(self):
+        with self._lock:
+            if not self._drops:
+                return False
+            self._drops -= 1
+            return True
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    @staticmethod
+    def _slice(items, start, stop):
+        n = len(items)
+        start = max(0, start + n if start < 0 else start)
+        stop = stop + n if stop < 0 else stop
+        return items[start:stop + 1]
+
+    def execute(self, name, args):
+        with self._lock:
+            self.commands += 1
+            if name in ('PING', 'AUTH', 'SELECT', 'FLUSHDB'):
+                if name == 'FLUSHDB':
+                    self.data.clear()
+                    self.expires.clear()
+                return 'PONG' if name == 'PING' else 'OK'
+            if name == 'GET':
+                return self.data[args[0]] if self._alive(args[0]) else None
+            if name == 'SET':
+                key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+                if 'NX' in options and self._alive(key):
+                    return None
+                self.data[key] = value
+                self.expires.pop(key, None)
+                if 'PX' in options:
+                    self.expires[key] = time.monotonic() + int(args[2 + options.index('PX') + 1]) / 1000
+                return 'OK'
+            if name == 'DEL':
+                removed = 0
+                for key in args:
+                    if self._alive(key):
+                        del self.data[key]
+                        self.expires.pop(key, None)
+                        removed += 1
+                return removed
+            if name == 'RPUSH':
+                items = self.data.setdefault(args[0], [])
+                items.extend(args[1:])
+                return len(items)
+            if name == 'LTRIM':
+                items = self.data.get(args[0], [])
+                self.data[args[0]] = self._slice(items, int(args[1]), int(args[2]))
+                return 'OK'
+            if name == 'LRANGE':
+                return self._slice(self.data.get(args[0], []), int(args[1]), int(args[2]))
+            return ValueError(f"ERR unknown command '{name}'")
+
+    @staticmethod
+    def encode(reply):
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, ValueError):
+            return b'-' + str(reply).encode('utf-8') + b'\r\n'
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, list):
+            return b'*%d\r\n' % len(reply) + b''.join(FakeRedis.encode(item) for item in reply)
+        if reply in ('OK', 'PONG'):
+            return b'+' + reply.encode('utf-8') + b'\r\n'
+        data = reply.encode('utf-8')
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+    def _handler_class(self):
+        redis = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            # Ответы на конвейер команд уходят отдельными send()
+            disable_nagle_algorithm = True
+
+            def read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2].decode('utf-8'))
+                return args
+
+            def handle(self):
+                with redis._lock:
+                    redis.clients.add(self.connection)
+                try:
+                    while True:
+                        command = self.read_command()
+                        if command is None:
+                            return
+                        reply = redis.execute(command[0].upper(), command[1:])
+                        if redis.take_drop():
+                            return
+                        self.wfile.write(redis.encode(reply))
+                except (OSError, ValueError):
+                    return
+                finally:
+                    with redis._lock:
+                        redis.clients.discard(self.connection)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-redis", daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,146 +1,307 @@
 import os
 import json
-import requests
 import telebot
-from telebot import types
+from telebot import apihelper, util
 from datetime import datetime
 from dotenv import load_dotenv
 import time
 import uuid
 import logging
-
-# Настройка логирования
-logging.basicConfig(
-    filename='bot.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    encoding='utf-8'
+import atexit
+import argparse
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from history_store import HistoryStore
+from favorites_store import FavoritesStore
+from cache import TTLCache
+from http_client import HttpClient
+from dispatcher import ChatDispatcher
+from webhook_server import WebhookServer
+from session_store import SessionStore
+from state_backend import SQLiteBackend, open_state_backend
+from history_store import SharedHistoryStore
+from favorites_store import SharedFavoritesStore
+from workers import WorkerPool, serve_updates
+from webhook_server import process_update
+from log_setup import setup_logging, Payload, sampled
+from overpass import (
+    CATEGORY_MAPPING, PLACES_LIMIT, build_overpass_query, collect_places, iter_overpass_elements,
+    merge_places
 )
-
-# Загрузка переменных окружения
+from poi_index import PoiIndexHandle
+from prewarm import DemandTracker, Prewarmer
+from activities_index import ActivityCatalog
+from recommendations import RecommendationEngine
+from weather import WeatherCodes, parse_weather_response
+from keyboards import (
+    ICONS, create_main_keyboard, create_categories_keyboard, create_places_keyboard,
+    create_place_details_keyboard, create_inline_keyboard, create_recommendations_keyboard
+)
+from area_resolver import AreaResolver, build_area_query, normalize_city, pick_area
+from send_queue import RateLimits, SendQueue
+from result_sets import ResultSetStore
+from metrics import MetricsRegistry, MetricsServer, SnapshotWriter
+from lazy import Lazy
+
+# Загрузка переменных окружения. Остальная инициализация отложена:
+# импорт модуля не создаёт файлов, потоков и соединений и не требует
+# токенов. Запуск - create_app() (синхронный бот) или configure() (общая
+# часть для async_bot.py); хранилища и индексы открываются при первом
+# обращении (lazy.py) или фоновой предзагрузкой
 load_dotenv()
 
-# Проверка переменных окружения
+# Номер процесса-обработчика и число процессов (webhook с --processes N,
+# см. workers.py); в обычном режиме - единственный процесс 0
+BOT_WORKER_INDEX = int(os.getenv('BOT_WORKER_INDEX', 0))
+BOT_WORKER_COUNT = int(os.getenv('BOT_WORKER_COUNT', 1))
+
+# Настройка логирования: уровень из LOG_LEVEL, запись в файл через очередь;
+# у каждого процесса-обработчика свой файл (bot.worker0.log, ...)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_PAYLOAD_SAMPLE = float(os.getenv('LOG_PAYLOAD_SAMPLE', 1.0))
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+if BOT_WORKER_COUNT > 1:
+    LOG_FILE = "{0}.worker{2}{1}".format(*os.path.splitext(LOG_FILE), BOT_WORKER_INDEX)
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+
+# Переменные окружения проверяются при запуске (validate_config)
 bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
 owm_api_key = os.getenv('OPENWEATHERMAP_API_KEY')
-logging.debug(f"TELEGRAM_BOT_TOKEN: {bot_token}")
-logging.debug(f"OPENWEATHERMAP_API_KEY: {owm_api_key}")
 
-if not bot_token or not owm_api_key:
-    logging.error("Отсутствует TELEGRAM_BOT_TOKEN или OPENWEATHERMAP_API_KEY в переменных окружения")
-    raise ValueError("Отсутствует TELEGRAM_BOT_TOKEN или OPENWEATHERMAP_API_KEY в переменных окружения")
-
-# Инициализация бота
-try:
-    bot = telebot.TeleBot(bot_token)
-    logging.info("Бот успешно инициализирован")
-except Exception as e:
-    logging.error(f"Ошибка при инициализации бота: {str(e)}")
-    raise
+def validate_config():
+    if not bot_token or not owm_api_key:
+        logging.error("Отсутствует TELEGRAM_BOT_TOKEN или OPENWEATHERMAP_API_KEY в переменных окружения")
+        raise ValueError("Отсутствует TELEGRAM_BOT_TOKEN или OPENWEATHERMAP_API_KEY в переменных окружения")
+    try:
+        util.validate_token(bot_token)
+    except ValueError as e:
+        logging.error("Некорректный TELEGRAM_BOT_TOKEN: %s", e)
+        raise
+
+# Параллельная обработка обновлений: разные чаты - одновременно,
+# обновления одного чата - строго по порядку
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 8))
+BOT_MAX_PENDING = int(os.getenv('BOT_MAX_PENDING', 1000))
+
+# В telebot сообщение, ушедшее в next_step handler, удаляется из пачки
+# через pop(i) прямо во время перебора, и следующее сообщение пачки
+# (другой чат, тоже ожидающий ввода) свой handler не получает.
+# Переопределяется приватный метод: проверено на pyTelegramBotAPI 4.37.0,
+# при обновлении telebot сверить с TeleBot._notify_next_handlers
+class NextStepTeleBot(telebot.TeleBot):
+    def _notify_next_handlers(self, new_messages):
+        remaining = []
+        for message in new_messages:
+            handlers = self.next_step_backend.get_handlers(message.chat.id)
+            if not handlers:
+                remaining.append(message)
+                continue
+            for handler in handlers:
+                self._exec_task(handler["callback"], message, *handler["args"], **handler["kwargs"])
+        new_messages[:] = remaining
+
+
+# Бот создаётся без пула потоков и без проверки токена - только для
+# регистрации обработчиков; ChatDispatcher подключает create_app()
+bot = NextStepTeleBot(bot_token or '', threaded=False, validate_token=False)
+
+# Исходящие запросы к Telegram: общий лимит и лимит на чат, повтор после 429,
+# answerCallbackQuery вне очереди, повторные правки сообщения схлопываются.
+# Общий лимит делится между процессами-обработчиками, лимит чата остаётся
+# целиком: чат всегда обрабатывает один процесс
+send_limits = RateLimits(
+    global_rate=float(os.getenv('TG_GLOBAL_RATE', 30)) / BOT_WORKER_COUNT,
+    chat_rate=float(os.getenv('TG_CHAT_RATE', 1)),
+    chat_burst=int(os.getenv('TG_CHAT_BURST', 3)),
+    group_rate=float(os.getenv('TG_GROUP_RATE', 20 / 60))
+)
+TG_SEND_WORKERS = int(os.getenv('TG_SEND_WORKERS', 4))
+TG_MAX_RETRIES = int(os.getenv('TG_MAX_RETRIES', 5))
+# Очередь отправки со своими потоками создаёт create_app()
+send_queue = None
+
+# Метрики (metrics.py): время обработчиков и внешних вызовов, исходы,
+# состояние кэшей. METRICS_PORT - локальный /metrics, METRICS_SNAPSHOT_FILE -
+# периодический JSON-снимок. Процессы-обработчики слушают METRICS_PORT + 1 + номер,
+# снимок пишут в METRICS_SNAPSHOT_FILE с номером процесса
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_SNAPSHOT_FILE = os.getenv('METRICS_SNAPSHOT_FILE')
+if BOT_WORKER_COUNT > 1:
+    METRICS_PORT = METRICS_PORT and METRICS_PORT + 1 + BOT_WORKER_INDEX
+    METRICS_SNAPSHOT_FILE = METRICS_SNAPSHOT_FILE and f"{METRICS_SNAPSHOT_FILE}.{BOT_WORKER_INDEX}"
+METRICS_SNAPSHOT_INTERVAL = int(os.getenv('METRICS_SNAPSHOT_INTERVAL', 60))
+metrics = MetricsRegistry()
 
 OWM_API_KEY = owm_api_key
 
-# Списки иконок
-ICONS = {
-    'weather': {
-        'ясно': '☀️',
-        'облачно': '⛅️',
-        'пасмурно': '☁️',
-        'дождь': '🌧',
-        'снег': '❄️',
-        'разнообразно': '🌈'
-    },
-    'mood': {
-        'активное': '🏃‍♂️',
-        'расслабленное': '🧘‍♀️',
-        'экстремальное': '⚡'
-    },
-    'budget': {
-        'низкий': '💰',
-        'средний': '💵',
-        'неограниченный': '💎'
-    },
-    'people': {
-        'один': '👤',
-        'пара': '👫',
-        'компания': '👪'
-    },
-    'actions': {
-        'restart': '🔄',
-        'city': '🏙️',
-        'weather': '☀️',
-        'budget': '💰',
-        'people': '👥',
-        'history': '📜',
-        'favorites': '⭐'
-    }
-}
-
 # Файлы для хранения данных
 HISTORY_FILE = 'history.json'
 FAVORITES_FILE = 'favorites.json'
 ACTIVITIES_FILE = 'activities.json'
 
-# Инициализация файлов данных
-for file in [HISTORY_FILE, FAVORITES_FILE, ACTIVITIES_FILE]:
-    if not os.path.exists(file):
-        logging.info(f"Создание файла: {file}")
-        with open(file, 'w', encoding='utf-8') as f:
+# Активности из activities.json: скомпилированный индекс с подбором
+# похожих вариантов, файл перечитывается при изменении. Отсутствующий
+# файл создаётся пустым
+def open_activity_catalog():
+    if not os.path.exists(ACTIVITIES_FILE):
+        logging.info("Создание файла: %s", ACTIVITIES_FILE)
+        with open(ACTIVITIES_FILE, 'w', encoding='utf-8') as f:
             json.dump({}, f, ensure_ascii=False)
+    return ActivityCatalog(
+        ACTIVITIES_FILE,
+        check_interval=float(os.getenv('ACTIVITIES_CHECK_INTERVAL', 2))
+    )
 
-# Загрузка активностей из activities.json
-def load_activities():
-    try:
-        with open(ACTIVITIES_FILE, 'r', encoding='utf-8') as f:
-            activities = json.load(f)
-            logging.debug(f"Активности загружены: {activities}")
-            return activities
-    except Exception as e:
-        logging.error(f"Ошибка при загрузке из {ACTIVITIES_FILE}: {e}")
-        return {}
+activity_catalog = Lazy(open_activity_catalog, 'activities')
+
+# Общее состояние процессов (state_backend.py): пусто - локальные файлы
+# одного процесса, иначе путь SQLite или redis://host:port/db (нужно для
+# --processes больше 1). Существующие history.db и favorites.json
+# переносятся в хранилище при первом запуске
+HISTORY_DB = 'history.db'
+STATE_BACKEND = os.getenv('STATE_BACKEND', '')
+state_backend = Lazy(lambda: open_state_backend(STATE_BACKEND), 'state_backend')
+
+def shared_state():
+    return state_backend.lazy_instance()
+
+# История запросов: журнал в SQLite, history.json переносится при первом запуске;
+# с общим хранилищем туда же переносится history.db
+def open_history_store():
+    if shared_state() is None:
+        store = HistoryStore(HISTORY_DB)
+    else:
+        store = SharedHistoryStore(shared_state())
+        store.migrate_from_db(HISTORY_DB)
+    store.migrate_from_json(HISTORY_FILE)
+    return store
+
+history_store = Lazy(open_history_store, 'history')
+
+# Избранное: копия в памяти, запись на диск пачками и при остановке;
+# с общим хранилищем - сразу в хранилище, favorites.json переносится туда
+def open_favorites_store():
+    if shared_state() is None:
+        store = FavoritesStore(FAVORITES_FILE)
+    else:
+        store = SharedFavoritesStore(shared_state(), FAVORITES_FILE)
+    atexit.register(store.close)
+    return store
+
+favorites_store = Lazy(open_favorites_store, 'favorites')
+
+# HTTP-клиенты внешних API (пулы соединений, повторы, предохранитель);
+# создаются при первом запросе
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+
+def open_http_client(name):
+    return HttpClient(
+        name,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        retries=HTTP_RETRIES
+    )
+
+overpass_client = Lazy(lambda: open_http_client('overpass'), 'overpass_client')
+owm_client = Lazy(lambda: open_http_client('owm'), 'owm_client')
+
+# Кэш результатов поиска заведений (данные OSM меняются медленно)
+PLACES_CACHE_TTL = int(os.getenv('PLACES_CACHE_TTL', 3600))
+PLACES_CACHE_MAX_ENTRIES = int(os.getenv('PLACES_CACHE_MAX_ENTRIES', 512))
+PLACES_CACHE_MAX_BYTES = int(os.getenv('PLACES_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+places_cache = TTLCache(
+    'places',
+    ttl=PLACES_CACHE_TTL,
+    max_entries=PLACES_CACHE_MAX_ENTRIES,
+    max_bytes=PLACES_CACHE_MAX_BYTES
+)
 
-ACTIVITIES = load_activities()
+# Показанные пользователям наборы мест: короткий хэндл в callback_data,
+# место по (type, id) за O(1), листание страниц без повторного поиска
+PLACES_PAGE_SIZE = int(os.getenv('PLACES_PAGE_SIZE', 8))
+RESULTS_EXPIRED_TEXT = "Результаты поиска устарели, выполните поиск заново"
+result_sets = ResultSetStore(
+    max_sets=int(os.getenv('RESULT_SETS_MAX', 2000)),
+    ttl=int(os.getenv('RESULT_SETS_TTL', 6 * 3600))
+)
+
+# Кэш погоды: короткий TTL, устаревшее значение отдаётся сразу и обновляется
+# в фоне, неизвестные города кэшируются отдельно
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 600))
+WEATHER_CACHE_STALE_TTL = int(os.getenv('WEATHER_CACHE_STALE_TTL', 1800))
+WEATHER_CACHE_NEGATIVE_TTL = int(os.getenv('WEATHER_CACHE_NEGATIVE_TTL', 3600))
+CITY_ALIASES_FILE = 'city_aliases.json'
+
+class CityNotFoundError(Exception):
+    pass
+
+class WeatherError(Exception):
+    pass
+
+weather_cache = TTLCache(
+    'weather',
+    ttl=WEATHER_CACHE_TTL,
+    max_entries=1024,
+    stale_ttl=WEATHER_CACHE_STALE_TTL,
+    negative_ttl=WEATHER_CACHE_NEGATIVE_TTL,
+    is_negative=lambda e: isinstance(e, CityNotFoundError)
+)
 
-# Состояния пользователей
-user_data = {}
+# Необязательный словарь синонимов городов: {"питер": "Санкт-Петербург", ...}
+def load_city_aliases():
+    if not os.path.exists(CITY_ALIASES_FILE):
+        return {}
+    aliases = load_from_file(CITY_ALIASES_FILE)
+    return {normalize_city(k): v for k, v in aliases.items()}
+
+# Состояния пользователей: сессии с истечением по простою, ограничением
+# числа и сохранением в общее хранилище или в SQLite SESSION_DB (пустой
+# SESSION_DB без общего хранилища отключает сохранение)
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', 24 * 3600))
+SESSION_MAX = int(os.getenv('SESSION_MAX', 10000))
+SESSION_DB = os.getenv('SESSION_DB', 'sessions.db')
+def open_sessions():
+    backend = shared_state() or (SQLiteBackend(SESSION_DB) if SESSION_DB else None)
+    store = SessionStore(idle_ttl=SESSION_IDLE_TTL, max_sessions=SESSION_MAX, backend=backend)
+    atexit.register(store.close)
+    return store
+
+user_data = Lazy(open_sessions, 'sessions')
 
 # Функции для работы с данными
 def save_to_file(filename, data):
     try:
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
-        logging.debug(f"Данные сохранены в {filename}")
+        logging.debug("Данные сохранены в %s", filename)
     except Exception as e:
-        logging.error(f"Ошибка при сохранении в {filename}: {e}")
+        logging.error("Ошибка при сохранении в %s: %s", filename, e)
 
 def load_from_file(filename):
     try:
         with open(filename, 'r', encoding='utf-8') as f:
             data = json.load(f)
-            logging.debug(f"Данные загружены из {filename}")
+            logging.debug("Данные загружены из %s", filename)
             return data
     except Exception as e:
-        logging.error(f"Ошибка при загрузке из {filename}: {e}")
+        logging.error("Ошибка при загрузке из %s: %s", filename, e)
         return {}
 
 def add_favorite(user_id, item_type, item):
-    favorites = load_from_file(FAVORITES_FILE)
-    user_id = str(user_id)
-    if user_id not in favorites:
-        favorites[user_id] = {"venues": [], "activities": [], "queries": []}
-
-    if item not in favorites[user_id][item_type]:
-        favorites[user_id][item_type].append(item)
-        save_to_file(FAVORITES_FILE, favorites)
-        logging.debug(f"Добавлено в избранное: {item_type} - {item}")
+    if favorites_store.add(user_id, item_type, item):
+        logging.debug("Добавлено в избранное: %s - %s", item_type, item)
         return True
     return False
 
 def get_favorites(user_id):
-    return load_from_file(FAVORITES_FILE).get(str(user_id), {"venues": [], "activities": [], "queries": []})
+    return favorites_store.get(user_id)
 
 def save_history(user_id, username, data):
-    history = load_from_file(HISTORY_FILE)
     entry = {
         'user_id': user_id,
         'username': username,
@@ -154,166 +315,138 @@ def save_history(user_id, username, data):
         'activities': data.get('activities', [])
     }
 
-    user_id = str(user_id)
-    if user_id not in history:
-        history[user_id] = []
+    history_store.append(user_id, entry)
+    logging.debug("История сохранена для user_id: %s", user_id)
+
+def get_user_history(user_id, limit=5):
+    return history_store.last(user_id, limit)
+
+CITY_ALIASES = Lazy(load_city_aliases, 'city_aliases')
 
-    history[user_id].append(entry)
-    save_to_file(HISTORY_FILE, history)
-    logging.debug(f"История сохранена для user_id: {user_id}")
+# Недавние поиски городов и категорий - для прогрева кэшей
+demand_tracker = DemandTracker()
 
-def get_user_history(user_id):
-    history = load_from_file(HISTORY_FILE)
-    return history.get(str(user_id), [])
+# Локальный индекс мест (poi_index.py): если город есть в индексе,
+# Overpass не запрашивается. Индекс, созданный после запуска, подхватывается
+# без перезапуска
+POI_INDEX_DB = os.getenv('POI_INDEX_DB', 'poi_index.db')
+poi_index = Lazy(lambda: PoiIndexHandle(POI_INDEX_DB), 'poi_index')
+
+def search_local_places(city, category):
+    index = poi_index.get()
+    if index is None:
+        return None
+    try:
+        return index.search(city, category, PLACES_LIMIT)
+    except Exception as e:
+        logging.error("Ошибка при поиске в локальном индексе мест: %s", e)
+        return None
 
 # Overpass API для поиска мест
+@metrics.timed('call')
 def search_places(city, category):
-    category_mapping = {
-        "Кафе": ["amenity=cafe"],
-        "Рестораны": ["amenity=restaurant"],
-        "Кинотеатры": ["amenity=cinema"],
-        "Парки": ["leisure=park"],
-        "Музеи": ["tourism=museum"],
-        "Торговые центры": ["shop=mall"]
-    }
+    if category not in CATEGORY_MAPPING:
+        logging.warning("Категория не найдена: %s", category)
+        return []
 
-    overpass_url = "https://overpass-api.de/api/interpreter"
+    demand_tracker.record(city, category)
+    local = search_local_places(city, category)
+    if local is not None:
+        return local
 
-    if category not in category_mapping:
-        logging.warning(f"Категория не найдена: {category}")
+    key = (normalize_city(city), category)
+    try:
+        return places_cache.get_or_load(key, lambda: fetch_places(city, category))
+    except Exception as e:
+        logging.error("Ошибка при запросе к Overpass API: %s", e)
         return []
 
-    queries = category_mapping[category]
-    results = []
-
-    for query in queries:
-        overpass_query = f"""
-        [out:json];
-        area["name"="{city}"]->.searchArea;
-        (
-          node[{query}](area.searchArea);
-          way[{query}](area.searchArea);
-          relation[{query}](area.searchArea);
-        );
-        out center;
-        """
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+# Порядок мест: qt (быстрый, порядок сервера) или nearest (ближе к центру города)
+PLACES_ORDER = os.getenv('PLACES_ORDER', 'qt')
 
-        try:
-            response = requests.post(overpass_url, data=overpass_query.encode('utf-8'), timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            logging.debug(f"Overpass API response: {data}")
-
-            for element in data.get("elements", []):
-                name = element.get("tags", {}).get("name", "Без названия")
-                address = element.get("tags", {}).get("address", "Адрес не указан")
-
-                results.append({
-                    "id": element.get("id"),
-                    "type": element.get("type"),
-                    "name": name,
-                    "address": address,
-                    "lat": element.get("lat") or element.get("center", {}).get("lat"),
-                    "lon": element.get("lon") or element.get("center", {}).get("lon")
-                })
-
-                if len(results) >= 15:
-                    break
+# Сопоставление города с областью OSM (id, bbox, центр) с локальным кэшем
+AREAS_DB = os.getenv('AREAS_DB', 'areas.db')
 
-        except Exception as e:
-            logging.error(f"Ошибка при запросе к Overpass API: {e}")
+def fetch_area(city):
+    response = overpass_client.post(OVERPASS_URL, data=build_area_query(city).encode('utf-8'))
+    response.raise_for_status()
+    return pick_area(response.json().get("elements", []))
+
+area_resolver = Lazy(lambda: AreaResolver(fetch=fetch_area, db_path=AREAS_DB), 'areas')
 
+# Несколько фильтров категории: union - один объединённый запрос,
+# parallel - отдельные запросы одновременно с общим сроком PLACES_DEADLINE;
+# при истечении срока возвращаются места из успевших запросов
+PLACES_MULTI_QUERY = os.getenv('PLACES_MULTI_QUERY', 'union')
+PLACES_DEADLINE = float(os.getenv('PLACES_DEADLINE', 12))
+OVERPASS_WORKERS = int(os.getenv('OVERPASS_WORKERS', 4))
+overpass_executor = Lazy(
+    lambda: ThreadPoolExecutor(max_workers=OVERPASS_WORKERS, thread_name_prefix="overpass"), 'overpass_executor'
+)
+
+def run_overpass_query(city, queries, area, center):
+    overpass_query = build_overpass_query(city, queries, PLACES_LIMIT, PLACES_ORDER, area=area)
+    response = overpass_client.post(OVERPASS_URL, data=overpass_query.encode('utf-8'), stream=True)
+    try:
+        response.raise_for_status()
+        elements = iter_overpass_elements(response.iter_content(chunk_size=8192))
+        results = collect_places(elements, [], PLACES_LIMIT, PLACES_ORDER, center)
+    finally:
+        response.close()
+    logging.debug("Overpass: %s мест для %s в %s", len(results), queries, city)
     return results
 
-# Клавиатуры
-def create_main_keyboard():
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add("🎯 Найти занятия", "🏢 Найти заведения")
-    keyboard.add("⭐ Избранное", "📜 История")
-    logging.debug("Основная клавиатура создана")
-    return keyboard
-
-def create_categories_keyboard():
-    keyboard = types.InlineKeyboardMarkup(row_width=2)
-    categories = ["Кафе", "Рестораны", "Кинотеатры", "Парки", "Музеи", "Торговые центры"]
-    buttons = [types.InlineKeyboardButton(text=cat, callback_data=f"category_{cat}") for cat in categories]
-    keyboard.add(*buttons)
-    logging.debug("Клавиатура категорий создана")
-    return keyboard
-
-def create_places_keyboard(places, query_id):
-    keyboard = types.InlineKeyboardMarkup(row_width=1)
-    for place in places:
-        callback_data = f"place_{query_id}_{place['type']}_{place['id']}"
-        keyboard.add(types.InlineKeyboardButton(
-            text=f"🏢 {place['name']}",
-            callback_data=callback_data
-        ))
-    keyboard.add(types.InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_categories"))
-    logging.debug(f"Клавиатура мест создана для query_id: {query_id}")
-    return keyboard
-
-def create_place_details_keyboard(place_id, place_type, query_id, is_favorite=False):
-    keyboard = types.InlineKeyboardMarkup(row_width=2)
-    if not is_favorite:
-        callback_data = f"favplace_{query_id}_{place_type}_{place_id}"
-        keyboard.add(types.InlineKeyboardButton(
-            text="❤️ В избранное",
-            callback_data=callback_data
-        ))
-
-    map_callback = f"map_{place_type}_{place_id}"
-    back_callback = f"back_to_places_{query_id}"
-    keyboard.add(
-        types.InlineKeyboardButton(text="📍 На карте", callback_data=map_callback),
-        types.InlineKeyboardButton(text="🔙 Назад", callback_data=back_callback)
-    )
-    logging.debug(f"Клавиатура деталей места создана для place_id: {place_id}")
-    return keyboard
-
-def create_inline_keyboard(items, prefix="", add_back=False, add_cancel=False):
-    keyboard = types.InlineKeyboardMarkup(row_width=2)
-    buttons = []
-    for item in items:
-        callback_data = f"{prefix}_{item}"
-        buttons.append(types.InlineKeyboardButton(
-            text=f"{ICONS.get(prefix, {}).get(item, '')} {item.capitalize()}",
-            callback_data=callback_data
-        ))
-        logging.debug(f"Добавлена кнопка: {item}, callback_data: {callback_data}")
-    if add_back:
-        buttons.append(types.InlineKeyboardButton(text="🔙 Назад", callback_data="back"))
-        logging.debug("Добавлена кнопка 'Назад'")
-    if add_cancel:
-        buttons.append(types.InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"))
-        logging.debug("Добавлена кнопка 'Отмена'")
-    if not buttons:
-        logging.warning("Клавиатура пуста, кнопки не добавлены")
-    keyboard.add(*buttons)
-    logging.debug(f"Клавиатура создана для {prefix}: {items}")
-    return keyboard
+@metrics.timed('call')
+def fetch_places(city, category):
+    queries = CATEGORY_MAPPING[category]
+    area = area_resolver.resolve(city)
+    center = area.center if area is not None else None
 
-# Обработчики команд
-@bot.message_handler(commands=['start', 'help'])
-def send_welcome(message):
-    welcome_text = (
-        "Добро пожаловать в АнТиСкУкА БОТ (OSM версия)!\n\n"
-        "Я помогу найти:\n"
-        "🎯 - Интересные занятия по погоде и настроению\n"
-        "🏢 - Лучшие заведения из OpenStreetMap\n\n"
-        "Используйте меню или кнопки ниже:"
-    )
-    bot.send_message(message.chat.id, welcome_text, reply_markup=create_main_keyboard())
-    logging.info(f"Отправлено приветственное сообщение для chat_id: {message.chat.id}")
+    if PLACES_MULTI_QUERY == 'parallel' and len(queries) > 1:
+        results = fetch_places_parallel(city, queries, area, center)
+    else:
+        results = run_overpass_query(city, queries, area, center)
 
-@bot.message_handler(commands=['history'])
-def show_history_command(message):
-    history = get_user_history(message.chat.id)
-    if not history:
-        bot.send_message(message.chat.id, "У вас пока нет истории запросов.")
-        logging.info(f"История пуста для chat_id: {message.chat.id}")
-        return
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Кэш мест: %s", places_cache.stats())
+    return results
 
+def fetch_places_parallel(city, queries, area, center):
+    futures = [overpass_executor.submit(run_overpass_query, city, query, area, center) for query in queries]
+    done, pending = wait(futures, timeout=PLACES_DEADLINE)
+    for future in pending:
+        future.cancel()
+
+    place_lists = []
+    error = None
+    for future in futures:
+        if future not in done:
+            continue
+        if future.exception() is not None:
+            error = future.exception()
+            logging.error("Ошибка при запросе к Overpass API: %s", error)
+        else:
+            place_lists.append(future.result())
+    if pending:
+        logging.warning("Overpass: %d из %d запросов не уложились в %s с для %s",
+                        len(pending), len(futures), PLACES_DEADLINE, city)
+
+    # Пустой результат из-за ошибки не должен попасть в кэш
+    if not place_lists:
+        raise error or TimeoutError(f"Overpass: нет ответа за {PLACES_DEADLINE} с")
+    return merge_places(place_lists, PLACES_LIMIT, PLACES_ORDER, center)
+
+# Тексты сообщений (общие для синхронного и асинхронного режимов)
+WELCOME_TEXT = (
+    "Добро пожаловать в АнТиСкУкА БОТ (OSM версия)!\n\n"
+    "Я помогу найти:\n"
+    "🎯 - Интересные занятия по погоде и настроению\n"
+    "🏢 - Лучшие заведения из OpenStreetMap\n\n"
+    "Используйте меню или кнопки ниже:"
+)
+
+def build_history_text(history):
     history_text = "📜 Ваша история запросов:\n\n"
     for i, entry in enumerate(history[-5:], 1):
         history_text += (
@@ -328,22 +461,9 @@ def show_history_command(message):
         for j, activity in enumerate(entry.get('activities', [])[:3], 1):
             history_text += f"   {j}. {activity}\n"
         history_text += "\n"
+    return history_text
 
-    bot.send_message(message.chat.id, history_text)
-    logging.info(f"Отправлена история для chat_id: {message.chat.id}")
-
-@bot.message_handler(commands=['favorites'])
-def show_favorites_command(message):
-    show_favorites(message)
-
-@bot.message_handler(func=lambda msg: msg.text == "⭐ Избранное")
-def show_favorites(message):
-    favorites = get_favorites(message.chat.id)
-    if not any(favorites.values()):
-        bot.send_message(message.chat.id, "У вас пока нет избранного.")
-        logging.info(f"Избранное пусто для chat_id: {message.chat.id}")
-        return
-
+def build_favorites_text(favorites):
     text = "⭐ <b>Ваше избранное</b>\n\n"
     if favorites["venues"]:
         text += "🏢 <b>Заведения:</b>\n"
@@ -361,38 +481,150 @@ def show_favorites(message):
         text += "🔍 <b>Запросы:</b>\n"
         for query in favorites["queries"]:
             text += f"- {query['city']} ({query['weather']}, {query['mood']})\n"
+    return text
+
+def build_weather_text(city, weather, weather_desc):
+    return (
+        f"{ICONS['weather'][weather_desc]} Погода в {city}:\n"
+        f"• Состояние: {weather['description']}\n"
+        f"• Температура: {weather['temp']}°C\n"
+        f"• Влажность: {weather['humidity']}%\n"
+        f"• Ветер: {weather['wind']} м/с\n\n"
+        f"Какое у вас настроение?"
+    )
 
-    bot.send_message(message.chat.id, text, parse_mode="HTML")
-    logging.info(f"Отправлено избранное для chat_id: {message.chat.id}")
+def build_weather_error_text(city):
+    return (
+        f"{ICONS['weather']['разнообразно']} Ошибка!\n"
+        f"Не удалось получить данные для города {city}.\n"
+        "Попробуйте ввести другой город:"
+    )
+
+def build_place_details_text(place, category):
+    return (
+        f"🏢 <b>{place['name']}</b>\n"
+        f"📍 Адрес: {place['address']}\n"
+        f"🗺️ Категория: {category}\n"
+    )
+
+def build_venue_data(result_set, place, place_type):
+    return {
+        "id": place["id"],
+        "type": place_type,
+        "name": place["name"],
+        "address": place["address"],
+        "category": result_set.category,
+        "city": result_set.city,
+        "lat": place.get("lat"),
+        "lon": place.get("lon")
+    }
+
+def build_map_url(place):
+    return f"https://www.openstreetmap.org/?mlat={place['lat']}&mlon={place['lon']}#map=18/{place['lat']}/{place['lon']}"
+
+def find_current_place(data, place_type, place_id):
+    query = data.get("current_query")
+    result_set = result_sets.get(query["id"]) if query else None
+    return result_set.find(place_type, place_id) if result_set else None
+
+def build_places_text(result_set, page):
+    pages = result_set.pages(PLACES_PAGE_SIZE)
+    text = f"🏢 {result_set.category} в {result_set.city} (найдено {len(result_set.places)}"
+    if pages > 1:
+        text += f", стр. {page + 1}/{pages}"
+    return text + "):"
+
+def build_places_page(result_set, page=0):
+    page, places = result_set.page(page, PLACES_PAGE_SIZE)
+    keyboard = create_places_keyboard(places, result_set.handle, page, result_set.pages(PLACES_PAGE_SIZE))
+    return build_places_text(result_set, page), keyboard
+
+def get_activity_options(data):
+    options, level = recommendation_engine.options(data['weather'], data['mood'], data['budget'], data['people'])
+    if level != 'exact':
+        logging.debug("Активности: нет точного совпадения, ослаблено до %s", level)
+    return options
+
+def build_recommendations_text(data, options):
+    result_text = (
+        f"Рекомендации для {data['city']}:\n\n"
+        f"{ICONS['weather'][data['weather']]} Погода: {data['weather']}\n"
+        f"{ICONS['mood'][data['mood']]} Настроение: {data['mood']}\n"
+        f"{ICONS['budget'][data['budget']]} Бюджет: {data['budget']}\n"
+        f"{ICONS['people'][data['people']]} Участники: {data['people']}\n\n"
+        "Варианты досуга:\n"
+    )
+
+    for i, option in enumerate(options, 1):
+        result_text += f"{i}. {option}\n"
+    return result_text
+
+def new_query_id(short=False):
+    query_id = str(uuid.uuid4())
+    return query_id[:8] if short else query_id
+
+# Обработчики команд
+@bot.message_handler(commands=['start', 'help'])
+def send_welcome(message):
+    bot.send_message(message.chat.id, WELCOME_TEXT, reply_markup=create_main_keyboard())
+    logging.info("Отправлено приветственное сообщение для chat_id: %s", message.chat.id)
+
+@bot.message_handler(commands=['history'])
+def show_history_command(message):
+    history = get_user_history(message.chat.id)
+    if not history:
+        bot.send_message(message.chat.id, "У вас пока нет истории запросов.")
+        logging.info("История пуста для chat_id: %s", message.chat.id)
+        return
+
+    bot.send_message(message.chat.id, build_history_text(history))
+    logging.info("Отправлена история для chat_id: %s", message.chat.id)
+
+@bot.message_handler(commands=['favorites'])
+def show_favorites_command(message):
+    show_favorites(message)
+
+@bot.message_handler(func=lambda msg: msg.text == "⭐ Избранное")
+def show_favorites(message):
+    favorites = get_favorites(message.chat.id)
+    if not any(favorites.values()):
+        bot.send_message(message.chat.id, "У вас пока нет избранного.")
+        logging.info("Избранное пусто для chat_id: %s", message.chat.id)
+        return
+
+    bot.send_message(message.chat.id, build_favorites_text(favorites), parse_mode="HTML")
+    logging.info("Отправлено избранное для chat_id: %s", message.chat.id)
 
 @bot.message_handler(func=lambda msg: msg.text == "🏢 Найти заведения")
 def ask_city_for_places(message):
     msg = bot.send_message(message.chat.id, "В каком городе ищем заведения?")
     bot.register_next_step_handler(msg, process_city_for_places)
-    logging.info(f"Запрошен город для поиска заведений, chat_id: {message.chat.id}")
+    logging.info("Запрошен город для поиска заведений, chat_id: %s", message.chat.id)
 
+@metrics.timed('handler')
 def process_city_for_places(message):
     user_data[message.chat.id] = {
         "city": message.text.strip(),
         "step": "places_category"
     }
     bot.send_message(message.chat.id, "Выберите категорию:", reply_markup=create_categories_keyboard())
-    logging.debug(f"Сохранён город {message.text.strip()} для chat_id: {message.chat.id}")
+    logging.debug("Сохранён город %s для chat_id: %s", message.text.strip(), message.chat.id)
 
 @bot.message_handler(func=lambda msg: msg.text == "🎯 Найти занятия")
 def ask_city_for_activities(message):
     msg = bot.send_message(message.chat.id, "Введите название вашего города:")
     bot.register_next_step_handler(msg, process_city_for_activities)
-    logging.info(f"Запрошен город для поиска занятий, chat_id: {message.chat.id}")
+    logging.info("Запрошен город для поиска занятий, chat_id: %s", message.chat.id)
 
+@metrics.timed('handler')
 def process_city_for_activities(message):
     try:
         city = message.text.strip()
-        logging.debug(f"Обработка города: {city}")
+        logging.debug("Обработка города: %s", city)
 
         weather = get_weather_data(city)
         weather_desc = get_weather_description(weather['weather_code'])
-        logging.debug(f"Погода: {weather_desc}, температура: {weather['temp']}°C")
+        logging.debug("Погода: %s, температура: %s°C", weather_desc, weather['temp'])
 
         user_data[message.chat.id] = {
             'step': 'mood',
@@ -400,16 +632,9 @@ def process_city_for_activities(message):
             'weather': weather_desc,
             'temp': weather['temp']
         }
-        logging.debug(f"Сохранено в user_data: {user_data[message.chat.id]}")
-
-        weather_text = (
-            f"{ICONS['weather'][weather_desc]} Погода в {city}:\n"
-            f"• Состояние: {weather['description']}\n"
-            f"• Температура: {weather['temp']}°C\n"
-            f"• Влажность: {weather['humidity']}%\n"
-            f"• Ветер: {weather['wind']} м/с\n\n"
-            f"Какое у вас настроение?"
-        )
+        logging.debug("Сохранено в user_data: %s", user_data[message.chat.id])
+
+        weather_text = build_weather_text(city, weather, weather_desc)
 
         keyboard = create_inline_keyboard(['активное', 'расслабленное', 'экстремальное'], 'mood', add_back=True, add_cancel=True)
         bot.send_message(
@@ -417,55 +642,68 @@ def process_city_for_activities(message):
             weather_text,
             reply_markup=keyboard
         )
-        logging.info(f"Отправлено сообщение с клавиатурой настроений для chat_id: {message.chat.id}")
+        logging.info("Отправлено сообщение с клавиатурой настроений для chat_id: %s", message.chat.id)
 
     except Exception as e:
-        error_text = (
-            f"{ICONS['weather']['разнообразно']} Ошибка!\n"
-            f"Не удалось получить данные для города {city}.\n"
-            "Попробуйте ввести другой город:"
-        )
-        bot.send_message(message.chat.id, error_text)
+        bot.send_message(message.chat.id, build_weather_error_text(city))
         msg = bot.send_message(message.chat.id, "Введите название вашего города:")
         bot.register_next_step_handler(msg, process_city_for_activities)
-        logging.error(f"Ошибка в process_city_for_activities: {str(e)}")
+        logging.error("Ошибка в process_city_for_activities: %s", e)
+
+def resolve_city_alias(city):
+    key = normalize_city(city)
+    target = CITY_ALIASES.get(key)
+    if target:
+        return normalize_city(target), target
+    return key, city
 
+@metrics.timed('call')
 def get_weather_data(city):
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={OWM_API_KEY}&units=metric&lang=ru"
-    logging.debug(f"Запрос погоды для города: {city}, URL: {url}")
+    demand_tracker.record(city)
+    key, query_city = resolve_city_alias(city)
     try:
-        response = requests.get(url, timeout=10)
+        return weather_cache.get_or_load(key, lambda: fetch_weather_data(query_city))
+    finally:
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Кэш погоды: %s", weather_cache.stats())
+
+OWM_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+def owm_params(city):
+    return {'q': city, 'appid': OWM_API_KEY, 'units': 'metric', 'lang': 'ru'}
+
+# Текст исключений requests содержит URL запроса с appid=<ключ>, поэтому
+# в лог и в WeatherError попадают только класс ошибки, статус и город
+def log_weather_error(city, error):
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    logging.error("Ошибка при получении погоды для %s: %s, статус %s", city, type(error).__name__, status)
+
+@metrics.timed('call')
+def fetch_weather_data(city):
+    logging.debug("Запрос погоды для города: %s", city)
+    try:
+        response = owm_client.get(OWM_URL, params=owm_params(city))
+        if response.status_code == 404:
+            raise CityNotFoundError(f"город не найден: {city}")
         response.raise_for_status()
         data = response.json()
-        logging.debug(f"Ответ API: {data}")
+        if sampled(LOG_PAYLOAD_SAMPLE):
+            logging.debug("Ответ API: %s", Payload(data))
+        return parse_weather_response(data)
+    except CityNotFoundError:
+        logging.warning("Город не найден в OpenWeatherMap: %s", city)
+        raise
+    except Exception as e:
+        log_weather_error(city, e)
+        raise WeatherError(f"Ошибка при получении погоды для {city}") from None
 
-        if data['cod'] != 200:
-            raise Exception(data.get('message', 'Unknown error'))
+# Категория погоды по коду OWM: таблица из weather.py, соответствие
+# можно переопределить файлом WEATHER_CODES_FILE
+weather_codes = WeatherCodes.from_file(os.getenv('WEATHER_CODES_FILE'))
+get_weather_description = weather_codes.describe
 
-        return {
-            'temp': data['main']['temp'],
-            'weather_code': data['weather'][0]['id'],
-            'description': data['weather'][0]['description'],
-            'humidity': data['main']['humidity'],
-            'wind': data['wind']['speed']
-        }
-    except Exception as e:
-        logging.error(f"Ошибка при получении погоды: {str(e)}")
-        raise Exception(f"Ошибка при получении погоды: {str(e)}")
-
-def get_weather_description(weather_code):
-    if weather_code == 800:
-        return "ясно"
-    elif weather_code in [801, 802]:
-        return "облачно"
-    elif weather_code in [803, 804]:
-        return "пасмурно"
-    elif weather_code in [300, 301, 302, 310, 311, 312, 313, 314, 321, 500, 501, 502, 503, 504, 511, 520, 521, 522, 531]:
-        return "дождь"
-    elif weather_code in [600, 601, 602, 611, 612, 613, 615, 616, 620, 621, 622]:
-        return "снег"
-    else:
-        return "разнообразно"
+# Подбор занятий без Telegram: пакетный API и CLI (recommendations.py)
+recommendation_engine = RecommendationEngine(activity_catalog, get_weather_data, get_weather_description)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('category_'))
 def show_places(call):
@@ -475,11 +713,11 @@ def show_places(call):
 
     if not city:
         bot.answer_callback_query(call.id, "Город не указан")
-        logging.warning(f"Город не указан для chat_id: {chat_id}")
+        logging.warning("Город не указан для chat_id: %s", chat_id)
         return
 
     bot.answer_callback_query(call.id, f"Ищем {category.lower()} в {city}...")
-    logging.info(f"Поиск заведений: {category} в {city} для chat_id: {chat_id}")
+    logging.info("Поиск заведений: %s в %s для chat_id: %s", category, city, chat_id)
 
     try:
         places = search_places(city, category)
@@ -490,23 +728,23 @@ def show_places(call):
                 text=f"Не найдено {category.lower()} в {city}",
                 reply_markup=None
             )
-            logging.info(f"Заведения не найдены: {category} в {city}")
+            logging.info("Заведения не найдены: %s в %s", category, city)
             return
 
-        query_id = str(uuid.uuid4())
+        result_set = result_sets.put(chat_id, city, category, places)
         user_data[chat_id]["current_query"] = {
-            "id": query_id,
-            "category": category,
-            "places": places
+            "id": result_set.handle,
+            "category": category
         }
 
+        text, keyboard = build_places_page(result_set)
         bot.edit_message_text(
             chat_id=chat_id,
             message_id=call.message.message_id,
-            text=f"🏢 {category} в {city} (найдено {len(places)}):",
-            reply_markup=create_places_keyboard(places, query_id)
+            text=text,
+            reply_markup=keyboard
         )
-        logging.debug(f"Отправлен список заведений для chat_id: {chat_id}")
+        logging.debug("Отправлен список заведений для chat_id: %s", chat_id)
 
     except Exception as e:
         bot.edit_message_text(
@@ -515,7 +753,7 @@ def show_places(call):
             text=f"Ошибка при поиске: {str(e)}",
             reply_markup=None
         )
-        logging.error(f"Ошибка при поиске заведений: {str(e)}")
+        logging.error("Ошибка при поиске заведений: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('place_'))
 def show_place_details(call):
@@ -523,24 +761,24 @@ def show_place_details(call):
         _, query_id, place_type, place_id = call.data.split('_')
         chat_id = call.message.chat.id
 
-        place = next((p for p in user_data[chat_id]["current_query"]["places"]
-                     if str(p["id"]) == place_id and p["type"] == place_type), None)
+        result_set = result_sets.get(query_id, chat_id)
+        if result_set is None:
+            bot.answer_callback_query(call.id, RESULTS_EXPIRED_TEXT)
+            logging.info("Устаревший набор результатов: %s для chat_id: %s", query_id, chat_id)
+            return
+
+        place = result_set.find(place_type, place_id)
         if not place:
             bot.answer_callback_query(call.id, "Место не найдено")
-            logging.warning(f"Место не найдено: {place_id}, type: {place_type}")
+            logging.warning("Место не найдено: %s, type: %s", place_id, place_type)
             return
 
-        favorites = get_favorites(chat_id)
-        is_favorite = any(v['id'] == place["id"] and v['type'] == place_type
-                         for v in favorites["venues"])
+        is_favorite = favorites_store.has_venue(chat_id, place_type, place["id"])
 
-        text = (
-            f"🏢 <b>{place['name']}</b>\n"
-            f"📍 Адрес: {place['address']}\n"
-            f"🗺️ Категория: {user_data[chat_id]['current_query']['category']}\n"
-        )
+        text = build_place_details_text(place, result_set.category)
 
-        keyboard = create_place_details_keyboard(place["id"], place_type, query_id, is_favorite)
+        page = result_set.page_of(place_type, place_id, PLACES_PAGE_SIZE)
+        keyboard = create_place_details_keyboard(place["id"], place_type, query_id, is_favorite, page)
 
         bot.edit_message_text(
             chat_id=chat_id,
@@ -549,11 +787,11 @@ def show_place_details(call):
             parse_mode="HTML",
             reply_markup=keyboard
         )
-        logging.debug(f"Отправлены детали места для chat_id: {chat_id}")
+        logging.debug("Отправлены детали места для chat_id: %s", chat_id)
 
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в show_place_details: {str(e)}")
+        logging.error("Ошибка в show_place_details: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('favplace_'))
 def add_place_to_favorites(call):
@@ -561,28 +799,25 @@ def add_place_to_favorites(call):
         _, query_id, place_type, place_id = call.data.split('_')
         chat_id = call.message.chat.id
 
-        place = next((p for p in user_data[chat_id]["current_query"]["places"]
-                     if str(p["id"]) == place_id and p["type"] == place_type), None)
+        result_set = result_sets.get(query_id, chat_id)
+        if result_set is None:
+            bot.answer_callback_query(call.id, RESULTS_EXPIRED_TEXT)
+            logging.info("Устаревший набор результатов: %s для chat_id: %s", query_id, chat_id)
+            return
+
+        place = result_set.find(place_type, place_id)
         if not place:
             bot.answer_callback_query(call.id, "Место не найдено")
-            logging.warning(f"Место не найдено для добавления в избранное: {place_id}")
+            logging.warning("Место не найдено для добавления в избранное: %s", place_id)
             return
 
-        venue_data = {
-            "id": place["id"],
-            "type": place_type,
-            "name": place["name"],
-            "address": place["address"],
-            "category": user_data[chat_id]["current_query"]["category"],
-            "city": user_data[chat_id]["city"],
-            "lat": place.get("lat"),
-            "lon": place.get("lon")
-        }
+        venue_data = build_venue_data(result_set, place, place_type)
 
         if add_favorite(chat_id, "venues", venue_data):
             bot.answer_callback_query(call.id, "Добавлено в избранное!")
             text = call.message.text
-            keyboard = create_place_details_keyboard(place["id"], place_type, query_id, True)
+            page = result_set.page_of(place_type, place_id, PLACES_PAGE_SIZE)
+            keyboard = create_place_details_keyboard(place["id"], place_type, query_id, True, page)
             bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=call.message.message_id,
@@ -590,14 +825,14 @@ def add_place_to_favorites(call):
                 parse_mode="HTML",
                 reply_markup=keyboard
             )
-            logging.info(f"Место добавлено в избранное для chat_id: {chat_id}")
+            logging.info("Место добавлено в избранное для chat_id: %s", chat_id)
         else:
             bot.answer_callback_query(call.id, "Уже в избранном")
-            logging.info(f"Место уже в избранном для chat_id: {chat_id}")
+            logging.info("Место уже в избранном для chat_id: %s", chat_id)
 
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в add_place_to_favorites: {str(e)}")
+        logging.error("Ошибка в add_place_to_favorites: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('map_'))
 def show_on_map(call):
@@ -605,27 +840,21 @@ def show_on_map(call):
         _, place_type, place_id = call.data.split('_')
         chat_id = call.message.chat.id
 
-        place = None
-        if "current_query" in user_data.get(chat_id, {}):
-            place = next((p for p in user_data[chat_id]["current_query"]["places"]
-                         if str(p["id"]) == place_id and p["type"] == place_type), None)
+        place = find_current_place(user_data.get(chat_id, {}), place_type, place_id)
 
         if not place:
-            favorites = get_favorites(chat_id)
-            place = next((p for p in favorites["venues"]
-                         if str(p["id"]) == place_id and p["type"] == place_type), None)
+            place = favorites_store.find_venue(chat_id, place_type, place_id)
 
         if place and "lat" in place and "lon" in place:
-            map_url = f"https://www.openstreetmap.org/?mlat={place['lat']}&mlon={place['lon']}#map=18/{place['lat']}/{place['lon']}"
-            bot.answer_callback_query(call.id, "Открываю карту...", url=map_url)
-            logging.debug(f"Открыта карта для места: {place['name']}")
+            bot.answer_callback_query(call.id, "Открываю карту...", url=build_map_url(place))
+            logging.debug("Открыта карта для места: %s", place['name'])
         else:
             bot.answer_callback_query(call.id, "Координаты места не найдены")
-            logging.warning(f"Координаты не найдены для места: {place_id}")
+            logging.warning("Координаты не найдены для места: %s", place_id)
 
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в show_on_map: {str(e)}")
+        logging.error("Ошибка в show_on_map: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('back_to_'))
 def handle_back(call):
@@ -640,25 +869,52 @@ def handle_back(call):
                 text="Выберите категорию:",
                 reply_markup=create_categories_keyboard()
             )
-            logging.debug(f"Возврат к категориям для chat_id: {chat_id}")
+            logging.debug("Возврат к категориям для chat_id: %s", chat_id)
         elif action == "places":
-            query_id = call.data.split('_')[3]
-            if "current_query" in user_data.get(chat_id, {}):
-                places = user_data[chat_id]["current_query"]["places"]
-                category = user_data[chat_id]["current_query"]["category"]
-                city = user_data[chat_id]["city"]
-
-                bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=call.message.message_id,
-                    text=f"🏢 {category} в {city} (найдено {len(places)}):",
-                    reply_markup=create_places_keyboard(places, query_id)
-                )
-                logging.debug(f"Возврат к списку мест для chat_id: {chat_id}")
+            parts = call.data.split('_')
+            query_id = parts[3]
+            page = int(parts[4]) if len(parts) > 4 else 0
+            result_set = result_sets.get(query_id, chat_id)
+            if result_set is None:
+                bot.answer_callback_query(call.id, RESULTS_EXPIRED_TEXT)
+                return
+
+            text, keyboard = build_places_page(result_set, page)
+            bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=call.message.message_id,
+                text=text,
+                reply_markup=keyboard
+            )
+            logging.debug("Возврат к списку мест для chat_id: %s", chat_id)
 
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в handle_back: {str(e)}")
+        logging.error("Ошибка в handle_back: %s", e)
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('page_'))
+def show_places_page(call):
+    try:
+        _, query_id, page = call.data.split('_')
+        chat_id = call.message.chat.id
+
+        result_set = result_sets.get(query_id, chat_id)
+        if result_set is None:
+            bot.answer_callback_query(call.id, RESULTS_EXPIRED_TEXT)
+            return
+
+        text, keyboard = build_places_page(result_set, int(page))
+        bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            text=text,
+            reply_markup=keyboard
+        )
+        logging.debug("Страница %s списка мест для chat_id: %s", page, chat_id)
+
+    except Exception as e:
+        bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
+        logging.error("Ошибка в show_places_page: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data == 'back')
 def handle_back_button(call):
@@ -669,7 +925,7 @@ def handle_back_button(call):
         reply_markup=None
     )
     bot.register_next_step_handler_by_chat_id(call.message.chat.id, process_city_for_activities)
-    logging.info(f"Обработка кнопки 'Назад' для chat_id: {call.message.chat.id}")
+    logging.info("Обработка кнопки 'Назад' для chat_id: %s", call.message.chat.id)
 
 @bot.callback_query_handler(func=lambda call: call.data == 'cancel')
 def handle_cancel_button(call):
@@ -680,7 +936,7 @@ def handle_cancel_button(call):
         reply_markup=create_main_keyboard()
     )
     cleanup_user_data(call.message.chat.id)
-    logging.info(f"Обработка кнопки 'Отмена' для chat_id: {call.message.chat.id}")
+    logging.info("Обработка кнопки 'Отмена' для chat_id: %s", call.message.chat.id)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('mood_'))
 def process_mood(call):
@@ -703,11 +959,11 @@ def process_mood(call):
             f"{ICONS['actions']['budget']} Выберите ваш бюджет:",
             reply_markup=create_inline_keyboard(['низкий', 'средний', 'неограниченный'], 'budget', add_back=True, add_cancel=True)
         )
-        logging.debug(f"Выбрано настроение: {mood} для chat_id: {chat_id}")
+        logging.debug("Выбрано настроение: %s для chat_id: %s", mood, chat_id)
 
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в process_mood: {str(e)}")
+        logging.error("Ошибка в process_mood: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('budget_'))
 def process_budget(call):
@@ -730,11 +986,11 @@ def process_budget(call):
             f"{ICONS['actions']['people']} Сколько человек будет участвовать?",
             reply_markup=create_inline_keyboard(['один', 'пара', 'компания'], 'people', add_back=True, add_cancel=True)
         )
-        logging.debug(f"Выбран бюджет: {budget} для chat_id: {chat_id}")
+        logging.debug("Выбран бюджет: %s для chat_id: %s", budget, chat_id)
 
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в process_budget: {str(e)}")
+        logging.error("Ошибка в process_budget: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('people_'))
 def process_people(call):
@@ -752,49 +1008,14 @@ def process_people(call):
             reply_markup=None
         )
 
-        key = f"{data['weather']}_{data['mood']}_{data['budget']}_{data['people']}"
-        options = ACTIVITIES.get(key, ["К сожалению, нет подходящих вариантов"])
+        options = get_activity_options(data)
         data['activities'] = options
 
-        query_id = str(uuid.uuid4())[:8]
+        query_id = new_query_id(short=True)
         data['query_id'] = query_id
 
-        result_text = (
-            f"Рекомендации для {data['city']}:\n\n"
-            f"{ICONS['weather'][data['weather']]} Погода: {data['weather']}\n"
-            f"{ICONS['mood'][data['mood']]} Настроение: {data['mood']}\n"
-            f"{ICONS['budget'][data['budget']]} Бюджет: {data['budget']}\n"
-            f"{ICONS['people'][data['people']]} Участники: {data['people']}\n\n"
-            "Варианты досуга:\n"
-        )
-
-        for i, option in enumerate(options, 1):
-            result_text += f"{i}. {option}\n"
-
-        keyboard = types.InlineKeyboardMarkup(row_width=2)
-        buttons = [
-            types.InlineKeyboardButton(
-                text=f"{ICONS['actions']['restart']} Новый поиск",
-                callback_data="restart"
-            ),
-            types.InlineKeyboardButton(
-                text=f"{ICONS['actions']['history']} История",
-                callback_data="show_history"
-            ),
-            types.InlineKeyboardButton(
-                text="🏢 Показать заведения",
-                callback_data=f"venues_{query_id}"
-            )
-        ]
-
-        for i, option in enumerate(options[:3], 1):
-            callback_data = f"fav_{query_id}_{i-1}"
-            buttons.append(types.InlineKeyboardButton(
-                text=f"⭐ Вариант {i}",
-                callback_data=callback_data
-            ))
-
-        keyboard.add(*buttons)
+        result_text = build_recommendations_text(data, options)
+        keyboard = create_recommendations_keyboard(options, query_id)
 
         user_data[chat_id]['current_activities'] = {
             'options': options,
@@ -803,17 +1024,17 @@ def process_people(call):
 
         bot.send_message(chat_id, result_text, reply_markup=keyboard)
         save_history(chat_id, call.from_user.username or call.from_user.first_name, data)
-        logging.info(f"Отправлены рекомендации для chat_id: {chat_id}")
+        logging.info("Отправлены рекомендации для chat_id: %s", chat_id)
 
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в process_people: {str(e)}")
+        logging.error("Ошибка в process_people: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data == "restart")
 def restart_bot(call):
     send_welcome(call.message)
     cleanup_user_data(call.message.chat.id)
-    logging.info(f"Перезапуск бота для chat_id: {call.message.chat.id}")
+    logging.info("Перезапуск бота для chat_id: %s", call.message.chat.id)
 
 @bot.callback_query_handler(func=lambda call: call.data == "show_history")
 def show_history_callback(call):
@@ -828,7 +1049,7 @@ def handle_fav_activity(call):
         activities_data = user_data.get(chat_id, {}).get('current_activities', {})
         if str(query_id) != activities_data.get('query_id', ''):
             bot.answer_callback_query(call.id, "Данные устарели, выполните новый поиск")
-            logging.warning(f"Устаревший query_id: {query_id} для chat_id: {chat_id}")
+            logging.warning("Устаревший query_id: %s для chat_id: %s", query_id, chat_id)
             return
 
         option_idx = int(option_idx)
@@ -836,17 +1057,17 @@ def handle_fav_activity(call):
 
         if add_favorite(chat_id, "activities", activity):
             bot.answer_callback_query(call.id, "Добавлено в избранное!")
-            logging.info(f"Активность добавлена в избранное: {activity} для chat_id: {chat_id}")
+            logging.info("Активность добавлена в избранное: %s для chat_id: %s", activity, chat_id)
         else:
             bot.answer_callback_query(call.id, "Уже в избранном")
-            logging.info(f"Активность уже в избранном: {activity} для chat_id: {chat_id}")
+            logging.info("Активность уже в избранном: %s для chat_id: %s", activity, chat_id)
 
     except (IndexError, ValueError) as e:
         bot.answer_callback_query(call.id, f"Ошибка: неверный вариант ({str(e)})")
-        logging.error(f"Ошибка в handle_fav_activity: {str(e)}")
+        logging.error("Ошибка в handle_fav_activity: %s", e)
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в handle_fav_activity: {str(e)}")
+        logging.error("Ошибка в handle_fav_activity: %s", e)
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('venues_'))
 def show_venues_for_query(call):
@@ -857,7 +1078,7 @@ def show_venues_for_query(call):
         data = user_data.get(chat_id, {})
         if 'city' not in data or str(data.get('query_id', '')) != query_id:
             bot.answer_callback_query(call.id, "Данные устарели, выполните новый поиск")
-            logging.warning(f"Устаревшие данные для query_id: {query_id} для chat_id: {chat_id}")
+            logging.warning("Устаревшие данные для query_id: %s для chat_id: %s", query_id, chat_id)
             return
 
         user_data[chat_id] = {
@@ -868,23 +1089,215 @@ def show_venues_for_query(call):
 
         bot.send_message(chat_id, f"Выберите категорию заведений в {data['city']}:",
                         reply_markup=create_categories_keyboard())
-        logging.debug(f"Запрошены категории заведений для города {data['city']} для chat_id: {chat_id}")
+        logging.debug("Запрошены категории заведений для города %s для chat_id: %s", data['city'], chat_id)
 
     except Exception as e:
         bot.answer_callback_query(call.id, f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в show_venues_for_query: {str(e)}")
+        logging.error("Ошибка в show_venues_for_query: %s", e)
 
 def cleanup_user_data(chat_id):
-    if chat_id in user_data:
-        keep_keys = ['city', 'step', 'current_query', 'current_activities']
-        user_data[chat_id] = {k: v for k, v in user_data[chat_id].items() if k in keep_keys}
-        logging.debug(f"Очищены данные пользователя для chat_id: {chat_id}")
+    session = user_data.get(chat_id)
+    if session is not None:
+        session.keep_only(['city', 'step', 'current_query', 'current_activities'])
+        logging.debug("Очищены данные пользователя для chat_id: %s", chat_id)
+
+metrics.instrument_handlers(bot)
+metrics.add_collector('places_cache', places_cache.stats)
+metrics.add_collector('weather_cache', weather_cache.stats)
+metrics.add_collector('result_sets', result_sets.stats)
+
+def start_metrics():
+    if METRICS_PORT:
+        MetricsServer(metrics, METRICS_HOST, METRICS_PORT).start()
+    if METRICS_SNAPSHOT_FILE:
+        writer = SnapshotWriter(metrics, METRICS_SNAPSHOT_FILE, METRICS_SNAPSHOT_INTERVAL)
+        writer.start()
+        atexit.register(writer.stop)
+
+# Прогрев кэшей для популярных городов (prewarm.py). Остановить прогрев
+# без перезапуска: создать файл PREWARM_KILL_FILE. Из нескольких процессов
+# прогревает только первый, остальные получают значения из общего кэша
+PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', '1') == '1' and BOT_WORKER_INDEX == 0
+PREWARM_KILL_FILE = os.getenv('PREWARM_KILL_FILE', 'prewarm.disabled')
+PREWARM_HISTORY_LIMIT = int(os.getenv('PREWARM_HISTORY_LIMIT', 5000))
+
+def refresh_weather(city, horizon):
+    key, query_city = resolve_city_alias(city)
+    left = weather_cache.ttl_left(key)
+    if left is not None and left > horizon:
+        return None
+
+    def refresh():
+        try:
+            weather_cache.set(key, fetch_weather_data(query_city))
+        except CityNotFoundError as e:
+            weather_cache.set_error(key, e)
+    return refresh
+
+def refresh_places(city, category, horizon):
+    index = poi_index.get()
+    if index is not None and index.has(city, category):
+        return None
+    key = (normalize_city(city), category)
+    left = places_cache.ttl_left(key)
+    if left is not None and left > horizon:
+        return None
+    return lambda: places_cache.set(key, fetch_places(city, category))
+
+def history_cities():
+    return [entry.get('city') for entry in history_store.iter_entries(PREWARM_HISTORY_LIMIT)]
+
+prewarmer = Prewarmer(
+    refresh_weather,
+    refresh_places,
+    CATEGORY_MAPPING,
+    history=history_cities,
+    tracker=demand_tracker,
+    top_cities=int(os.getenv('PREWARM_TOP_CITIES', 50)),
+    budget=int(os.getenv('PREWARM_BUDGET', 200)),
+    rate=float(os.getenv('PREWARM_RATE', 1.0)),
+    interval=int(os.getenv('PREWARM_INTERVAL', 600)),
+    kill_switch=lambda: os.path.exists(PREWARM_KILL_FILE)
+)
 
-if __name__ == '__main__':
+def start_prewarm():
+    if PREWARM_ENABLED:
+        prewarmer.start()
+
+# Запуск: логирование, проверка настроек, общее хранилище для кэшей и
+# фоновая предзагрузка данных (сессии - первыми: они нужны первому же
+# обновлению). Повторный вызов ничего не делает
+PRELOAD_ENABLED = os.getenv('PRELOAD_ENABLED', '1') == '1'
+preload_objects = [user_data, favorites_store, history_store, area_resolver, poi_index,
+                   CITY_ALIASES, activity_catalog]
+configured = False
+
+def preload():
+    for obj in preload_objects:
+        try:
+            obj.lazy_instance()
+        except Exception as e:
+            logging.error("Ошибка предзагрузки %r: %s", obj, e)
+
+def configure():
+    global configured
+    if configured:
+        return
+    setup_logging(level=LOG_LEVEL, filename=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT)
+    validate_config()
+    places_cache.shared = weather_cache.shared = shared_state()
+    metrics.add_collector('sessions', lambda: user_data.stats())
+    if PRELOAD_ENABLED:
+        threading.Thread(target=preload, name="preload", daemon=True).start()
+    configured = True
+
+# Синхронный бот: пул обработчиков по чатам и очередь отправки
+def create_app():
+    global send_queue
+    configure()
+    if send_queue is not None:
+        return bot
+    bot.threaded = True
+    bot.worker_pool = ChatDispatcher(bot, num_threads=BOT_WORKERS, max_pending=BOT_MAX_PENDING)
+    send_queue = SendQueue(send_limits, workers=TG_SEND_WORKERS, max_retries=TG_MAX_RETRIES)
+    apihelper.CUSTOM_REQUEST_SENDER = send_queue
+    metrics.add_collector('send_queue', send_queue.stats)
+    logging.info("Бот успешно инициализирован")
+    return bot
+
+# Сохранение при остановке - только открытых хранилищ
+def flush_stores():
+    for store in (favorites_store, user_data):
+        if store.lazy_created:
+            store.flush()
+
+def run_polling():
     logging.info("Бот запущен (OSM версия)...")
+    bot.remove_webhook()
+    signal.signal(signal.SIGTERM, lambda signum, frame: bot.stop_polling())
+    start_metrics()
+    start_prewarm()
     try:
         bot.infinity_polling(timeout=10, long_polling_timeout=5)
     except Exception as e:
-        logging.error(f"Ошибка при запуске бота: {e}")
+        logging.error("Ошибка при запуске бота: %s", e)
         time.sleep(5)
-        bot.infinity_polling(timeout=10, long_polling_timeout=5)
\ No newline at end of file
+        bot.infinity_polling(timeout=10, long_polling_timeout=5)
+    finally:
+        prewarmer.stop()
+        send_queue.close()
+        flush_stores()
+
+def shutdown_worker():
+    prewarmer.stop()
+    bot.worker_pool.join(30)
+    send_queue.close()
+    flush_stores()
+
+# Процесс-обработчик: обновления своих чатов из очереди WorkerPool
+def run_worker(index, updates):
+    create_app()
+    logging.info("Процесс-обработчик %s из %s запущен", index, BOT_WORKER_COUNT)
+    start_metrics()
+    start_prewarm()
+    try:
+        serve_updates(updates, lambda body: process_update(bot, body))
+    finally:
+        shutdown_worker()
+        logging.info("Процесс-обработчик %s остановлен", index)
+
+def run_webhook_workers(server, processes):
+    pool = WorkerPool(run_worker, processes)
+    server.route = pool.route
+    metrics.add_collector('workers', pool.stats)
+    pool.start()
+    return pool
+
+def run_webhook(host, port, path, public_url, secret_token, processes=1):
+    logging.info("Бот запущен (OSM версия, webhook)...")
+    server = WebhookServer(bot, host=host, port=port, path=path, secret_token=secret_token)
+    pool = run_webhook_workers(server, processes) if processes > 1 else None
+    if public_url:
+        bot.set_webhook(url=public_url.rstrip('/') + path, secret_token=secret_token)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    server.start()
+    start_metrics()
+    if pool is None:
+        start_prewarm()
+    stop.wait()
+    logging.info("Получен сигнал остановки, дочитываем очередь обновлений")
+    prewarmer.stop()
+    server.shutdown()
+    if pool is not None:
+        pool.stop()
+    send_queue.close()
+    flush_stores()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="АнТиСкУкА БОТ")
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default=os.getenv('BOT_MODE', 'polling'))
+    parser.add_argument('--host', default=os.getenv('WEBHOOK_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('WEBHOOK_PORT', 8443)))
+    parser.add_argument('--path', default=os.getenv('WEBHOOK_PATH', '/webhook'))
+    parser.add_argument('--public-url', default=os.getenv('WEBHOOK_URL'))
+    parser.add_argument('--processes', type=int, default=int(os.getenv('BOT_PROCESSES', 1)),
+                        help="число процессов-обработчиков (только webhook)")
+    args = parser.parse_args(argv)
+    if args.processes > 1 and args.mode != 'webhook':
+        parser.error("--processes больше 1 поддерживается только в режиме webhook")
+    if args.processes > 1 and not STATE_BACKEND:
+        parser.error("--processes больше 1 требует общего хранилища: задайте STATE_BACKEND")
+
+    create_app()
+    if args.mode == 'webhook':
+        run_webhook(args.host, args.port, args.path, args.public_url, os.getenv('WEBHOOK_SECRET'),
+                    args.processes)
+    else:
+        run_polling()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,314 @@
+import json
+import asyncio
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Ограниченный кэш в памяти: TTL, вытеснение LRU, бюджет по памяти
+# и single-flight - одновременные промахи по одному ключу
+# приводят к одному вызову загрузчика.
+#
+# Дополнительно:
+# - stale_ttl: после истечения TTL значение ещё stale_ttl секунд отдаётся
+#   сразу, а обновление выполняется в фоне (stale-while-revalidate) -
+#   в небольшом пуле потоков, общем для всех кэшей;
+# - negative_ttl + is_negative: ошибки, для которых is_negative(error)
+#   истинно (например, неизвестный город), кэшируются и выбрасываются
+#   повторно без обращения к источнику;
+# - shared: второй уровень в общем хранилище процессов (state_backend.py).
+#   При промахе в памяти значение сначала ищется там, загруженное -
+#   записывается туда со сроком ttl, так что источник вызывает один процесс.
+
+REFRESH_WORKERS = 4
+
+# Потоки пула создаются при первом фоновом обновлении, не при импорте
+_refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+
+
+def estimate_size(value):
+    try:
+        return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 1024
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _Entry:
+    __slots__ = ('value', 'error', 'expires_at', 'stale_until', 'size')
+
+    def __init__(self, value, error, expires_at, stale_until, size):
+        self.value = value
+        self.error = error
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.size = size
+
+
+class TTLCache:
+    def __init__(self, name, ttl, max_entries=1024, max_bytes=None, sizeof=estimate_size,
+                 stale_ttl=0, negative_ttl=0, is_negative=None, shared=None, clock=time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.is_negative = is_negative
+        self.shared = shared
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._ainflight = {}
+        self._tasks = set()
+        self._bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.error is not None:
+                return None
+            if entry.expires_at <= self.clock():
+                return None
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def set(self, key, value, ttl=None):
+        self._set_local(key, value, ttl)
+        self._shared_set(key, value, ttl)
+
+    def _set_local(self, key, value, ttl=None):
+        size = self.sizeof(value) if self.max_bytes else 0
+        ttl = self.ttl if ttl is None else ttl
+        now = self.clock()
+        self._store(key, _Entry(value, None, now + ttl, now + ttl + self.stale_ttl, size))
+
+    def set_error(self, key, error, ttl=None):
+        ttl = self.negative_ttl if ttl is None else ttl
+        expires_at = self.clock() + ttl
+        self._store(key, _Entry(None, error, expires_at, expires_at, 0))
+
+    def _store(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes and entry.size > self.max_bytes:
+                logging.debug("Кэш %s: значение %s байт больше бюджета, не кэшируем", self.name, entry.size)
+                return
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    # Поиск под блокировкой: возвращает (entry, stale, call, leader);
+    # call is None означает свежее попадание
+    def _lookup(self, key, inflight, new_call):
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                if entry.error is not None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return entry, False, None, False
+
+            stale = entry is not None and entry.error is None and entry.stale_until > now
+            call = inflight.get(key)
+            leader = call is None
+            if leader:
+                call = inflight[key] = new_call()
+
+            if stale:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+            elif leader:
+                self.misses += 1
+            else:
+                self.coalesced += 1
+            return entry, stale, call, leader
+
+    def get_or_load(self, key, loader):
+        entry, stale, call, leader = self._lookup(key, self._inflight, _Call)
+        if call is None:
+            if entry.error is not None:
+                raise entry.error
+            return entry.value
+
+        if stale:
+            if leader:
+                _refresh_executor.submit(self._load, key, loader, call, False)
+            return entry.value
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        return self._load(key, loader, call, True)
+
+    def _load(self, key, loader, call, reraise):
+        try:
+            shared = self._shared_get(key)
+            if shared is not None:
+                call.value, ttl = shared
+                self._set_local(key, call.value, ttl)
+            else:
+                call.value = loader()
+                self.set(key, call.value)
+            return call.value
+        except Exception as e:
+            call.error = e
+            if self.negative_ttl and self.is_negative and self.is_negative(e):
+                self.set_error(key, e)
+            if reraise:
+                raise
+            logging.error("Кэш %s: ошибка фонового обновления %s: %s", self.name, key, e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    # Асинхронный вариант: loader - корутинная функция, ожидающие
+    # одного ключа разделяют один asyncio.Future
+    async def aget_or_load(self, key, loader):
+        loop = asyncio.get_running_loop()
+        entry, stale, future, leader = self._lookup(key, self._ainflight, loop.create_future)
+        if future is None:
+            if entry.error is not None:
+                raise entry.error
+            return entry.value
+
+        if stale:
+            if leader:
+                task = loop.create_task(self._aload(key, loader, future, False))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return entry.value
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        return await self._aload(key, loader, future, True)
+
+    async def _aload(self, key, loader, future, reraise):
+        try:
+            shared = await asyncio.to_thread(self._shared_get, key) if self.shared is not None else None
+            if shared is not None:
+                value, ttl = shared
+                self._set_local(key, value, ttl)
+            else:
+                value = await loader()
+                self._set_local(key, value)
+                if self.shared is not None:
+                    await asyncio.to_thread(self._shared_set, key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим, не логируем его повторно
+            future.exception()
+            if self.negative_ttl and self.is_negative and self.is_negative(e):
+                self.set_error(key, e)
+            if reraise:
+                raise
+            logging.error("Кэш %s: ошибка фонового обновления %s: %s", self.name, key, e)
+        finally:
+            with self._lock:
+                self._ainflight.pop(key, None)
+
+    # Значение в общем хранилище: [срок по time.time(), значение];
+    # ошибки хранилища не мешают работе кэша в памяти
+    def _shared_get(self, key):
+        if self.shared is None:
+            return None
+        try:
+            data = self.shared.get(self.name, json.dumps(key, ensure_ascii=False))
+        except Exception as e:
+            self.shared_errors += 1
+            logging.warning("Кэш %s: ошибка общего хранилища: %s", self.name, e)
+            return None
+        if data is None:
+            return None
+        expires_at, value = json.loads(data)
+        left = expires_at - time.time()
+        if left <= 0:
+            return None
+        self.shared_hits += 1
+        return value, left
+
+    def _shared_set(self, key, value, ttl=None):
+        if self.shared is None:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            payload = json.dumps([time.time() + ttl, value], ensure_ascii=False)
+            self.shared.set(self.name, json.dumps(key, ensure_ascii=False), payload, ttl=ttl)
+        except Exception as e:
+            self.shared_errors += 1
+            logging.warning("Кэш %s: ошибка общего хранилища: %s", self.name, e)
+
+    # Сколько секунд осталось до истечения записи (None - записи нет)
+    def ttl_left(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return entry.expires_at - self.clock()
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'shared_hits': self.shared_hits,
+                'shared_errors': self.shared_errors,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
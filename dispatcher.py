@@ -0,0 +1,137 @@
+import threading
+import logging
+from collections import deque
+
+# Пул обработчиков обновлений с сериализацией по chat_id.
+# Обновления одного чата выполняются строго по порядку и не параллельно
+# (машина состояний user_data остаётся согласованной), разные чаты
+# обрабатываются одновременно. Совместим по интерфейсу с
+# telebot.util.ThreadPool и подставляется вместо bot.worker_pool.
+
+DISPATCH_WORKERS = 8
+DISPATCH_MAX_PENDING = 1000
+
+
+def chat_key(args):
+    # Первый аргумент задачи telebot - Message или CallbackQuery
+    if not args:
+        return None
+    update = args[0]
+    chat = getattr(update, 'chat', None)
+    if chat is None:
+        message = getattr(update, 'message', None)
+        chat = getattr(message, 'chat', None)
+    return getattr(chat, 'id', None)
+
+
+class ChatDispatcher:
+    def __init__(self, telebot=None, num_threads=DISPATCH_WORKERS, max_pending=DISPATCH_MAX_PENDING,
+                 put_timeout=None, key_func=chat_key):
+        self.telebot = telebot
+        self.num_threads = num_threads
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.key_func = key_func
+
+        self._cond = threading.Condition()
+        self._space = threading.Condition(self._cond)
+        self._chats = {}
+        self._ready = deque()
+        self._active = set()
+        self._pending = 0
+        self._running = True
+
+        self.exception_event = threading.Event()
+        self.exception_info = None
+        self.rejected = 0
+
+        self.workers = [
+            threading.Thread(target=self._worker, name=f"dispatch-{i}", daemon=True)
+            for i in range(num_threads)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    @property
+    def pending(self):
+        with self._cond:
+            return self._pending
+
+    # Постановка задачи; при переполнении очереди блокирует вызывающий поток
+    # (поток long polling), что и даёт обратное давление на приём обновлений
+    def put(self, func, *args, **kwargs):
+        key = self.key_func(args)
+        if key is None:
+            key = object()
+        with self._cond:
+            if not self._space.wait_for(
+                lambda: self._pending < self.max_pending or not self._running,
+                timeout=self.put_timeout
+            ):
+                self.rejected += 1
+                logging.warning("Очередь обработчиков переполнена, обновление для %s отброшено", key)
+                return False
+            if not self._running:
+                return False
+            queue = self._chats.get(key)
+            if queue is None:
+                queue = self._chats[key] = deque()
+            queue.append((func, args, kwargs))
+            self._pending += 1
+            if key not in self._active and len(queue) == 1:
+                self._ready.append(key)
+                self._cond.notify()
+        return True
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ready or not self._running)
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                self._active.add(key)
+                func, args, kwargs = self._chats[key].popleft()
+
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self.on_exception(e)
+
+            with self._cond:
+                self._active.discard(key)
+                self._pending -= 1
+                if self._chats[key]:
+                    self._ready.append(key)
+                    self._cond.notify()
+                else:
+                    del self._chats[key]
+                self._space.notify_all()
+
+    def on_exception(self, exc):
+        handled = False
+        if self.telebot is not None and self.telebot.exception_handler is not None:
+            handled = self.telebot.exception_handler.handle(exc)
+        if not handled:
+            logging.error("Ошибка в обработчике: %s", exc)
+            self.exception_info = exc
+            self.exception_event.set()
+
+    def raise_exceptions(self):
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self):
+        self.exception_event.clear()
+
+    def join(self, timeout=None):
+        with self._cond:
+            return self._space.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for worker in self.workers:
+            if worker is not threading.current_thread():
+                worker.join()
@@ -0,0 +1,242 @@
+import os
+import copy
+import json
+import threading
+import logging
+
+# Избранное в памяти процесса с отложенной записью на диск.
+# favorites.json читается один раз, изменения сбрасываются пачкой
+# через временный файл и атомарный os.replace.
+# SharedFavoritesStore - то же избранное в общем хранилище
+# (state_backend.py) для нескольких процессов бота.
+
+FAVORITES_FLUSH_INTERVAL = 5
+FAVORITES_NAMESPACE = 'favorites'
+MIGRATION_NAMESPACE = 'migrations'
+
+
+def empty_favorites():
+    return {"venues": [], "activities": [], "queries": []}
+
+
+def venue_key(place_type, place_id):
+    return (place_type, str(place_id))
+
+
+class FavoritesStore:
+    def __init__(self, path, flush_interval=FAVORITES_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._data = {}
+        self._venues = {}
+        self._activities = {}
+        self._dirty = False
+        self._stop = threading.Event()
+        self._flusher = None
+        self._load()
+
+    def _load(self):
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                logging.error("Ошибка при загрузке из %s: %s", self.path, e)
+        for user_id, favorites in data.items():
+            record = empty_favorites()
+            record.update(favorites)
+            self._data[user_id] = record
+            self._index(user_id, record)
+        logging.info("Избранное загружено из %s: %s пользователей", self.path, len(self._data))
+
+    def _index(self, user_id, record):
+        self._venues[user_id] = {venue_key(v.get('type'), v.get('id')): v for v in record["venues"]}
+        self._activities[user_id] = set(record["activities"])
+
+    # Возвращается копия: вызывающий код не меняет запись в обход индексов
+    def get(self, user_id):
+        with self._lock:
+            return copy.deepcopy(self._data.get(str(user_id), empty_favorites()))
+
+    def has_venue(self, user_id, place_type, place_id):
+        with self._lock:
+            return venue_key(place_type, place_id) in self._venues.get(str(user_id), {})
+
+    def find_venue(self, user_id, place_type, place_id):
+        with self._lock:
+            return self._venues.get(str(user_id), {}).get(venue_key(place_type, place_id))
+
+    def has_activity(self, user_id, activity):
+        with self._lock:
+            return activity in self._activities.get(str(user_id), ())
+
+    def add(self, user_id, item_type, item):
+        user_id = str(user_id)
+        with self._lock:
+            if user_id not in self._data:
+                self._data[user_id] = empty_favorites()
+                self._index(user_id, self._data[user_id])
+
+            if item_type == "venues":
+                key = venue_key(item.get('type'), item.get('id'))
+                if key in self._venues[user_id]:
+                    return False
+                self._venues[user_id][key] = item
+            elif item_type == "activities":
+                if item in self._activities[user_id]:
+                    return False
+                self._activities[user_id].add(item)
+            elif item in self._data[user_id][item_type]:
+                return False
+
+            self._data[user_id][item_type].append(item)
+            self._dirty = True
+            self._ensure_flusher()
+        return True
+
+    def remove(self, user_id, item_type, item):
+        user_id = str(user_id)
+        with self._lock:
+            record = self._data.get(user_id)
+            if record is None:
+                return False
+
+            if item_type == "venues":
+                key = venue_key(item.get('type'), item.get('id'))
+                if self._venues[user_id].pop(key, None) is None:
+                    return False
+                record["venues"] = [v for v in record["venues"] if venue_key(v.get('type'), v.get('id')) != key]
+            elif item_type == "activities":
+                if item not in self._activities[user_id]:
+                    return False
+                self._activities[user_id].discard(item)
+                record["activities"].remove(item)
+            elif item in record[item_type]:
+                record[item_type].remove(item)
+            else:
+                return False
+
+            self._dirty = True
+            self._ensure_flusher()
+        return True
+
+    def _ensure_flusher(self):
+        if self._flusher is None and self.flush_interval:
+            self._flusher = threading.Thread(target=self._flush_loop, name="favorites-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    # Принудительный сброс на диск (вызывается при остановке бота)
+    def flush(self):
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._dirty:
+                return False
+            payload = json.dumps(self._data, indent=2, ensure_ascii=False)
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            logging.debug("Избранное сохранено в %s", self.path)
+            return True
+        except Exception as e:
+            with self._lock:
+                self._dirty = True
+            logging.error("Ошибка при сохранении в %s: %s", self.path, e)
+            return False
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+
+# Запись пользователя читается из хранилища при первом обращении и дальше
+# берётся из памяти: обновления одного чата обрабатывает один процесс.
+# Изменение сразу записывается в хранилище, отложенного сброса нет
+class SharedFavoritesStore(FavoritesStore):
+    def __init__(self, backend, path=None):
+        self.backend = backend
+        super().__init__(path, flush_interval=0)
+
+    # favorites.json переносится в хранилище один раз - процессом,
+    # который первым поставил отметку о миграции
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        if not self.backend.add(MIGRATION_NAMESPACE, FAVORITES_NAMESPACE, self.path):
+            return
+        super()._load()
+        self.backend.set_many(FAVORITES_NAMESPACE, [
+            (user_id, json.dumps(record, ensure_ascii=False)) for user_id, record in self._data.items()
+        ])
+        os.replace(self.path, self.path + '.migrated')
+        logging.info("Избранное перенесено из %s в общее хранилище", self.path)
+
+    def _record(self, user_id):
+        record = self._data.get(user_id)
+        if record is None:
+            record = empty_favorites()
+            data = self.backend.get(FAVORITES_NAMESPACE, user_id)
+            if data is not None:
+                record.update(json.loads(data))
+            self._data[user_id] = record
+            self._index(user_id, record)
+        return record
+
+    def get(self, user_id):
+        with self._lock:
+            return copy.deepcopy(self._record(str(user_id)))
+
+    def has_venue(self, user_id, place_type, place_id):
+        with self._lock:
+            self._record(str(user_id))
+            return super().has_venue(user_id, place_type, place_id)
+
+    def find_venue(self, user_id, place_type, place_id):
+        with self._lock:
+            self._record(str(user_id))
+            return super().find_venue(user_id, place_type, place_id)
+
+    def has_activity(self, user_id, activity):
+        with self._lock:
+            self._record(str(user_id))
+            return super().has_activity(user_id, activity)
+
+    def add(self, user_id, item_type, item):
+        user_id = str(user_id)
+        with self._lock:
+            self._record(user_id)
+            if not super().add(user_id, item_type, item):
+                return False
+            self._dirty = False
+            payload = json.dumps(self._data[user_id], ensure_ascii=False)
+        self.backend.set(FAVORITES_NAMESPACE, user_id, payload)
+        return True
+
+    def remove(self, user_id, item_type, item):
+        user_id = str(user_id)
+        with self._lock:
+            self._record(user_id)
+            if not super().remove(user_id, item_type, item):
+                return False
+            self._dirty = False
+            payload = json.dumps(self._data[user_id], ensure_ascii=False)
+        self.backend.set(FAVORITES_NAMESPACE, user_id, payload)
+        return True
+
+    def flush(self):
+        return False
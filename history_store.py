@@ -0,0 +1,222 @@
+import os
+import json
+import sqlite3
+import threading
+import logging
+
+# Хранилище истории запросов: журнал только на добавление в SQLite (WAL)
+# с индексом по user_id. Запись - одна вставка, чтение - последние N записей
+# пользователя, без разбора истории всех пользователей. Компактизация
+# запускается в фоновом потоке каждые compact_every записей.
+# SharedHistoryStore - история в общем хранилище (state_backend.py)
+# для нескольких процессов бота.
+
+HISTORY_DB = 'history.db'
+HISTORY_KEEP_PER_USER = 50
+HISTORY_COMPACT_EVERY = 1000
+HISTORY_NAMESPACE = 'history'
+HISTORY_RECENT_KEY = '*'
+HISTORY_RECENT_KEEP = 5000
+MIGRATION_NAMESPACE = 'migrations'
+
+
+def read_legacy_json(json_path):
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error("Ошибка при чтении %s для миграции: %s", json_path, e)
+        return None
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_DB, keep_per_user=HISTORY_KEEP_PER_USER,
+                 compact_every=HISTORY_COMPACT_EVERY):
+        self.path = path
+        self.keep_per_user = keep_per_user
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._compactor = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id TEXT NOT NULL,"
+            " entry TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS history_user ON history (user_id, seq)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def append(self, user_id, entry):
+        payload = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO history (user_id, entry) VALUES (?, ?)",
+                (str(user_id), payload)
+            )
+            self._writes += 1
+            if self.compact_every and self._writes % self.compact_every == 0:
+                self._start_compaction()
+
+    # Запись не ждёт компактизации; если предыдущая ещё идёт, новая не запускается
+    def _start_compaction(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_quietly, name="history-compact", daemon=True)
+        self._compactor.start()
+
+    def _compact_quietly(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logging.error("Ошибка при компактизации истории: %s", e)
+
+    def last(self, user_id, limit=5):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry FROM history WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+                (str(user_id), limit)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def users(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user_id FROM history").fetchall()
+        return [row[0] for row in rows]
+
+    def iter_entries(self, limit=None):
+        query = "SELECT entry FROM history ORDER BY seq DESC"
+        params = ()
+        if limit:
+            query += " LIMIT ?"
+            params = (limit,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # Компактизация: оставляем последние keep_per_user записей каждого
+    # пользователя и обрезаем WAL, чтобы размер на диске был ограничен
+    def compact(self):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM history WHERE seq IN ("
+                " SELECT seq FROM ("
+                "  SELECT seq, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY seq DESC) AS rn"
+                "  FROM history)"
+                " WHERE rn > ?)",
+                (self.keep_per_user,)
+            )
+            removed = cursor.rowcount
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logging.info("Компактизация истории: удалено %s записей", removed)
+        return removed
+
+    # Миграция со старого формата history.json ({user_id: [entry, ...]}).
+    # Отметка о переносе пишется в той же транзакции, что и записи: если
+    # процесс остановился до переименования файла, повторный запуск только
+    # переименует его, не дублируя историю
+    def migrate_from_json(self, json_path):
+        if not os.path.exists(json_path):
+            return 0
+        legacy = read_legacy_json(json_path)
+        if legacy is None:
+            return 0
+
+        rows = [
+            (str(user_id), json.dumps(entry, ensure_ascii=False))
+            for user_id, entries in legacy.items()
+            for entry in entries
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            marked = self._conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)",
+                ('migrated:' + json_path, str(len(rows)))
+            ).rowcount
+            if marked:
+                self._conn.executemany("INSERT INTO history (user_id, entry) VALUES (?, ?)", rows)
+            self._conn.execute("COMMIT")
+        os.replace(json_path, json_path + '.migrated')
+        if not marked:
+            logging.warning("История из %s уже перенесена ранее, файл переименован", json_path)
+            return 0
+        logging.info("История перенесена из %s: %s записей", json_path, len(rows))
+        return len(rows)
+
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self._conn.close()
+
+
+
+# Списки в хранилище: последние keep_per_user записей каждого пользователя
+# и общий список последних keep_recent записей (для прогрева кэшей).
+# Обрезка - при каждой записи, отдельная компактизация не нужна
+class SharedHistoryStore:
+    def __init__(self, backend, keep_per_user=HISTORY_KEEP_PER_USER, keep_recent=HISTORY_RECENT_KEEP):
+        self.backend = backend
+        self.keep_per_user = keep_per_user
+        self.keep_recent = keep_recent
+
+    def append(self, user_id, entry):
+        payload = json.dumps(entry, ensure_ascii=False)
+        self.backend.push(HISTORY_NAMESPACE, user_id, payload, keep=self.keep_per_user)
+        self.backend.push(HISTORY_NAMESPACE, HISTORY_RECENT_KEY, payload, keep=self.keep_recent)
+
+    def last(self, user_id, limit=5):
+        return [json.loads(value) for value in self.backend.range(HISTORY_NAMESPACE, user_id, limit)]
+
+    def iter_entries(self, limit=None):
+        values = self.backend.range(HISTORY_NAMESPACE, HISTORY_RECENT_KEY, limit or self.keep_recent)
+        return [json.loads(value) for value in reversed(values)]
+
+    def compact(self):
+        return 0
+
+    def _import(self, source, entries):
+        if not self.backend.add(MIGRATION_NAMESPACE, HISTORY_NAMESPACE, source):
+            return 0
+        count = 0
+        for entry in entries:
+            self.append(entry.get('user_id'), entry)
+            count += 1
+        logging.info("История перенесена из %s в общее хранилище: %s записей", source, count)
+        return count
+
+    def migrate_from_json(self, json_path):
+        if not os.path.exists(json_path):
+            return 0
+        legacy = read_legacy_json(json_path)
+        if legacy is None:
+            return 0
+        count = self._import(json_path, (
+            dict(entry, user_id=entry.get('user_id', user_id))
+            for user_id, entries in legacy.items()
+            for entry in entries
+        ))
+        if count:
+            os.replace(json_path, json_path + '.migrated')
+        return count
+
+    # Перенос из локальной базы HistoryStore (history.db)
+    def migrate_from_db(self, db_path):
+        if not os.path.exists(db_path):
+            return 0
+        store = HistoryStore(db_path, compact_every=0)
+        try:
+            entries = store.iter_entries()
+        finally:
+            store.close()
+        count = self._import(db_path, reversed(entries))
+        if count:
+            os.replace(db_path, db_path + '.migrated')
+        return count
+
+    def close(self):
+        pass
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import logging
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# aiohttp нужен только асинхронному режиму и загружается при создании
+# первого AsyncHttpClient (load_aiohttp), синхронный бот его не импортирует
+aiohttp = None
+
+# Общий HTTP-клиент для внешних API: пул соединений с keep-alive на каждый
+# upstream, gzip, раздельные таймауты подключения и чтения, ограниченные
+# повторы с джиттером для 429/5xx и автомат-предохранитель (circuit breaker).
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Адрес для логов: без строки запроса, в ней бывают ключи API (appid=...).
+# Текст исключений requests тоже содержит URL, поэтому в лог - только класс
+def log_url(url):
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self.clock() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            # В полуоткрытом состоянии пропускаем один пробный запрос
+            if state == 'half-open' and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info("Предохранитель %s закрыт", self.name)
+            self._failures = 0
+            self._opened_at = None
+            self._probe = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe:
+                    logging.warning("Предохранитель %s открыт после %s ошибок", self.name, self._failures)
+                self._opened_at = self.clock()
+                self._probe = False
+
+
+class HttpClient:
+    def __init__(self, name, connect_timeout=3.05, read_timeout=10, retries=2,
+                 backoff_base=0.3, backoff_max=5, pool_size=10, breaker=None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(name)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    # Исход для предохранителя фиксируется в finally: любое исключение
+    # (не только ошибки соединения) считается отказом, иначе пробный запрос
+    # полуоткрытого предохранителя так и остался бы незавершённым
+    def request(self, method, url, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name}: upstream временно недоступен")
+        kwargs.setdefault('timeout', self.timeout)
+
+        ok = False
+        try:
+            response = self._request_with_retries(method, url, kwargs)
+            ok = response.status_code not in RETRY_STATUSES
+            return response
+        finally:
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def _request_with_retries(self, method, url, kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries:
+                    raise
+                logging.warning("%s: ошибка соединения с %s (%s), повтор %s",
+                                self.name, log_url(url), type(e).__name__, attempt + 1)
+                self._sleep(attempt, None)
+                attempt += 1
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                logging.warning("%s: статус %s от %s, повтор %s",
+                                self.name, response.status_code, log_url(url), attempt + 1)
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+                self._sleep(attempt, retry_after)
+                attempt += 1
+                continue
+            return response
+
+    def _sleep(self, attempt, retry_after):
+        time.sleep(backoff_delay(attempt, retry_after, self.backoff_base, self.backoff_max))
+
+    def close(self):
+        self.session.close()
+
+
+def backoff_delay(attempt, retry_after, backoff_base, backoff_max):
+    delay = None
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            delay = None
+    if delay is None:
+        # Полный джиттер: случайная пауза до экспоненциального предела
+        delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+    return min(delay, backoff_max)
+
+
+# Ответ асинхронного клиента. При stream=True тело не читается заранее:
+# iter_chunked() отдаёт его частями, close() освобождает соединение
+class AsyncResponse:
+    def __init__(self, status, headers, body, raw=None):
+        self.status_code = status
+        self.headers = headers
+        self.content = body
+        self.raw = raw
+
+    def iter_chunked(self, size):
+        return self.raw.content.iter_chunked(size)
+
+    def close(self):
+        if self.raw is not None:
+            self.raw.release()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+
+def load_aiohttp():
+    global aiohttp
+    if aiohttp is None:
+        try:
+            import aiohttp as module
+        except ImportError:
+            raise RuntimeError("Для асинхронного режима требуется пакет aiohttp")
+        aiohttp = module
+    return aiohttp
+
+
+# Асинхронный клиент на aiohttp с теми же повторами и предохранителем.
+# Сессия создаётся лениво внутри работающего цикла событий.
+class AsyncHttpClient:
+    def __init__(self, name, connect_timeout=3.05, read_timeout=10, retries=2,
+                 backoff_base=0.3, backoff_max=5, pool_size=100, breaker=None):
+        load_aiohttp()
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker(name)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+                headers={'Accept-Encoding': 'gzip, deflate'}
+            )
+        return self._session
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def request(self, method, url, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name}: upstream временно недоступен")
+
+        ok = False
+        try:
+            result = await self._request_with_retries(method, url, kwargs)
+            ok = result.status_code not in RETRY_STATUSES
+            return result
+        finally:
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    async def _request_with_retries(self, method, url, kwargs):
+        session = self._get_session()
+        stream = kwargs.pop('stream', False)
+        attempt = 0
+        while True:
+            try:
+                if stream:
+                    response = await session.request(method, url, **kwargs)
+                    result = AsyncResponse(response.status, response.headers, None, response)
+                else:
+                    async with session.request(method, url, **kwargs) as response:
+                        body = await response.read()
+                        result = AsyncResponse(response.status, response.headers, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise
+                logging.warning("%s: ошибка соединения с %s (%s), повтор %s",
+                                self.name, log_url(url), type(e).__name__, attempt + 1)
+                await asyncio.sleep(backoff_delay(attempt, None, self.backoff_base, self.backoff_max))
+                attempt += 1
+                continue
+
+            if result.status_code in RETRY_STATUSES and attempt < self.retries:
+                logging.warning("%s: статус %s от %s, повтор %s",
+                                self.name, result.status_code, log_url(url), attempt + 1)
+                retry_after = result.headers.get('Retry-After')
+                result.close()
+                await asyncio.sleep(backoff_delay(attempt, retry_after, self.backoff_base, self.backoff_max))
+                attempt += 1
+                continue
+            return result
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,184 @@
+import json
+import functools
+import logging
+
+from telebot import types
+
+# Клавиатуры бота. Статические клавиатуры (главное меню, категории,
+# выбор настроения/бюджета/людей) строятся один раз: результат хранится
+# уже сериализованным в JSON (FrozenMarkup) и отдаётся в reply_markup как есть.
+# Клавиатура мест собирается из заготовленных JSON-фрагментов с подстановкой
+# названий и callback_data - без промежуточных объектов кнопок.
+
+KEYBOARD_CACHE_SIZE = 128
+
+# Списки иконок
+ICONS = {
+    'weather': {
+        'ясно': '☀️',
+        'облачно': '⛅️',
+        'пасмурно': '☁️',
+        'дождь': '🌧',
+        'снег': '❄️',
+        'разнообразно': '🌈'
+    },
+    'mood': {
+        'активное': '🏃‍♂️',
+        'расслабленное': '🧘‍♀️',
+        'экстремальное': '⚡'
+    },
+    'budget': {
+        'низкий': '💰',
+        'средний': '💵',
+        'неограниченный': '💎'
+    },
+    'people': {
+        'один': '👤',
+        'пара': '👫',
+        'компания': '👪'
+    },
+    'actions': {
+        'restart': '🔄',
+        'city': '🏙️',
+        'weather': '☀️',
+        'budget': '💰',
+        'people': '👥',
+        'history': '📜',
+        'favorites': '⭐'
+    }
+}
+
+
+class FrozenMarkup(types.JsonSerializable):
+    __slots__ = ('json',)
+
+    def __init__(self, markup):
+        self.json = markup.to_json() if isinstance(markup, types.JsonSerializable) else markup
+
+    def to_json(self):
+        return self.json
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+# Кэширование клавиатуры по аргументам построителя (списки -> кортежи)
+def frozen_keyboard(builder):
+    @functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+    def build(args, kwargs):
+        markup = FrozenMarkup(builder(*args, **dict(kwargs)))
+        logging.debug("Клавиатура %s построена и закэширована", builder.__name__)
+        return markup
+
+    @functools.wraps(builder)
+    def wrapper(*args, **kwargs):
+        return build(tuple(_hashable(a) for a in args), tuple(sorted((k, _hashable(v)) for k, v in kwargs.items())))
+
+    wrapper.cache_info = build.cache_info
+    return wrapper
+
+
+@frozen_keyboard
+def create_main_keyboard():
+    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add("🎯 Найти занятия", "🏢 Найти заведения")
+    keyboard.add("⭐ Избранное", "📜 История")
+    return keyboard
+
+
+@frozen_keyboard
+def create_categories_keyboard():
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    categories = ["Кафе", "Рестораны", "Кинотеатры", "Парки", "Музеи", "Торговые центры"]
+    buttons = [types.InlineKeyboardButton(text=cat, callback_data=f"category_{cat}") for cat in categories]
+    keyboard.add(*buttons)
+    return keyboard
+
+
+# Шаблон клавиатуры мест: строка на место, листание страниц
+# и неизменная кнопка "Назад"
+PLACE_BUTTON = '{"text": %s, "callback_data": %s}'
+PLACE_ROW = '[' + PLACE_BUTTON + ']'
+PLACES_BACK_ROW = PLACE_ROW % (json.dumps("🔙 Назад"), json.dumps("back_to_categories"))
+
+
+def create_places_keyboard(places, query_id, page=0, pages=1):
+    rows = [
+        PLACE_ROW % (json.dumps(f"🏢 {place['name']}"), json.dumps(f"place_{query_id}_{place['type']}_{place['id']}"))
+        for place in places
+    ]
+    nav = []
+    if page > 0:
+        nav.append(PLACE_BUTTON % (json.dumps("⬅️ Пред."), json.dumps(f"page_{query_id}_{page - 1}")))
+    if page < pages - 1:
+        nav.append(PLACE_BUTTON % (json.dumps("След. ➡️"), json.dumps(f"page_{query_id}_{page + 1}")))
+    if nav:
+        rows.append('[' + ', '.join(nav) + ']')
+    rows.append(PLACES_BACK_ROW)
+    return FrozenMarkup('{"inline_keyboard": [' + ', '.join(rows) + ']}')
+
+
+def create_place_details_keyboard(place_id, place_type, query_id, is_favorite=False, page=0):
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    if not is_favorite:
+        callback_data = f"favplace_{query_id}_{place_type}_{place_id}"
+        keyboard.add(types.InlineKeyboardButton(
+            text="❤️ В избранное",
+            callback_data=callback_data
+        ))
+
+    map_callback = f"map_{place_type}_{place_id}"
+    back_callback = f"back_to_places_{query_id}_{page}"
+    keyboard.add(
+        types.InlineKeyboardButton(text="📍 На карте", callback_data=map_callback),
+        types.InlineKeyboardButton(text="🔙 Назад", callback_data=back_callback)
+    )
+    return keyboard
+
+
+@frozen_keyboard
+def create_inline_keyboard(items, prefix="", add_back=False, add_cancel=False):
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    for item in items:
+        buttons.append(types.InlineKeyboardButton(
+            text=f"{ICONS.get(prefix, {}).get(item, '')} {item.capitalize()}",
+            callback_data=f"{prefix}_{item}"
+        ))
+    if add_back:
+        buttons.append(types.InlineKeyboardButton(text="🔙 Назад", callback_data="back"))
+    if add_cancel:
+        buttons.append(types.InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"))
+    if not buttons:
+        logging.warning("Клавиатура пуста, кнопки не добавлены")
+    keyboard.add(*buttons)
+    return keyboard
+
+
+def create_recommendations_keyboard(options, query_id):
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    buttons = [
+        types.InlineKeyboardButton(
+            text=f"{ICONS['actions']['restart']} Новый поиск",
+            callback_data="restart"
+        ),
+        types.InlineKeyboardButton(
+            text=f"{ICONS['actions']['history']} История",
+            callback_data="show_history"
+        ),
+        types.InlineKeyboardButton(
+            text="🏢 Показать заведения",
+            callback_data=f"venues_{query_id}"
+        )
+    ]
+
+    for i, option in enumerate(options[:3], 1):
+        callback_data = f"fav_{query_id}_{i-1}"
+        buttons.append(types.InlineKeyboardButton(
+            text=f"⭐ Вариант {i}",
+            callback_data=callback_data
+        ))
+
+    keyboard.add(*buttons)
+    return keyboard
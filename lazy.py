@@ -0,0 +1,65 @@
+import threading
+import logging
+
+# Отложенное создание объектов модуля бота: хранилища, индексы и файлы
+# данных открываются при первом обращении, а не при импорте. Прокси
+# передаёт атрибуты, индексацию, len/in/iter созданному объекту, так что
+# код обработчиков не меняется:
+#   user_data = Lazy(open_sessions, 'sessions')
+#   user_data.get(chat_id)     # здесь вызывается open_sessions()
+# lazy_instance() - сам объект (создаёт его), lazy_created - создан ли уже.
+# Имена методов прокси начинаются с lazy_, чтобы не закрывать методы объекта.
+
+
+class Lazy:
+    def __init__(self, factory, name=None):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_name', name or getattr(factory, '__name__', 'lazy'))
+        object.__setattr__(self, '_lock', threading.Lock())
+        object.__setattr__(self, '_created', False)
+        object.__setattr__(self, '_instance', None)
+
+    @property
+    def lazy_created(self):
+        return self._created
+
+    def lazy_instance(self):
+        if self._created:
+            return self._instance
+        with self._lock:
+            if not self._created:
+                logging.debug("Отложенная инициализация: %s", self._name)
+                object.__setattr__(self, '_instance', self._factory())
+                object.__setattr__(self, '_created', True)
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.lazy_instance(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.lazy_instance(), name, value)
+
+    def __getitem__(self, key):
+        return self.lazy_instance()[key]
+
+    def __setitem__(self, key, value):
+        self.lazy_instance()[key] = value
+
+    def __delitem__(self, key):
+        del self.lazy_instance()[key]
+
+    def __contains__(self, key):
+        return key in self.lazy_instance()
+
+    def __len__(self):
+        return len(self.lazy_instance())
+
+    def __iter__(self):
+        return iter(self.lazy_instance())
+
+    def __bool__(self):
+        return bool(self.lazy_instance())
+
+    def __repr__(self):
+        state = repr(self._instance) if self._created else 'не создан'
+        return f"<Lazy {self._name}: {state}>"
@@ -0,0 +1,62 @@
+import atexit
+import queue
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Логирование без блокировки обработчиков: записи кладутся в очередь,
+# в файл их пишет отдельный поток QueueListener. Файл ротируется по размеру.
+# Большие ответы API логируются через Payload: строка формируется
+# лениво, только если запись действительно пишется, и обрезается.
+
+LOG_FILE = 'bot.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_PAYLOAD_LIMIT = 2000
+
+# Сторонние логгеры, которые на DEBUG пишут URL с токеном бота
+NOISY_LOGGERS = ('urllib3', 'TeleBot', 'asyncio', 'aiohttp')
+
+_listener = None
+
+
+def setup_logging(level='INFO', filename=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.getLevelName(level.upper()) if isinstance(level, str) else level)
+
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(max(root.level, logging.WARNING))
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+class Payload:
+    def __init__(self, data, limit=LOG_PAYLOAD_LIMIT):
+        self.data = data
+        self.limit = limit
+
+    def __str__(self):
+        text = str(self.data)
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}... [обрезано, всего {len(text)} символов]"
+        return text
+
+
+# Выборочное логирование больших ответов: в лог попадает доля rate записей
+def sampled(rate):
+    return rate >= 1 or random.random() < rate
@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import inspect
+import bisect
+import functools
+import threading
+import logging
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Метрики бота в формате Prometheus: время работы обработчиков обновлений
+# и вызовов кэшей/внешних API (гистограммы, p50/p95/p99), счётчики по исходу
+# (ok/empty/error), число выполняющихся сейчас вызовов. Плюс "сборщики" -
+# функции stats() кэшей, очереди отправки и т.п., читаются при запросе.
+# GET /metrics - текстовый формат Prometheus, /metrics.json - снимок
+# с перцентилями; снимок можно периодически записывать в файл.
+#
+# Горячий путь без блокировок: замер добавляется в deque, выполняющиеся
+# вызовы - элементы списка (append/pop атомарны в CPython); в гистограмму
+# замеры сводятся под блокировкой при чтении метрик или когда их накопилось
+# много. Стоимость - benchmarks/bench_metrics.py.
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+METRICS_PREFIX = 'bot'
+METRICS_SNAPSHOT_INTERVAL = 60
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+TIMER_DRAIN_THRESHOLD = 1024
+
+# Исходы по группам: пустой результат (нет мест) отличается от ошибки
+GROUP_OUTCOMES = {
+    'handler': ('ok', 'error'),
+    'call': ('ok', 'empty', 'error'),
+}
+
+
+class Timer:
+    def __init__(self, outcomes, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.outcomes = dict.fromkeys(outcomes, 0)
+        self.active = []
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, outcome):
+        self._pending.append((elapsed, outcome))
+        if len(self._pending) >= TIMER_DRAIN_THRESHOLD:
+            self.drain()
+
+    def drain(self):
+        with self._lock:
+            pending = self._pending
+            while pending:
+                elapsed, outcome = pending.popleft()
+                self.counts[bisect.bisect_left(self.buckets, elapsed)] += 1
+                self.sum += elapsed
+                self.count += 1
+                self.outcomes[outcome] += 1
+
+    @property
+    def in_flight(self):
+        return len(self.active)
+
+    # Оценка по корзинам: линейная интерполяция внутри корзины
+    def quantile(self, q):
+        self.drain()
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+
+class MetricsRegistry:
+    def __init__(self, prefix=METRICS_PREFIX, buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._timers = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def timer(self, group, name):
+        with self._lock:
+            timer = self._timers.get((group, name))
+            if timer is None:
+                timer = Timer(GROUP_OUTCOMES[group], self.buckets)
+                self._timers[(group, name)] = timer
+            return timer
+
+    # stats() -> {поле: число}; нечисловые поля пропускаются
+    def add_collector(self, name, stats):
+        self._collectors[name] = stats
+
+    def _collected(self):
+        for name, stats in list(self._collectors.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logging.warning("Метрики: сборщик %s завершился ошибкой: %s", name, e)
+                continue
+            for field, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield name, field, value
+
+    # Обёртка вызова: время и исход -> Timer, выполняющиеся - Timer.active.
+    # group - 'handler' (обработчики обновлений) или 'call' (кэши и внешние API)
+    def instrument(self, func, group, name=None):
+        timer = self.timer(group, name or func.__name__)
+        active, record = timer.active, timer.record
+        count_empty = 'empty' in timer.outcomes
+        clock = time.perf_counter
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                active.append(None)
+                started = clock()
+                outcome = 'error'
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = 'empty' if count_empty and not result else 'ok'
+                    return result
+                finally:
+                    active.pop()
+                    record(clock() - started, outcome)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                active.append(None)
+                started = clock()
+                outcome = 'error'
+                try:
+                    result = func(*args, **kwargs)
+                    outcome = 'empty' if count_empty and not result else 'ok'
+                    return result
+                finally:
+                    active.pop()
+                    record(clock() - started, outcome)
+
+        wrapper.instrumented = True
+        return wrapper
+
+    def timed(self, group, name=None):
+        def decorator(func):
+            return self.instrument(func, group, name)
+        return decorator
+
+    # Оборачивает все зарегистрированные обработчики TeleBot/AsyncTeleBot
+    def instrument_handlers(self, bot):
+        count = 0
+        for handlers in (bot.message_handlers, bot.callback_query_handlers):
+            for handler in handlers:
+                func = handler['function']
+                if not getattr(func, 'instrumented', False):
+                    handler['function'] = self.instrument(func, 'handler')
+                    count += 1
+        logging.debug("Метрики: обёрнуто обработчиков: %d", count)
+        return count
+
+    def _timers_by_group(self):
+        with self._lock:
+            items = sorted(self._timers.items())
+        groups = {}
+        for (group, name), timer in items:
+            timer.drain()
+            groups.setdefault(group, []).append((name, timer))
+        return groups
+
+    def render(self):
+        lines = []
+        for group, timers in self._timers_by_group().items():
+            metric = f"{self.prefix}_{group}_seconds"
+            lines.append(f"# HELP {metric} Время выполнения ({group})")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, timer in timers:
+                cumulative = 0
+                for le, n in zip(timer.buckets + (float('inf'),), timer.counts):
+                    cumulative += n
+                    lines.append(f"{metric}_bucket{format_labels(((group, name), ('le', format_value(le))))} {cumulative}")
+                lines.append(f"{metric}_sum{format_labels(((group, name),))} {format_value(timer.sum)}")
+                lines.append(f"{metric}_count{format_labels(((group, name),))} {timer.count}")
+
+            metric = f"{self.prefix}_{group}_total"
+            lines.append(f"# HELP {metric} Вызовы по исходу ({group})")
+            lines.append(f"# TYPE {metric} counter")
+            for name, timer in timers:
+                for outcome, n in timer.outcomes.items():
+                    lines.append(f"{metric}{format_labels(((group, name), ('outcome', outcome)))} {n}")
+
+            metric = f"{self.prefix}_{group}_in_flight"
+            lines.append(f"# HELP {metric} Выполняется сейчас ({group})")
+            lines.append(f"# TYPE {metric} gauge")
+            for name, timer in timers:
+                lines.append(f"{metric}{format_labels(((group, name),))} {timer.in_flight}")
+
+        collected = {}
+        for name, field, value in self._collected():
+            collected.setdefault(field, []).append((name, value))
+        for field, samples in collected.items():
+            metric = f"{self.prefix}_{field}"
+            lines.append(f"# TYPE {metric} gauge")
+            for name, value in samples:
+                lines.append(f"{metric}{format_labels((('source', name),))} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        result = {'time': time.time(), 'timers': {}, 'collected': {}}
+        for group, timers in self._timers_by_group().items():
+            entries = result['timers'].setdefault(group, {})
+            for name, timer in timers:
+                entry = {'count': timer.count, 'sum': timer.sum, 'in_flight': timer.in_flight}
+                entry.update(timer.outcomes)
+                for q in QUANTILES:
+                    entry[f"p{round(q * 100)}"] = timer.quantile(q)
+                entries[name] = entry
+        for name, field, value in self._collected():
+            result['collected'].setdefault(name, {})[field] = value
+        return result
+
+
+class MetricsServer:
+    def __init__(self, registry, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def _handler_class(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.render().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.snapshot(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        logging.info("Метрики доступны на порту %s (/metrics)", self.port)
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Периодическая запись снимка метрик в JSON-файл (через временный файл)
+class SnapshotWriter:
+    def __init__(self, registry, path, interval=METRICS_SNAPSHOT_INTERVAL):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                logging.error("Ошибка при записи снимка метрик: %s", e)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        try:
+            self.write()
+        except Exception as e:
+            logging.error("Ошибка при записи снимка метрик: %s", e)
@@ -0,0 +1,266 @@
+import json
+import math
+import codecs
+
+# Построение запросов к Overpass API и разбор ответов.
+# Запрос ограничивается на стороне сервера: только элементы с названием
+# и лимит на число элементов. Вывод - "out center": у узлов координаты,
+# у путей и отношений центр (при "out tags" координат узлов в ответе нет).
+# Ответ разбирается потоково - чтение прекращается, как только набрано
+# нужное количество мест (ElementStream + PlaceCollector, sync и async).
+
+OVERPASS_TIMEOUT = 10
+# Мест в одном наборе результатов: 5 страниц по PLACES_PAGE_SIZE (result_sets).
+# Запрос к Overpass всё равно один, out center с лимитом на сервере
+PLACES_LIMIT = 40
+NEAREST_RADIUS = 5000
+NEAREST_OVERFETCH = 4
+CENTER_PLACES = ('city', 'town', 'village')
+
+# Категории мест и соответствующие фильтры тегов OSM
+CATEGORY_MAPPING = {
+    "Кафе": ["amenity=cafe"],
+    "Рестораны": ["amenity=restaurant"],
+    "Кинотеатры": ["amenity=cinema"],
+    "Парки": ["leisure=park"],
+    "Музеи": ["tourism=museum"],
+    "Торговые центры": ["shop=mall"]
+}
+
+
+# Значение для строки в кавычках Overpass QL: обратная косая черта,
+# кавычки и переводы строк в названии города не должны менять запрос
+def ql_string(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Объединение (union) по всем фильтрам категории: несколько фильтров
+# уходят одним запросом вместо нескольких последовательных
+def union_selectors(queries, scope):
+    if isinstance(queries, str):
+        queries = [queries]
+    return "\n".join(
+        f"          {kind}[{query}][name]{scope};"
+        for query in queries
+        for kind in ('node', 'way', 'relation')
+    )
+
+
+# query - фильтр тегов или список фильтров.
+# area - AreaInfo из area_resolver: если город уже сопоставлен с областью OSM,
+# ищем по id области (с bbox для предварительного отбора) или вокруг её центра
+def build_overpass_query(city, query, limit=PLACES_LIMIT, order='qt', radius=NEAREST_RADIUS, area=None):
+    city = ql_string(city)
+    if area is not None:
+        if order == 'nearest':
+            lat, lon = area.center
+            return f"""
+        [out:json][timeout:{OVERPASS_TIMEOUT}];
+        (
+{union_selectors(query, f"(around:{radius},{lat},{lon})")}
+        );
+        out center qt {limit * NEAREST_OVERFETCH};
+        """
+        south, west, north, east = area.bbox
+        return f"""
+        [out:json][timeout:{OVERPASS_TIMEOUT}][bbox:{south},{west},{north},{east}];
+        area({area.area_id})->.searchArea;
+        (
+{union_selectors(query, "(area.searchArea)")}
+        );
+        out center qt {limit};
+        """
+
+    if order == 'nearest':
+        # Сначала выводим узел-центр города, затем места в радиусе от него;
+        # мест запрашиваем с запасом, чтобы отсортировать по расстоянию
+        return f"""
+        [out:json][timeout:{OVERPASS_TIMEOUT}];
+        area["name"="{city}"]->.searchArea;
+        node[place~"^({'|'.join(CENTER_PLACES)})$"]["name"="{city}"](area.searchArea)->.center;
+        .center out 1;
+        (
+{union_selectors(query, f"(around.center:{radius})")}
+        );
+        out center qt {limit * NEAREST_OVERFETCH};
+        """
+
+    return f"""
+        [out:json][timeout:{OVERPASS_TIMEOUT}];
+        area["name"="{city}"]->.searchArea;
+        (
+{union_selectors(query, "(area.searchArea)")}
+        );
+        out center qt {limit};
+        """
+
+
+# Старый запрос без ограничений - для сравнения в бенчмарке
+def build_legacy_overpass_query(city, query):
+    return f"""
+        [out:json];
+        area["name"="{city}"]->.searchArea;
+        (
+          node[{query}](area.searchArea);
+          way[{query}](area.searchArea);
+          relation[{query}](area.searchArea);
+        );
+        out center;
+        """
+
+
+def format_address(tags):
+    if tags.get("address"):
+        return tags["address"]
+    street = tags.get("addr:street")
+    if street:
+        house = tags.get("addr:housenumber")
+        return f"{street}, {house}" if house else street
+    return "Адрес не указан"
+
+
+def is_city_center(element):
+    return element.get("type") == "node" and element.get("tags", {}).get("place") in CENTER_PLACES
+
+
+def element_to_place(element):
+    tags = element.get("tags", {})
+    lat = element.get("lat") or element.get("center", {}).get("lat")
+    lon = element.get("lon") or element.get("center", {}).get("lon")
+    return {
+        "id": element.get("id"),
+        "type": element.get("type"),
+        "name": tags.get("name", "Без названия"),
+        "address": format_address(tags),
+        "lat": lat,
+        "lon": lon
+    }
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+# Отбор мест из элементов по одному: add() возвращает True, когда мест
+# набрано достаточно и читать ответ дальше не нужно
+class PlaceCollector:
+    def __init__(self, results, limit=PLACES_LIMIT, order='qt', center=None):
+        self.results = results
+        self.limit = limit
+        self.order = order
+        self.center = center
+        self.seen = {(p["type"], p["id"]) for p in results}
+        self.candidates = []
+        self.wanted = limit * NEAREST_OVERFETCH if order == 'nearest' else limit
+
+    def add(self, element):
+        if self.order == 'nearest' and self.center is None and is_city_center(element):
+            if element.get("lat") is not None and element.get("lon") is not None:
+                self.center = (element["lat"], element["lon"])
+            return False
+        place = element_to_place(element)
+        key = (place["type"], place["id"])
+        if key in self.seen or place["lat"] is None or place["lon"] is None:
+            return False
+        self.seen.add(key)
+        self.candidates.append(place)
+        return len(self.results) + len(self.candidates) >= self.wanted
+
+    def add_all(self, elements):
+        return any(self.add(element) for element in elements)
+
+    def finish(self):
+        center = self.center
+        if self.order == 'nearest' and center is not None:
+            self.candidates.sort(key=lambda p: distance_km(center[0], center[1], p["lat"], p["lon"]))
+        self.results.extend(self.candidates[:max(self.limit - len(self.results), 0)])
+        return self.results
+
+
+def collect_places(elements, results, limit=PLACES_LIMIT, order='qt', center=None):
+    collector = PlaceCollector(results, limit, order, center)
+    for element in elements:
+        if collector.add(element):
+            break
+    return collector.finish()
+
+
+# Слияние результатов нескольких запросов: без повторов по (type, id),
+# в режиме nearest - заново по расстоянию от центра
+def merge_places(place_lists, limit=PLACES_LIMIT, order='qt', center=None):
+    merged = []
+    seen = set()
+    for places in place_lists:
+        for place in places:
+            key = (place["type"], place["id"])
+            if key not in seen:
+                seen.add(key)
+                merged.append(place)
+    if order == 'nearest' and center is not None:
+        merged.sort(key=lambda p: distance_km(center[0], center[1], p["lat"], p["lon"]))
+    return merged[:limit]
+
+
+def parse_overpass_elements(data, results, limit=PLACES_LIMIT, order='qt', center=None):
+    return collect_places(data.get("elements", []), results, limit, order, center)
+
+
+# Потоковый разбор массива "elements" из частей ответа (bytes):
+# feed() возвращает объекты, разобранные из очередной части, не дожидаясь
+# конца ответа; finished - массив закончился
+class ElementStream:
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.in_array = False
+        self.finished = False
+
+    def feed(self, chunk):
+        elements = []
+        if self.finished:
+            return elements
+        self.buffer += self.utf8.decode(chunk)
+        buffer = self.buffer
+        while True:
+            if not self.in_array:
+                start = buffer.find('"elements"', self.pos)
+                if start == -1:
+                    break
+                bracket = buffer.find('[', start)
+                if bracket == -1:
+                    break
+                self.pos = bracket + 1
+                self.in_array = True
+
+            while self.pos < len(buffer) and buffer[self.pos] in ' \t\r\n,':
+                self.pos += 1
+            if self.pos >= len(buffer):
+                break
+            if buffer[self.pos] == ']':
+                self.finished = True
+                break
+            try:
+                element, end = self.decoder.raw_decode(buffer, self.pos)
+            except json.JSONDecodeError:
+                break
+            self.pos = end
+            elements.append(element)
+
+        # Отбрасываем уже разобранную часть буфера
+        if self.pos > 65536:
+            self.buffer = buffer[self.pos:]
+            self.pos = 0
+        return elements
+
+
+def iter_overpass_elements(chunks):
+    stream = ElementStream()
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+        if stream.finished:
+            return
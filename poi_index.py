@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import argparse
+import threading
+import logging
+
+from overpass import CATEGORY_MAPPING, PLACES_LIMIT, element_to_place, distance_km
+from area_resolver import normalize_area_name
+
+# Локальный индекс мест (POI) для самых популярных городов: места из
+# записанных ответов Overpass (JSON) раскладываются по категориям из
+# CATEGORY_MAPPING и хранятся в SQLite с пространственным индексом R-tree.
+# Поиск идёт от центра города расширяющимся окном - ближайшие места первыми.
+# Бот открывает индекс только на чтение с mmap, поэтому несколько процессов
+# могут читать один файл, пока импортёр обновляет его (режим WAL).
+#
+# Импорт/обновление:
+#   python poi_index.py import --city Москва moscow.json
+#   python poi_index.py stats
+
+POI_INDEX_DB = 'poi_index.db'
+POI_MMAP_SIZE = 256 * 1024 * 1024
+POI_START_RADIUS_KM = 1.0
+POI_MAX_RADIUS_KM = 50.0
+POI_RECHECK_INTERVAL = 60
+KM_PER_DEGREE = 111.32
+
+
+def parse_tag_filter(query):
+    key, _, value = query.partition('=')
+    return key.strip(), value.strip()
+
+
+# Категории, к которым относится элемент, по его тегам
+def classify(tags, category_mapping=CATEGORY_MAPPING):
+    categories = []
+    for category, queries in category_mapping.items():
+        for query in queries:
+            key, value = parse_tag_filter(query)
+            if tags.get(key) == value:
+                categories.append(category)
+                break
+    return categories
+
+
+def bbox_around(lat, lon, radius_km):
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+class PoiIndex:
+    def __init__(self, db_path=POI_INDEX_DB, readonly=False, mmap_size=POI_MMAP_SIZE):
+        self.db_path = db_path
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True,
+                                         check_same_thread=False, isolation_level=None)
+        else:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._create_schema()
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+
+    def _create_schema(self):
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS poi ("
+            " id INTEGER PRIMARY KEY,"
+            " city TEXT NOT NULL,"
+            " category TEXT NOT NULL,"
+            " osm_type TEXT NOT NULL,"
+            " osm_id INTEGER NOT NULL,"
+            " name TEXT NOT NULL,"
+            " address TEXT NOT NULL,"
+            " lat REAL NOT NULL,"
+            " lon REAL NOT NULL,"
+            " generation INTEGER NOT NULL,"
+            " UNIQUE (city, category, osm_type, osm_id));"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS poi_rtree USING rtree("
+            " id, min_lat, max_lat, min_lon, max_lon);"
+            "CREATE TABLE IF NOT EXISTS cities ("
+            " city TEXT NOT NULL,"
+            " category TEXT NOT NULL,"
+            " center_lat REAL NOT NULL,"
+            " center_lon REAL NOT NULL,"
+            " generation INTEGER NOT NULL,"
+            " places INTEGER NOT NULL,"
+            " imported_at REAL NOT NULL,"
+            " PRIMARY KEY (city, category));"
+        )
+
+    # Инкрементальное обновление города: новые и изменившиеся места
+    # записываются, исчезнувшие из выгрузки - удаляются. Категории, которых
+    # нет в выгрузке, не трогаются
+    def import_elements(self, city, elements, center=None, category_mapping=CATEGORY_MAPPING):
+        if self.readonly:
+            raise RuntimeError("Индекс открыт только на чтение")
+        key = normalize_area_name(city)
+        by_category = {}
+        for element in elements:
+            categories = classify(element.get("tags", {}), category_mapping)
+            if not categories:
+                continue
+            place = element_to_place(element)
+            if place["lat"] is None or place["lon"] is None:
+                continue
+            for category in categories:
+                by_category.setdefault(category, {})[(place["type"], place["id"])] = place
+
+        if center is None:
+            points = [(p["lat"], p["lon"]) for places in by_category.values() for p in places.values()]
+            if points:
+                center = (sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points))
+
+        changed = removed = 0
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for category, places in by_category.items():
+                    row = self._conn.execute(
+                        "SELECT generation FROM cities WHERE city = ? AND category = ?", (key, category)
+                    ).fetchone()
+                    generation = (row[0] + 1) if row else 1
+                    for place in places.values():
+                        changed += self._upsert(key, category, place, generation)
+                    removed += self._delete_older(key, category, generation)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO cities VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, category, center[0], center[1], generation, len(places), now)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        total = sum(len(places) for places in by_category.values())
+        logging.info("Индекс мест: %s - %d мест, изменено %d, удалено %d", city, total, changed, removed)
+        return {"places": total, "changed": changed, "removed": removed, "categories": sorted(by_category)}
+
+    def _upsert(self, city, category, place, generation):
+        row = self._conn.execute(
+            "SELECT id, name, address, lat, lon FROM poi"
+            " WHERE city = ? AND category = ? AND osm_type = ? AND osm_id = ?",
+            (city, category, place["type"], place["id"])
+        ).fetchone()
+        if row is not None and row[1:] == (place["name"], place["address"], place["lat"], place["lon"]):
+            self._conn.execute("UPDATE poi SET generation = ? WHERE id = ?", (generation, row[0]))
+            return 0
+        if row is None:
+            cursor = self._conn.execute(
+                "INSERT INTO poi (city, category, osm_type, osm_id, name, address, lat, lon, generation)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (city, category, place["type"], place["id"], place["name"], place["address"],
+                 place["lat"], place["lon"], generation)
+            )
+            poi_id = cursor.lastrowid
+        else:
+            poi_id = row[0]
+            self._conn.execute(
+                "UPDATE poi SET name = ?, address = ?, lat = ?, lon = ?, generation = ? WHERE id = ?",
+                (place["name"], place["address"], place["lat"], place["lon"], generation, poi_id)
+            )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO poi_rtree VALUES (?, ?, ?, ?, ?)",
+            (poi_id, place["lat"], place["lat"], place["lon"], place["lon"])
+        )
+        return 1
+
+    def _delete_older(self, city, category, generation):
+        stale = [row[0] for row in self._conn.execute(
+            "SELECT id FROM poi WHERE city = ? AND category = ? AND generation < ?", (city, category, generation)
+        )]
+        for poi_id in stale:
+            self._conn.execute("DELETE FROM poi WHERE id = ?", (poi_id,))
+            self._conn.execute("DELETE FROM poi_rtree WHERE id = ?", (poi_id,))
+        return len(stale)
+
+    def has(self, city, category):
+        with self._lock:
+            return self._city(normalize_area_name(city), category) is not None
+
+    def _city(self, key, category):
+        return self._conn.execute(
+            "SELECT center_lat, center_lon, places FROM cities WHERE city = ? AND category = ?", (key, category)
+        ).fetchone()
+
+    # Ближайшие к центру места; None - города/категории нет в индексе
+    def search(self, city, category, limit=PLACES_LIMIT, center=None):
+        key = normalize_area_name(city)
+        with self._lock:
+            row = self._city(key, category)
+            if row is None:
+                return None
+            lat, lon = center if center is not None else row[:2]
+            wanted = min(limit, row[2])
+            radius = POI_START_RADIUS_KM
+            while True:
+                places = self._window(key, category, bbox_around(lat, lon, radius))
+                if len(places) >= wanted or radius >= POI_MAX_RADIUS_KM:
+                    break
+                radius *= 2
+            if len(places) < wanted:
+                places = self._window(key, category, None)
+
+        places.sort(key=lambda p: distance_km(lat, lon, p["lat"], p["lon"]))
+        return places[:limit]
+
+    def _window(self, city, category, bbox):
+        if bbox is None:
+            rows = self._conn.execute(
+                "SELECT osm_id, osm_type, name, address, lat, lon FROM poi WHERE city = ? AND category = ?",
+                (city, category)
+            )
+        else:
+            # CROSS JOIN фиксирует порядок: сначала окно R-tree, затем poi по id
+            rows = self._conn.execute(
+                "SELECT p.osm_id, p.osm_type, p.name, p.address, p.lat, p.lon"
+                " FROM poi_rtree r CROSS JOIN poi p ON p.id = r.id"
+                " WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?"
+                " AND p.city = ? AND p.category = ?",
+                bbox + (city, category)
+            )
+        return [
+            {"id": osm_id, "type": osm_type, "name": name, "address": address, "lat": lat, "lon": lon}
+            for osm_id, osm_type, name, address, lat, lon in rows
+        ]
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT city, category, places, generation, imported_at FROM cities ORDER BY city, category"
+            ).fetchall()
+        return [
+            {"city": city, "category": category, "places": places, "generation": generation,
+             "imported_at": imported_at}
+            for city, category, places, generation, imported_at in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Индекс для бота: только чтение, если файл индекса уже создан
+def open_poi_index(db_path=POI_INDEX_DB):
+    if not db_path or not os.path.exists(db_path):
+        return None
+    try:
+        return PoiIndex(db_path, readonly=True)
+    except sqlite3.Error as e:
+        logging.error("Не удалось открыть индекс мест %s: %s", db_path, e)
+        return None
+
+
+# Файл индекса может появиться после запуска бота (первый импорт), поэтому
+# его отсутствие не запоминается навсегда: get() снова пробует открыть
+# файл, но не чаще раза в recheck_interval секунд
+class PoiIndexHandle:
+    def __init__(self, db_path=POI_INDEX_DB, recheck_interval=POI_RECHECK_INTERVAL, clock=time.monotonic):
+        self.db_path = db_path
+        self.recheck_interval = recheck_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._index = None
+        self._checked_at = None
+        self.get()
+
+    def get(self):
+        if self._index is not None:
+            return self._index
+        with self._lock:
+            now = self.clock()
+            if self._index is None and (
+                self._checked_at is None or now - self._checked_at >= self.recheck_interval
+            ):
+                self._checked_at = now
+                self._index = open_poi_index(self.db_path)
+                if self._index is not None:
+                    logging.info("Индекс мест открыт: %s", self.db_path)
+            return self._index
+
+    def close(self):
+        with self._lock:
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный индекс мест")
+    parser.add_argument('--db', default=os.getenv('POI_INDEX_DB', POI_INDEX_DB))
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="импорт записанных ответов Overpass (JSON)")
+    import_parser.add_argument('--city', required=True)
+    import_parser.add_argument('--center', help="центр города: lat,lon")
+    import_parser.add_argument('files', nargs='+')
+    commands.add_parser('stats', help="города и категории в индексе")
+    args = parser.parse_args(argv)
+
+    index = PoiIndex(args.db)
+    try:
+        if args.command == 'import':
+            elements = []
+            for path in args.files:
+                with open(path, 'r', encoding='utf-8') as f:
+                    elements.extend(json.load(f).get("elements", []))
+            center = tuple(float(x) for x in args.center.split(',')) if args.center else None
+            result = index.import_elements(args.city, elements, center)
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            for row in index.stats():
+                print(json.dumps(row, ensure_ascii=False))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import time
+import random
+import threading
+import logging
+from collections import Counter, deque
+
+from area_resolver import normalize_city
+
+# Фоновый прогрев кэшей для популярных городов: самые частые города
+# берутся из истории запросов и из недавних поисков (DemandTracker),
+# для них заранее обновляются погода и самые востребованные категории
+# мест, чтобы первый запрос пользователя попадал в кэш.
+#
+# Ограничения: не больше budget запросов к внешним API за цикл и не чаще
+# rate запросов в секунду; интервал между циклами со случайным разбросом
+# (jitter); после ошибки задача откладывается с экспоненциальной задержкой;
+# kill_switch() - остановка прогрева без перезапуска бота.
+#
+# weather_refresher(city, horizon) и places_refresher(city, category, horizon)
+# возвращают None, если запись в кэше проживёт дольше horizon секунд,
+# иначе - функцию, которая запрашивает данные и кладёт их в кэш.
+# Часы и sleep передаются параметрами - прогрев проверяется с фиктивными.
+
+PREWARM_INTERVAL = 600
+PREWARM_TOP_CITIES = 50
+PREWARM_TOP_CATEGORIES = 2
+PREWARM_BUDGET = 200
+PREWARM_RATE = 1.0
+PREWARM_JITTER = 0.2
+PREWARM_BACKOFF_BASE = 60
+PREWARM_BACKOFF_MAX = 3600
+PREWARM_MAX_FAILURES = 3
+DEMAND_WINDOW = 3600
+DEMAND_MAX_EVENTS = 10000
+
+
+# Недавние поиски: события за последние window секунд
+class DemandTracker:
+    def __init__(self, window=DEMAND_WINDOW, max_events=DEMAND_MAX_EVENTS, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+
+    def record(self, city, category=None):
+        if not city:
+            return
+        with self._lock:
+            self._events.append((self.clock(), city, category))
+
+    def snapshot(self):
+        deadline = self.clock() - self.window
+        with self._lock:
+            while self._events and self._events[0][0] < deadline:
+                self._events.popleft()
+            return list(self._events)
+
+
+class Prewarmer:
+    def __init__(self, weather_refresher, places_refresher, categories, history=None, tracker=None,
+                 top_cities=PREWARM_TOP_CITIES, top_categories=PREWARM_TOP_CATEGORIES,
+                 budget=PREWARM_BUDGET, rate=PREWARM_RATE, interval=PREWARM_INTERVAL,
+                 jitter=PREWARM_JITTER, backoff_base=PREWARM_BACKOFF_BASE,
+                 backoff_max=PREWARM_BACKOFF_MAX, max_failures=PREWARM_MAX_FAILURES,
+                 kill_switch=None, clock=time.monotonic, sleep=None, rng=random.random):
+        self.weather_refresher = weather_refresher
+        self.places_refresher = places_refresher
+        self.categories = list(categories)
+        self.history = history
+        self.tracker = tracker
+        self.top_cities = top_cities
+        self.top_categories = top_categories
+        self.budget = budget
+        self.rate = rate
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_failures = max_failures
+        self.kill_switch = kill_switch or (lambda: False)
+        self.clock = clock
+        self._stop = threading.Event()
+        self.sleep = sleep or self._stop.wait
+        self.rng = rng
+        self._failures = {}
+        self._retry_at = {}
+        self._last_request = None
+        self._thread = None
+        self.cycles = 0
+        self.requests = 0
+        self.skipped = 0
+        self.errors = 0
+
+    # Самые популярные города: история + недавние поиски (поиски весомее)
+    def hot_cities(self):
+        scores = Counter()
+        names = {}
+        if self.history is not None:
+            for city in self.history():
+                if city:
+                    key = normalize_city(city)
+                    scores[key] += 1
+                    names.setdefault(key, city)
+        events = self.tracker.snapshot() if self.tracker is not None else []
+        for _, city, _ in events:
+            key = normalize_city(city)
+            scores[key] += 2
+            names[key] = city
+        return [names[key] for key, _ in scores.most_common(self.top_cities)]
+
+    def hot_categories(self, city):
+        events = self.tracker.snapshot() if self.tracker is not None else []
+        key = normalize_city(city)
+        per_city = Counter(c for _, name, c in events if c and normalize_city(name) == key)
+        overall = Counter(c for _, _, c in events if c)
+        ranked = [c for c, _ in per_city.most_common()]
+        ranked += [c for c, _ in overall.most_common() if c not in ranked]
+        ranked += [c for c in self.categories if c not in ranked]
+        return [c for c in ranked if c in self.categories][:self.top_categories]
+
+    def plan(self):
+        tasks = []
+        for city in self.hot_cities():
+            tasks.append(('weather', city, None))
+            for category in self.hot_categories(city):
+                tasks.append(('places', city, category))
+        return tasks
+
+    def _throttle(self):
+        if self.rate and self._last_request is not None:
+            delay = self._last_request + 1.0 / self.rate - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+        self._last_request = self.clock()
+
+    def _backoff(self, task):
+        failures = self._failures.get(task, 0) + 1
+        self._failures[task] = failures
+        delay = min(self.backoff_base * 2 ** (failures - 1), self.backoff_max)
+        self._retry_at[task] = self.clock() + delay * (1 + self.jitter * self.rng())
+
+    # Один цикл прогрева; возвращает число запросов к внешним API
+    def run_once(self):
+        self.cycles += 1
+        horizon = self.interval * (1 + self.jitter)
+        spent = 0
+        failures_in_row = 0
+        for task in self.plan():
+            if self.kill_switch() or self._stop.is_set():
+                logging.info("Прогрев кэша остановлен")
+                break
+            if spent >= self.budget:
+                logging.debug("Прогрев кэша: бюджет %d запросов исчерпан", self.budget)
+                break
+            if self._retry_at.get(task, 0) > self.clock():
+                continue
+
+            kind, city, category = task
+            if kind == 'weather':
+                refresh = self.weather_refresher(city, horizon)
+            else:
+                refresh = self.places_refresher(city, category, horizon)
+            if refresh is None:
+                self.skipped += 1
+                continue
+
+            self._throttle()
+            spent += 1
+            self.requests += 1
+            try:
+                refresh()
+            except Exception as e:
+                self.errors += 1
+                failures_in_row += 1
+                self._backoff(task)
+                logging.warning("Прогрев кэша: ошибка %s %s %s: %s", kind, city, category or '', e)
+                if failures_in_row >= self.max_failures:
+                    logging.warning("Прогрев кэша: %d ошибок подряд, цикл прерван", failures_in_row)
+                    break
+                continue
+
+            failures_in_row = 0
+            self._failures.pop(task, None)
+            self._retry_at.pop(task, None)
+
+        logging.info("Прогрев кэша: цикл %d, запросов %d", self.cycles, spent)
+        return spent
+
+    def next_delay(self):
+        return self.interval * (1 + self.jitter * (2 * self.rng() - 1))
+
+    def _loop(self):
+        while not self._stop.wait(self.next_delay()):
+            if self.kill_switch():
+                continue
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error("Ошибка прогрева кэша: %s", e)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="prewarm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {'cycles': self.cycles, 'requests': self.requests, 'skipped': self.skipped,
+                'errors': self.errors, 'backoff': len(self._retry_at)}
@@ -0,0 +1,152 @@
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from activities_index import ACTIVITY_AXES, ActivityCatalog
+from area_resolver import normalize_city
+
+# Подбор занятий без Telegram: (город, настроение, бюджет, люди) ->
+# погода в городе -> варианты из индекса активностей. Пакетный вызов
+# запрашивает погоду один раз на каждый уникальный город (параллельно),
+# а одинаковые сочетания ищет в индексе один раз.
+#
+# CLI для офлайн-оценки и прогрева кэша погоды, JSONL на входе и выходе:
+#   python recommendations.py requests.jsonl -o results.jsonl
+#   python recommendations.py requests.jsonl --weather-map weather.json
+# Строка запроса: {"city": "Москва", "mood": "активное", "budget": "низкий",
+# "people": "пара"}; поле "weather" (ясно, дождь, ...) можно указать сразу.
+
+RECOMMEND_WORKERS = 8
+
+
+def as_request(item):
+    if isinstance(item, dict):
+        return item
+    city, mood, budget, people = item
+    return {'city': city, 'mood': mood, 'budget': budget, 'people': people}
+
+
+class RecommendationEngine:
+    # activities - ActivityCatalog (или объект с current() -> ActivityIndex);
+    # weather_source(city) -> {'weather_code': ..., 'temp': ...};
+    # describe(weather_code) -> "ясно", "дождь", ...
+    def __init__(self, activities, weather_source=None, describe=None, workers=RECOMMEND_WORKERS):
+        self.activities = activities
+        self.weather_source = weather_source
+        self.describe = describe
+        self.workers = workers
+
+    def options(self, weather, mood, budget, people):
+        options, level = self.activities.current().match(weather, mood, budget, people)
+        return list(options), level
+
+    def _weather(self, city):
+        data = self.weather_source(city)
+        return self.describe(data['weather_code']), data.get('temp')
+
+    # Погода для уникальных городов: {нормализованный город: (описание, темп.) или исключение}
+    def resolve_weather(self, cities):
+        unique = {}
+        for city in cities:
+            unique.setdefault(normalize_city(city), city)
+        if not unique:
+            return {}
+
+        def resolve(city):
+            try:
+                if self.weather_source is None:
+                    raise ValueError(f"Нет данных о погоде для {city}")
+                return self._weather(city)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(unique)))) as executor:
+            results = executor.map(resolve, unique.values())
+            return dict(zip(unique.keys(), results))
+
+    def recommend_batch(self, requests):
+        requests = [as_request(item) for item in requests]
+        weather = self.resolve_weather(r['city'] for r in requests if not r.get('weather'))
+        index = self.activities.current()
+        matches = {}
+        results = []
+        for request in requests:
+            result = dict(request)
+            if request.get('weather'):
+                desc, temp = request['weather'], request.get('temp')
+            else:
+                resolved = weather[normalize_city(request['city'])]
+                if isinstance(resolved, Exception):
+                    result['error'] = str(resolved)
+                    results.append(result)
+                    continue
+                desc, temp = resolved
+            combo = (desc, request.get('mood'), request.get('budget'), request.get('people'))
+            if combo not in matches:
+                matches[combo] = index.match(*combo)
+            options, level = matches[combo]
+            result.update(weather=desc, temp=temp, activities=list(options), match=level)
+            results.append(result)
+        return results
+
+    def recommend(self, city, mood, budget, people):
+        return self.recommend_batch([(city, mood, budget, people)])[0]
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный подбор занятий (JSONL)")
+    parser.add_argument('input', nargs='?', default='-', help="файл запросов JSONL, '-' - stdin")
+    parser.add_argument('-o', '--output', default='-', help="файл результатов JSONL, '-' - stdout")
+    parser.add_argument('--activities', default='activities.json')
+    parser.add_argument('--weather-map', help="JSON {город: описание погоды} вместо OpenWeatherMap")
+    parser.add_argument('--workers', type=int, default=RECOMMEND_WORKERS)
+    args = parser.parse_args(argv)
+
+    weather_map = None
+    if args.weather_map:
+        # Офлайн: погода из файла, без бота и сетевых запросов
+        with open(args.weather_map, 'r', encoding='utf-8') as f:
+            weather_map = {normalize_city(k): v for k, v in json.load(f).items()}
+        engine = RecommendationEngine(ActivityCatalog(args.activities, ACTIVITY_AXES), workers=args.workers)
+    else:
+        import botbotbotbot
+        engine = botbotbotbot.recommendation_engine
+        engine.workers = args.workers
+
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        requests = [as_request(item) for item in read_jsonl(source)]
+        if weather_map is not None:
+            for request in requests:
+                request.setdefault('weather', weather_map.get(normalize_city(request['city'])))
+        started = time.perf_counter()
+        results = engine.recommend_batch(requests)
+        elapsed = time.perf_counter() - started
+        for result in results:
+            target.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    errors = sum(1 for r in results if 'error' in r)
+    print(f"{len(results)} запросов за {elapsed:.3f} с ({len(results) / max(elapsed, 1e-9):.0f}/с), ошибок: {errors}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
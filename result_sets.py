@@ -0,0 +1,129 @@
+import time
+import secrets
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# Результаты поиска заведений на стороне бота: каждый набор мест хранится
+# один раз и получает короткий base62-хэндл, который попадает в callback_data
+# вместо uuid. Место внутри набора находится по (type, id) за O(1),
+# список показывается страницами, листание не делает новых запросов к Overpass.
+# Наборы живут в памяти (LRU + TTL); после перезапуска бота старые кнопки
+# отвечают, что результаты устарели.
+
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+RESULT_HANDLE_LENGTH = 6
+RESULT_SETS_MAX = 2000
+RESULT_SETS_TTL = 6 * 3600
+PLACES_PAGE_SIZE = 8
+
+
+def encode_base62(number):
+    if number == 0:
+        return BASE62[0]
+    digits = []
+    while number:
+        number, rem = divmod(number, 62)
+        digits.append(BASE62[rem])
+    return ''.join(reversed(digits))
+
+
+def new_handle(length=RESULT_HANDLE_LENGTH):
+    return encode_base62(secrets.randbelow(62 ** length)).rjust(length, BASE62[0])
+
+
+def place_key(place_type, place_id):
+    return place_type, str(place_id)
+
+
+@dataclass(slots=True)
+class ResultSet:
+    handle: str
+    chat_id: object
+    city: str
+    category: str
+    places: list
+    index: dict = field(repr=False)
+    created: float = 0.0
+
+    def position(self, place_type, place_id):
+        return self.index.get(place_key(place_type, place_id))
+
+    def find(self, place_type, place_id):
+        pos = self.position(place_type, place_id)
+        return None if pos is None else self.places[pos]
+
+    def pages(self, page_size=PLACES_PAGE_SIZE):
+        return max(1, -(-len(self.places) // page_size))
+
+    def page(self, number, page_size=PLACES_PAGE_SIZE):
+        number = min(max(number, 0), self.pages(page_size) - 1)
+        start = number * page_size
+        return number, self.places[start:start + page_size]
+
+    def page_of(self, place_type, place_id, page_size=PLACES_PAGE_SIZE):
+        pos = self.position(place_type, place_id)
+        return 0 if pos is None else pos // page_size
+
+
+class ResultSetStore:
+    def __init__(self, max_sets=RESULT_SETS_MAX, ttl=RESULT_SETS_TTL,
+                 handle_length=RESULT_HANDLE_LENGTH, clock=time.monotonic):
+        self.max_sets = max_sets
+        self.ttl = ttl
+        self.handle_length = handle_length
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sets = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    # places сохраняется как есть (без копии) - список из кэша мест не меняется
+    def put(self, chat_id, city, category, places):
+        index = {}
+        for pos, place in enumerate(places):
+            index.setdefault(place_key(place['type'], place['id']), pos)
+        with self._lock:
+            handle = new_handle(self.handle_length)
+            while handle in self._sets:
+                handle = new_handle(self.handle_length)
+            result_set = ResultSet(handle, chat_id, city, category, places, index, self.clock())
+            self._sets[handle] = result_set
+            self._evict()
+        logging.debug("Набор результатов %s: %d мест для chat_id: %s", handle, len(places), chat_id)
+        return result_set
+
+    # Чужой хэндл (другой чат) не отличается от устаревшего
+    def get(self, handle, chat_id=None):
+        with self._lock:
+            result_set = self._sets.get(handle)
+            if result_set is None:
+                return None
+            if self.clock() - result_set.created > self.ttl:
+                del self._sets[handle]
+                self.expired += 1
+                return None
+            if chat_id is not None and result_set.chat_id != chat_id:
+                return None
+            self._sets.move_to_end(handle)
+            return result_set
+
+    def _evict(self):
+        now = self.clock()
+        while self._sets:
+            handle, oldest = next(iter(self._sets.items()))
+            if len(self._sets) > self.max_sets:
+                self.evicted += 1
+            elif now - oldest.created > self.ttl:
+                self.expired += 1
+            else:
+                break
+            del self._sets[handle]
+
+    def __len__(self):
+        return len(self._sets)
+
+    def stats(self):
+        with self._lock:
+            return {'sets': len(self._sets), 'expired': self.expired, 'evicted': self.evicted}
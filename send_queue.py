@@ -0,0 +1,388 @@
+import time
+import asyncio
+import threading
+import logging
+from collections import deque
+
+import requests
+
+# Исходящие запросы к Bot API через очередь с ограничением скорости:
+# общий лимит (Telegram - около 30 сообщений в секунду) и лимит на чат
+# (около 1 в секунду в личных чатах, 20 в минуту в группах), оба - token
+# bucket. Ответ 429 не возвращается обработчику: запрос откладывается на
+# retry_after и повторяется. answerCallbackQuery обслуживается вне очереди
+# чатов и раньше остальных - на нажатие кнопки нужно ответить быстро.
+# Повторные editMessageText одного сообщения, ещё не отправленные,
+# схлопываются в один запрос с последним текстом.
+#
+# SendQueue подключается как apihelper.CUSTOM_REQUEST_SENDER (TeleBot),
+# AsyncSendGate - обёрткой asyncio_helper._process_request (AsyncTeleBot).
+
+TG_GLOBAL_RATE = 30
+TG_CHAT_RATE = 1
+TG_CHAT_BURST = 3
+TG_GROUP_RATE = 20 / 60
+TG_SEND_WORKERS = 4
+TG_MAX_RETRIES = 5
+TG_MAX_CHAT_BUCKETS = 10000
+
+# Методы, которые идут через очередь; остальные (getUpdates, setWebhook...) - напрямую
+LIMITED_METHODS = frozenset({
+    'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'answerCallbackQuery',
+    'sendLocation', 'sendPhoto', 'sendDocument', 'deleteMessage', 'forwardMessage', 'copyMessage'
+})
+PRIORITY_METHODS = frozenset({'answerCallbackQuery'})
+COALESCE_METHODS = frozenset({'editMessageText', 'editMessageReplyMarkup'})
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    # Через сколько секунд будет доступен токен (0 - сейчас)
+    def delay(self, now, reserve=0.0):
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        missing = 1.0 + reserve - self.tokens
+        if missing > 0:
+            wait = max(wait, missing / self.rate)
+        return wait
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class RateLimits:
+    def __init__(self, global_rate=TG_GLOBAL_RATE, chat_rate=TG_CHAT_RATE, chat_burst=TG_CHAT_BURST,
+                 group_rate=TG_GROUP_RATE, max_chats=TG_MAX_CHAT_BUCKETS, clock=time.monotonic):
+        self.clock = clock
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_chats = max_chats
+        self.global_bucket = TokenBucket(global_rate, global_rate, clock())
+        self.chats = {}
+
+    def chat_bucket(self, chat_id):
+        if chat_id is None:
+            return None
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= self.max_chats:
+                self._purge()
+            now = self.clock()
+            if str(chat_id).startswith('-'):
+                bucket = TokenBucket(self.group_rate, 1, now)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    # Забываем чаты, чьи корзины уже полностью восстановились
+    def _purge(self):
+        now = self.clock()
+        for chat_id, bucket in list(self.chats.items()):
+            if bucket.delay(now, bucket.burst - 1) == 0:
+                del self.chats[chat_id]
+
+    def delay(self, chat_id, reserve=0.0):
+        now = self.clock()
+        wait = self.global_bucket.delay(now, reserve)
+        bucket = self.chat_bucket(chat_id)
+        if bucket is not None:
+            wait = max(wait, bucket.delay(now))
+        return wait
+
+    def take(self, chat_id):
+        now = self.clock()
+        self.global_bucket.take(now)
+        bucket = self.chat_bucket(chat_id)
+        if bucket is not None:
+            bucket.take(now)
+
+    # 429 по чату откладывает только этот чат, без чата - все запросы
+    def block(self, chat_id, retry_after):
+        until = self.clock() + retry_after
+        bucket = self.chat_bucket(chat_id)
+        (bucket or self.global_bucket).block(until)
+
+
+def api_method(url):
+    return url.rsplit('/', 1)[-1]
+
+
+def chat_of(method_name, params):
+    if not params or method_name in PRIORITY_METHODS:
+        return None
+    return params.get('chat_id')
+
+
+def coalesce_key_of(method_name, params):
+    if method_name in COALESCE_METHODS and params and params.get('message_id') is not None:
+        return method_name, params.get('chat_id'), params.get('message_id')
+    return None
+
+
+class _Outgoing:
+    __slots__ = ('method_name', 'http_method', 'url', 'kwargs', 'chat_id', 'priority',
+                 'coalesce_key', 'attempts', 'event', 'response', 'error')
+
+    def __init__(self, method_name, http_method, url, kwargs):
+        params = kwargs.get('params')
+        self.method_name = method_name
+        self.http_method = http_method
+        self.url = url
+        self.kwargs = kwargs
+        self.chat_id = chat_of(method_name, params)
+        self.priority = 0 if method_name in PRIORITY_METHODS else 1
+        self.coalesce_key = coalesce_key_of(method_name, params)
+        self.attempts = 0
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def retry_after_of(response):
+    try:
+        return float(response.json().get('parameters', {}).get('retry_after'))
+    except (ValueError, TypeError, AttributeError):
+        try:
+            return float(response.headers.get('Retry-After', 1))
+        except (TypeError, ValueError):
+            return 1.0
+
+
+class SendQueue:
+    def __init__(self, limits=None, workers=TG_SEND_WORKERS, max_retries=TG_MAX_RETRIES,
+                 send=None, limited_methods=LIMITED_METHODS):
+        self.limits = limits or RateLimits()
+        self.max_retries = max_retries
+        self.limited_methods = limited_methods
+        self._session = None
+        if send is None:
+            self._session = requests.Session()
+            send = self._session.request
+        self.send = send
+        self._cond = threading.Condition()
+        self._queues = (deque(), deque())
+        self._coalesce = {}
+        self._inflight_chats = set()
+        self._closed = False
+        self.sent = 0
+        self.coalesced = 0
+        self.throttled = 0
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"tg-send-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    # Сигнатура CUSTOM_REQUEST_SENDER: как requests.request
+    def __call__(self, method, url, **kwargs):
+        method_name = api_method(url)
+        if method_name not in self.limited_methods or self._closed:
+            return self.send(method, url, **kwargs)
+
+        item = self._submit(_Outgoing(method_name, method, url, kwargs))
+        item.event.wait()
+        if item.error is not None:
+            raise item.error
+        return item.response
+
+    def _submit(self, item):
+        with self._cond:
+            if item.coalesce_key is not None:
+                pending = self._coalesce.get(item.coalesce_key)
+                if pending is not None:
+                    pending.kwargs = item.kwargs
+                    self.coalesced += 1
+                    return pending
+                self._coalesce[item.coalesce_key] = item
+            self._queues[item.priority].append(item)
+            self._cond.notify()
+        return item
+
+    # Первый запрос (по приоритету и порядку), который можно отправить сейчас;
+    # запросы одного чата уходят строго по очереди
+    def _pick(self):
+        wait = None
+        for queue in self._queues:
+            blocked_chats = set()
+            for item in queue:
+                chat_id = item.chat_id
+                if chat_id is not None and (chat_id in blocked_chats or chat_id in self._inflight_chats):
+                    blocked_chats.add(chat_id)
+                    continue
+                reserve = 0.0 if item.priority == 0 else 1.0
+                delay = self.limits.delay(chat_id, reserve)
+                if delay == 0:
+                    queue.remove(item)
+                    return item, None
+                wait = delay if wait is None else min(wait, delay)
+                if chat_id is not None:
+                    blocked_chats.add(chat_id)
+        return None, wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    item, wait = self._pick()
+                    if item is not None:
+                        break
+                    if self._closed and not any(self._queues):
+                        return
+                    self._cond.wait(wait)
+                self.limits.take(item.chat_id)
+                if item.coalesce_key is not None and self._coalesce.get(item.coalesce_key) is item:
+                    del self._coalesce[item.coalesce_key]
+                if item.chat_id is not None:
+                    self._inflight_chats.add(item.chat_id)
+            self._send(item)
+
+    def _send(self, item):
+        retry = False
+        try:
+            response = self.send(item.http_method, item.url, **item.kwargs)
+            item.attempts += 1
+            if response.status_code == 429 and item.attempts <= self.max_retries:
+                retry_after = retry_after_of(response)
+                logging.warning("Telegram 429 для %s (чат %s), повтор через %s с",
+                                item.method_name, item.chat_id, retry_after)
+                with self._cond:
+                    self.throttled += 1
+                    self.limits.block(item.chat_id, retry_after)
+                retry = True
+            else:
+                item.response = response
+        except Exception as e:
+            item.error = e
+        finally:
+            with self._cond:
+                self._inflight_chats.discard(item.chat_id)
+                if retry:
+                    self._queues[item.priority].appendleft(item)
+                elif item.error is None:
+                    self.sent += 1
+                self._cond.notify_all()
+            if not retry:
+                item.event.set()
+
+    def stats(self):
+        with self._cond:
+            return {'queued': sum(len(q) for q in self._queues), 'sent': self.sent,
+                    'coalesced': self.coalesced, 'throttled': self.throttled}
+
+    def close(self, timeout=10):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        if self._session is not None:
+            self._session.close()
+
+
+class _PendingEdit:
+    __slots__ = ('params', 'future')
+
+    def __init__(self, params, future):
+        self.params = params
+        self.future = future
+
+
+# Асинхронный вариант: ожидание токенов через asyncio.sleep, 429 - повтор
+# после retry_after. Обычным запросам нужен запас в общем лимите,
+# answerCallbackQuery его не требует и лимит чата не расходует.
+# Правки одного сообщения схлопываются, как в SendQueue: пока первая ждёт
+# токен, следующие лишь подменяют её параметры и получают её результат
+class AsyncSendGate:
+    def __init__(self, limits=None, max_retries=TG_MAX_RETRIES, limited_methods=LIMITED_METHODS):
+        self.limits = limits or RateLimits()
+        self.max_retries = max_retries
+        self.limited_methods = limited_methods
+        self._pending = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.throttled = 0
+
+    async def acquire(self, chat_id, priority):
+        reserve = 0.0 if priority else 1.0
+        while True:
+            delay = self.limits.delay(chat_id, reserve)
+            if delay == 0:
+                self.limits.take(chat_id)
+                return
+            await asyncio.sleep(delay)
+
+    def wrap(self, process_request):
+        from telebot.apihelper import ApiTelegramException
+
+        async def send(token, url, method, params, files, kwargs, coalesce_key=None):
+            chat_id = chat_of(url, params)
+            attempt = 0
+            while True:
+                await self.acquire(chat_id, url in PRIORITY_METHODS)
+                if coalesce_key is not None:
+                    # Токен получен: берём последние параметры, новые правки
+                    # этого сообщения пойдут уже отдельным запросом
+                    params = self._pending.pop(coalesce_key).params
+                    coalesce_key = None
+                try:
+                    result = await process_request(token, url, method, params, files, **kwargs)
+                    self.sent += 1
+                    return result
+                except ApiTelegramException as e:
+                    attempt += 1
+                    if e.error_code != 429 or attempt > self.max_retries:
+                        raise
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                    logging.warning("Telegram 429 для %s (чат %s), повтор через %s с", url, chat_id, retry_after)
+                    self.throttled += 1
+                    self.limits.block(chat_id, retry_after)
+
+        async def limited(token, url, method='get', params=None, files=None, **kwargs):
+            if url not in self.limited_methods:
+                return await process_request(token, url, method, params, files, **kwargs)
+            coalesce_key = coalesce_key_of(url, params)
+            if coalesce_key is None:
+                return await send(token, url, method, params, files, kwargs)
+            pending = self._pending.get(coalesce_key)
+            if pending is not None:
+                pending.params = params
+                self.coalesced += 1
+                return await asyncio.shield(pending.future)
+
+            pending = self._pending[coalesce_key] = _PendingEdit(params, asyncio.get_running_loop().create_future())
+            try:
+                result = await send(token, url, method, params, files, kwargs, coalesce_key)
+            except BaseException as e:
+                if self._pending.get(coalesce_key) is pending:
+                    del self._pending[coalesce_key]
+                if isinstance(e, Exception):
+                    pending.future.set_exception(e)
+                    # Исключение получит и тот, кто ждёт; без ожидающих - не предупреждать
+                    pending.future.exception()
+                else:
+                    pending.future.cancel()
+                raise
+            pending.future.set_result(result)
+            return result
+
+        return limited
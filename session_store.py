@@ -0,0 +1,267 @@
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields, asdict
+
+# Хранилище состояний диалогов (user_data): сессии истекают после
+# простоя, число сессий в памяти ограничено (вытеснение LRU), сами сессии -
+# компактные dataclass со __slots__. Необязательно сохраняются в общее
+# хранилище (state_backend.py), чтобы диалоги переживали перезапуск бота
+# и были видны другим процессам; срок хранения там - тот же idle_ttl.
+# Обращения к хранилищу выполняются вне общей блокировки: медленный
+# backend не задерживает чаты, чьи сессии уже в памяти. Запись в хранилище
+# идёт под отдельной блокировкой _io_lock, чтобы сохранение не вернуло
+# только что удалённую сессию.
+
+SESSION_NAMESPACE = 'sessions'
+
+SESSION_IDLE_TTL = 24 * 3600
+SESSION_MAX = 10000
+SESSION_FLUSH_INTERVAL = 5
+
+
+@dataclass(slots=True)
+class Session:
+    step: str = None
+    city: str = None
+    weather: str = None
+    temp: float = None
+    mood: str = None
+    budget: str = None
+    people: str = None
+    activities: list = None
+    query_id: str = None
+    from_query_id: str = None
+    current_query: dict = None
+    current_activities: dict = None
+    touched: float = field(default=0.0, repr=False)
+    dirty: bool = field(default=False, repr=False)
+
+    # Доступ как к словарю, чтобы обработчики работали с сессией как раньше
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in SESSION_FIELDS else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in SESSION_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+        self.dirty = True
+
+    def __contains__(self, key):
+        return key in SESSION_FIELDS and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in SESSION_FIELDS else None
+        return default if value is None else value
+
+    def keep_only(self, keys):
+        for name in SESSION_FIELDS:
+            if name not in keys:
+                setattr(self, name, None)
+        self.dirty = True
+
+    def to_dict(self):
+        data = asdict(self)
+        data.pop('touched')
+        data.pop('dirty')
+        return {k: v for k, v in data.items() if v is not None}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: v for k, v in data.items() if k in SESSION_FIELDS})
+
+
+SESSION_FIELDS = frozenset(f.name for f in fields(Session)) - {'touched', 'dirty'}
+
+
+class SessionStore:
+    def __init__(self, idle_ttl=SESSION_IDLE_TTL, max_sessions=SESSION_MAX, backend=None,
+                 flush_interval=SESSION_FLUSH_INTERVAL, clock=time.time):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._saving = {}
+        self._stop = threading.Event()
+        self.expired = 0
+        self.evicted = 0
+        self.backend = backend
+        if backend is not None and flush_interval:
+            threading.Thread(target=self._flush_loop, name="sessions-flush", daemon=True).start()
+
+    # Словарный интерфейс: user_data.get(chat_id, {}), user_data[chat_id] = {...}
+    def get(self, chat_id, default=None):
+        session = self._get(chat_id)
+        return default if session is None else session
+
+    def __getitem__(self, chat_id):
+        session = self._get(chat_id)
+        if session is None:
+            raise KeyError(chat_id)
+        return session
+
+    def __setitem__(self, chat_id, value):
+        session = value if isinstance(value, Session) else Session.from_dict(value)
+        session.touched = self.clock()
+        session.dirty = True
+        with self._lock:
+            self._sessions[chat_id] = session
+            self._sessions.move_to_end(chat_id)
+            evicted = self._evict()
+        self._save_evicted(evicted)
+
+    def __contains__(self, chat_id):
+        return self._get(chat_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def setdefault(self, chat_id, default=None):
+        session = self._get(chat_id)
+        if session is None:
+            self[chat_id] = default or {}
+            session = self._get(chat_id)
+        return session
+
+    def pop(self, chat_id, default=None):
+        with self._lock:
+            session = self._sessions.pop(chat_id, None)
+            self._saving.pop(chat_id, None)
+        self._delete(chat_id)
+        return default if session is None else session
+
+    def _get(self, chat_id):
+        now = self.clock()
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is None:
+                session = self._saving.get(chat_id)
+        if session is None:
+            session = self._load(chat_id)
+            if session is None:
+                return None
+        with self._lock:
+            # пока сессия читалась из хранилища, её могли создать в памяти
+            session = self._sessions.setdefault(chat_id, session)
+            if now - session.touched > self.idle_ttl:
+                del self._sessions[chat_id]
+                self._saving.pop(chat_id, None)
+                self.expired += 1
+                expired = True
+            else:
+                expired = False
+                session.touched = now
+                self._sessions.move_to_end(chat_id)
+                evicted = self._evict()
+        if expired:
+            self._delete(chat_id)
+            return None
+        self._save_evicted(evicted)
+        return session
+
+    # Вытесненные изменённые сессии до записи в хранилище остаются
+    # в _saving, чтобы _get не прочитал из хранилища старую версию
+    def _evict(self):
+        evicted = []
+        while len(self._sessions) > self.max_sessions:
+            chat_id, session = self._sessions.popitem(last=False)
+            self.evicted += 1
+            if session.dirty and self.backend is not None:
+                self._saving[chat_id] = session
+                evicted.append((chat_id, session))
+        return evicted
+
+    # Сессия, удалённая через pop() до записи, не сохраняется
+    def _save_evicted(self, evicted):
+        for chat_id, session in evicted:
+            with self._io_lock:
+                with self._lock:
+                    if self._saving.get(chat_id) is not session:
+                        continue
+                    data = json.dumps(session.to_dict(), ensure_ascii=False)
+                try:
+                    self.backend.set(SESSION_NAMESPACE, chat_id, data, ttl=self.idle_ttl)
+                except Exception as e:
+                    logging.error("Ошибка при сохранении сессии %s: %s", chat_id, e)
+            with self._lock:
+                if self._saving.get(chat_id) is session:
+                    del self._saving[chat_id]
+
+    # Удаление простаивающих сессий из памяти; в хранилище они истекают
+    # по TTL, истёкшие записи SQLite удаляются здесь же
+    def sweep(self):
+        deadline = self.clock() - self.idle_ttl
+        with self._lock:
+            stale = [chat_id for chat_id, s in self._sessions.items() if s.touched < deadline]
+            for chat_id in stale:
+                del self._sessions[chat_id]
+            self.expired += len(stale)
+        if self.backend is not None:
+            self.backend.purge()
+        return len(stale)
+
+    # Снимок изменённых сессий - под общей блокировкой, запись - вне её;
+    # при ошибке записи сессии снова помечаются изменёнными
+    def flush(self):
+        if self.backend is None:
+            return 0
+        with self._io_lock:
+            with self._lock:
+                rows = []
+                flushed = []
+                for chat_id, session in self._sessions.items():
+                    if session.dirty:
+                        rows.append((chat_id, json.dumps(session.to_dict(), ensure_ascii=False)))
+                        flushed.append(session)
+                        session.dirty = False
+            if not rows:
+                return 0
+            try:
+                self.backend.set_many(SESSION_NAMESPACE, rows, ttl=self.idle_ttl)
+            except Exception:
+                for session in flushed:
+                    session.dirty = True
+                raise
+        return len(rows)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.sweep()
+            except Exception as e:
+                logging.error("Ошибка при сохранении сессий: %s", e)
+
+    # Запись в хранилище не старше idle_ttl, поэтому сессия считается
+    # использованной сейчас
+    def _load(self, chat_id):
+        if self.backend is None:
+            return None
+        data = self.backend.get(SESSION_NAMESPACE, chat_id)
+        if data is None:
+            return None
+        session = Session.from_dict(json.loads(data))
+        session.touched = self.clock()
+        return session
+
+    def _delete(self, chat_id):
+        if self.backend is not None:
+            with self._io_lock:
+                self.backend.delete(SESSION_NAMESPACE, chat_id)
+
+    def stats(self):
+        with self._lock:
+            return {'sessions': len(self._sessions), 'expired': self.expired, 'evicted': self.evicted}
+
+    def close(self):
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,317 @@
+import time
+import socket
+import sqlite3
+import threading
+import logging
+from urllib.parse import urlparse, unquote
+
+# Общее хранилище состояния для нескольких процессов бота: сессии,
+# избранное, история и второй уровень кэшей. Интерфейс - строки по
+# (namespace, key) с необязательным TTL и списки с обрезкой до последних
+# N элементов:
+#   get/set/set_many/add/delete, push/range, purge, close
+# SQLiteBackend - один файл в режиме WAL (процессы на одной машине),
+# RedisBackend - любой сервер с протоколом Redis (RESP), без сторонних
+# библиотек. open_state_backend(url) выбирает реализацию по URL:
+#   state.db, sqlite:///var/lib/bot/state.db, redis://:pass@host:6379/0
+
+SQLITE_BUSY_TIMEOUT = 10
+REDIS_PORT = 6379
+REDIS_TIMEOUT = 5
+REDIS_PREFIX = 'bot:'
+# Команды, повтор которых после обрыва не меняет результат (SET - без NX)
+REDIS_IDEMPOTENT = frozenset({'GET', 'SET', 'DEL', 'LRANGE'})
+
+
+class RedisError(Exception):
+    pass
+
+
+class SQLiteBackend:
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " ns TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires REAL,"
+            " PRIMARY KEY (ns, key)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires) WHERE expires IS NOT NULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lists ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " ns TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lists_key ON lists (ns, key, seq)")
+
+    def _expires(self, ttl):
+        return self.clock() + ttl if ttl else None
+
+    def get(self, ns, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE ns = ? AND key = ? AND (expires IS NULL OR expires > ?)",
+                (ns, str(key), self.clock())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, ns, key, value, ttl=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (ns, key, value, expires) VALUES (?, ?, ?, ?)",
+                (ns, str(key), value, self._expires(ttl))
+            )
+
+    def set_many(self, ns, items, ttl=None):
+        expires = self._expires(ttl)
+        rows = [(ns, str(key), value, expires) for key, value in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO kv (ns, key, value, expires) VALUES (?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # Запись, только если ключа ещё нет (или он истёк); True - записали мы
+    def add(self, ns, key, value, ttl=None):
+        now = self.clock()
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE ns = ? AND key = ? AND expires <= ?", (ns, str(key), now))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO kv (ns, key, value, expires) VALUES (?, ?, ?, ?)",
+                (ns, str(key), value, self._expires(ttl))
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, ns, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE ns = ? AND key = ?", (ns, str(key)))
+
+    # Добавление в конец списка; keep - сколько последних элементов оставить
+    def push(self, ns, key, value, keep=None):
+        key = str(key)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("INSERT INTO lists (ns, key, value) VALUES (?, ?, ?)", (ns, key, value))
+                if keep:
+                    self._conn.execute(
+                        "DELETE FROM lists WHERE ns = ? AND key = ? AND seq <= ("
+                        " SELECT seq FROM lists WHERE ns = ? AND key = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                        (ns, key, ns, key, keep)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # Последние limit элементов списка, от старых к новым
+    def range(self, ns, key, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT value FROM lists WHERE ns = ? AND key = ? ORDER BY seq DESC LIMIT ?",
+                (ns, str(key), limit)
+            ).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def purge(self):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM kv WHERE expires <= ?", (self.clock(),))
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisBackend:
+    def __init__(self, host='127.0.0.1', port=REDIS_PORT, db=0, password=None, prefix=REDIS_PREFIX,
+                 timeout=REDIS_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def _key(self, ns, key):
+        return f"{self.prefix}{ns}:{key}"
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile('rb')
+        if self.password:
+            self._call_locked([('AUTH', self.password)])
+        if self.db:
+            self._call_locked([('SELECT', self.db)])
+
+    # Соединение, закрытое сервером за время простоя, видно до отправки:
+    # сокет читается (EOF, ошибка или лишние данные), хотя ответов мы не ждём
+    def _connected(self):
+        try:
+            self._sock.setblocking(False)
+            try:
+                self._sock.recv(1, socket.MSG_PEEK)
+            finally:
+                self._sock.settimeout(self.timeout)
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    @staticmethod
+    def _encode(command):
+        parts = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis закрыл соединение")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            return RedisError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2].decode('utf-8')
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Неизвестный ответ Redis: {line!r}")
+
+    # Несколько команд одним пакетом (pipelining), ответы - по порядку
+    def _call_locked(self, commands):
+        self._sock.sendall(b''.join(self._encode(command) for command in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    @staticmethod
+    def _idempotent(commands):
+        return all(command[0] in REDIS_IDEMPOTENT and 'NX' not in command[3:] for command in commands)
+
+    # Повтор - только если команды ещё не отправлялись или их повтор
+    # безопасен: после обрыва посреди ответа RPUSH мог уже выполниться,
+    # а SET NX - занять ключ
+    def _call(self, *commands):
+        with self._lock:
+            for attempt in (1, 2):
+                sent = False
+                try:
+                    if self._sock is not None and not self._connected():
+                        self._disconnect()
+                    if self._sock is None:
+                        self._connect()
+                    sent = True
+                    return self._call_locked(commands)
+                except OSError as e:
+                    self._disconnect()
+                    if attempt == 2 or (sent and not self._idempotent(commands)):
+                        raise
+                    logging.warning("Redis %s:%s: переподключение после ошибки: %s", self.host, self.port, e)
+
+    def _set_command(self, ns, key, value, ttl=None):
+        command = ['SET', self._key(ns, key), value]
+        if ttl:
+            command += ['PX', int(ttl * 1000)]
+        return command
+
+    def get(self, ns, key):
+        return self._call(('GET', self._key(ns, key)))[0]
+
+    def set(self, ns, key, value, ttl=None):
+        self._call(self._set_command(ns, key, value, ttl))
+
+    def set_many(self, ns, items, ttl=None):
+        commands = [self._set_command(ns, key, value, ttl) for key, value in items]
+        if commands:
+            self._call(*commands)
+
+    def add(self, ns, key, value, ttl=None):
+        return self._call(self._set_command(ns, key, value, ttl) + ['NX'])[0] == 'OK'
+
+    def delete(self, ns, key):
+        self._call(('DEL', self._key(ns, key)))
+
+    def push(self, ns, key, value, keep=None):
+        name = self._key(ns, key)
+        if keep:
+            self._call(('RPUSH', name, value), ('LTRIM', name, -keep, -1))
+        else:
+            self._call(('RPUSH', name, value))
+
+    def range(self, ns, key, limit):
+        return self._call(('LRANGE', self._key(ns, key), -limit, -1))[0] or []
+
+    # Истечение ключей Redis выполняет сам
+    def purge(self):
+        return 0
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+def open_state_backend(url):
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme in ('redis', 'rediss'):
+        if parsed.scheme == 'rediss':
+            raise ValueError("TLS для Redis не поддерживается, используйте redis://")
+        db = int(parsed.path.lstrip('/') or 0)
+        backend = RedisBackend(
+            host=parsed.hostname or '127.0.0.1',
+            port=parsed.port or REDIS_PORT,
+            db=db,
+            password=unquote(parsed.password) if parsed.password else None
+        )
+        logging.info("Общее состояние: Redis %s:%s/%s", backend.host, backend.port, db)
+        return backend
+    path = url[len('sqlite://'):] if url.startswith('sqlite://') else url
+    logging.info("Общее состояние: SQLite %s", path)
+    return SQLiteBackend(path)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Заглушки внешних сервисов (FakeServices, FakeRedis) из benchmarks/
+sys.path.insert(1, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,126 @@
+import json
+import random
+import itertools
+
+import pytest
+
+from activities_index import (
+    ACTIVITY_AXES, BUDGETS, MOODS, NO_OPTIONS, PEOPLE, ActivityCatalog, ActivityIndex, nearest_values
+)
+from weather import WEATHER_TYPES
+
+ALL_KEYS = ['_'.join(combo) for combo in itertools.product(*ACTIVITY_AXES)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def sparse_activities(seed, share):
+    rng = random.Random(seed)
+    return {key: [f"{key} {i}" for i in range(rng.randint(1, 3))] for key in ALL_KEYS if rng.random() < share}
+
+
+def nearest(values, value):
+    return [values[i] for i in nearest_values(values, values.index(value))]
+
+
+# Прежний поиск по словарю activities.json, дополненный той же цепочкой
+# ослаблений: бюджет -> люди -> погода -> любые варианты
+def legacy_lookup(activities, weather, mood, budget, people):
+    def get(*parts):
+        return activities.get('_'.join(parts))
+
+    chain = [
+        ('exact', [(weather, mood, budget, people)]),
+        ('budget', [(weather, mood, b, people) for b in nearest(BUDGETS, budget)]),
+        ('people', [(weather, mood, b, p) for b in nearest(BUDGETS, budget) for p in nearest(PEOPLE, people)]),
+        ('weather', [(w, mood, b, p) for w in nearest(WEATHER_TYPES, weather)
+                     for b in nearest(BUDGETS, budget) for p in nearest(PEOPLE, people)]),
+    ]
+    for level, keys in chain:
+        for parts in keys:
+            if get(*parts):
+                return list(dict.fromkeys(get(*parts))), level
+    options = [option for key in activities for option in activities[key]]
+    return list(dict.fromkeys(options)) or list(NO_OPTIONS), 'any'
+
+
+@pytest.mark.parametrize('seed, share', [(1, 1.0), (2, 0.5), (3, 0.1), (4, 0.01)])
+def test_index_matches_legacy_lookup_for_every_key(seed, share):
+    activities = sparse_activities(seed, share)
+    index = ActivityIndex(activities, ACTIVITY_AXES)
+    for key in ALL_KEYS:
+        options, level = index.match(*key.split('_'))
+        expected_options, expected_level = legacy_lookup(activities, *key.split('_'))
+        assert (list(options), level) == (expected_options, expected_level), key
+        if key in activities:
+            assert level == 'exact'
+            assert list(options) == activities[key]
+
+
+def test_fallback_order():
+    activities = {
+        'ясно_активное_средний_пара': ['велосипед'],
+        'ясно_активное_низкий_один': ['пробежка'],
+        'дождь_расслабленное_средний_один': ['кино'],
+        'облачно_экстремальное_неограниченный_компания': ['картинг'],
+    }
+    index = ActivityIndex(activities, ACTIVITY_AXES)
+
+    assert index.match('ясно', 'активное', 'средний', 'пара') == (('велосипед',), 'exact')
+    assert index.match('ясно', 'активное', 'неограниченный', 'пара') == (('велосипед',), 'budget')
+    assert index.match('ясно', 'активное', 'средний', 'компания') == (('велосипед',), 'people')
+    assert index.match('ясно', 'активное', 'низкий', 'компания') == (('пробежка',), 'people')
+    assert index.match('снег', 'расслабленное', 'средний', 'один') == (('кино',), 'weather')
+    assert index.match('ясно', 'экстремальное', 'средний', 'пара') == (('картинг',), 'weather')
+    # Значение не из осей совпадает с любым значением своей оси
+    assert index.match('ясно', 'неизвестное', 'средний', 'пара') == (('велосипед',), 'exact')
+    assert index.match('туман', 'экстремальное', 'средний', 'компания') == (('картинг',), 'budget')
+
+    # Настроение не ослабляется: без вариантов для него - все варианты файла
+    index = ActivityIndex({k: v for k, v in activities.items() if 'экстремальное' not in k}, ACTIVITY_AXES)
+    assert index.match('ясно', 'экстремальное', 'средний', 'пара') == (('велосипед', 'пробежка', 'кино'), 'any')
+
+
+def test_empty_file_gives_no_options():
+    index = ActivityIndex({}, ACTIVITY_AXES)
+    assert index.lookup('ясно', 'активное', 'средний', 'пара') == NO_OPTIONS
+    assert index.stats()['levels'] == {'any': len(index.cells)}
+
+
+def write(path, activities):
+    path.write_text(json.dumps(activities, ensure_ascii=False), encoding='utf-8')
+
+
+def test_catalog_reloads_changed_file(tmp_path):
+    path = tmp_path / 'activities.json'
+    write(path, {'ясно_активное_средний_пара': ['велосипед']})
+    clock = Clock()
+    catalog = ActivityCatalog(str(path), check_interval=2, clock=clock)
+    assert catalog.lookup('ясно', 'активное', 'средний', 'пара') == ('велосипед',)
+
+    write(path, {'ясно_активное_средний_пара': ['велосипед', 'ролики']})
+    clock.now += 1
+    assert catalog.lookup('ясно', 'активное', 'средний', 'пара') == ('велосипед',)
+    clock.now += 1
+    assert catalog.lookup('ясно', 'активное', 'средний', 'пара') == ('велосипед', 'ролики')
+
+
+def test_catalog_keeps_index_when_file_breaks(tmp_path):
+    path = tmp_path / 'activities.json'
+    write(path, {'ясно_активное_средний_пара': ['велосипед']})
+    clock = Clock()
+    catalog = ActivityCatalog(str(path), check_interval=2, clock=clock)
+
+    path.write_text('{"ясно_активное', encoding='utf-8')
+    clock.now += 2
+    assert catalog.lookup('ясно', 'активное', 'средний', 'пара') == ('велосипед',)
+
+    write(path, {'ясно_активное_средний_пара': ['самокат']})
+    clock.now += 2
+    assert catalog.lookup('ясно', 'активное', 'средний', 'пара') == ('самокат',)
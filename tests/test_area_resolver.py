@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from area_resolver import AreaInfo, AreaResolver, build_area_query, normalize_area_name, pick_area
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'areas.json')
+
+OMSK = AreaInfo(3600140292, 'Омск', 54.8536613, 73.0742098, 55.1538476, 73.6243305)
+
+
+class FakeOverpass:
+    def __init__(self, areas=None, error=None):
+        self.areas = areas or {}
+        self.error = error
+        self.calls = []
+
+    def __call__(self, city):
+        self.calls.append(city)
+        if self.error is not None:
+            raise self.error
+        return self.areas.get(city)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def make_resolver(tmp_path):
+    resolvers = []
+
+    def make(fetch=None, clock=None):
+        kwargs = {'clock': clock} if clock is not None else {}
+        resolver = AreaResolver(fetch=fetch, db_path=str(tmp_path / 'areas.db'), **kwargs)
+        resolver.load_fixture(FIXTURE)
+        resolvers.append(resolver)
+        return resolver
+
+    yield make
+    for resolver in resolvers:
+        resolver.close()
+
+
+@pytest.mark.parametrize('city', ['Москва', 'г. Москва', 'город  москва', 'Moscow', 'Мск'])
+def test_known_names_resolve_offline(make_resolver, city):
+    fetch = FakeOverpass()
+    resolver = make_resolver(fetch)
+    assert resolver.resolve(city).area_id == 3602555133
+    assert fetch.calls == []
+
+
+def test_similar_name_is_fetched_not_guessed(make_resolver):
+    fetch = FakeOverpass({'Омск': OMSK})
+    resolver = make_resolver(fetch)
+    assert resolver.lookup('Омск') == (None, False)
+    assert resolver.resolve('Омск') == OMSK
+    assert fetch.calls == ['Омск']
+    assert resolver.resolve('Томск').area_id == 3601631855
+
+
+def test_similar_name_is_not_guessed_when_fetch_fails(make_resolver):
+    fetch = FakeOverpass(error=ConnectionError("overpass down"))
+    resolver = make_resolver(fetch)
+    assert resolver.resolve('Омск') is None
+    assert resolver.lookup('Омск') == (None, False)
+
+
+def test_typo_falls_back_to_suggestion_without_storing_it(make_resolver):
+    fetch = FakeOverpass()
+    resolver = make_resolver(fetch)
+    assert resolver.resolve('Новосибирк').area_id == 3601751445
+    assert fetch.calls == ['Новосибирк']
+    # отрицательный результат в кэше, подсказка - нет
+    assert resolver.lookup('Новосибирк') == (None, True)
+    assert resolver.resolve('Новосибирк').area_id == 3601751445
+    assert fetch.calls == ['Новосибирк']
+
+
+def test_suggestion_is_not_persisted(make_resolver, tmp_path):
+    make_resolver(FakeOverpass()).resolve('Новосибирк')
+    reopened = AreaResolver(db_path=str(tmp_path / 'areas.db'))
+    try:
+        assert reopened.lookup('Новосибирк') == (None, True)
+        assert normalize_area_name('Новосибирк') not in [
+            key for key, (info, _) in reopened._memory.items() if info is not None
+        ]
+    finally:
+        reopened.close()
+
+
+def test_negative_result_expires(make_resolver):
+    clock = Clock()
+    fetch = FakeOverpass()
+    resolver = make_resolver(fetch, clock)
+    assert resolver.resolve('Нигдеград') is None
+    resolver.resolve('Нигдеград')
+    assert fetch.calls == ['Нигдеград']
+    clock.now += resolver.negative_ttl + 1
+    fetch.areas['Нигдеград'] = OMSK
+    assert resolver.resolve('Нигдеград') == OMSK
+    assert fetch.calls == ['Нигдеград', 'Нигдеград']
+
+
+def test_pick_area_prefers_city():
+    elements = [
+        {'type': 'relation', 'id': 1, 'tags': {'name': 'Омск', 'admin_level': '4'},
+         'bounds': {'minlat': 53.4, 'minlon': 70.3, 'maxlat': 58.6, 'maxlon': 76.3}},
+        {'type': 'relation', 'id': 140292, 'tags': {'name': 'Омск', 'place': 'city', 'population': '1 110 000'},
+         'bounds': {'minlat': 54.85, 'minlon': 73.07, 'maxlat': 55.15, 'maxlon': 73.62}},
+        {'type': 'node', 'id': 3, 'tags': {'name': 'Омск', 'place': 'city'}},
+    ]
+    area = pick_area(elements)
+    assert area.area_id == 3600140292
+    assert area.bbox == (54.85, 73.07, 55.15, 73.62)
+
+
+def test_area_query_escapes_city_name():
+    query = build_area_query('Нью "Васюки" \\')
+    assert query.count('["name"="Нью \\"Васюки\\" \\\\"]') == 2
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import logging
+import subprocess
+import importlib
+import traceback
+
+import pytest
+import telebot
+
+
+# Импорт бота требует токены и создаёт лог и файлы данных в текущем
+# каталоге, поэтому модуль импортируется во временном каталоге
+@pytest.fixture(scope='module')
+def b(tmp_path_factory):
+    cwd = os.getcwd()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('TELEGRAM_BOT_TOKEN', '123:TEST')
+        mp.setenv('OPENWEATHERMAP_API_KEY', 'TEST')
+        os.chdir(tmp_path_factory.mktemp('bot'))
+        try:
+            return importlib.import_module('botbotbotbot')
+        finally:
+            os.chdir(cwd)
+
+
+@pytest.fixture
+def owm(b, monkeypatch):
+    monkeypatch.setattr(b, 'OWM_API_KEY', 'SECRET-KEY')
+    monkeypatch.setattr(b.owm_client, 'retries', 0)
+    monkeypatch.setattr(b.owm_client.breaker, 'failure_threshold', 1000)
+    return monkeypatch
+
+
+def test_weather_connection_error_does_not_leak_api_key(b, owm, caplog):
+    # Порт закрыт: ConnectionError, в тексте которого есть URL с appid
+    owm.setattr(b, 'OWM_URL', 'http://127.0.0.1:9/data/2.5/weather')
+    with caplog.at_level(logging.DEBUG):
+        with pytest.raises(b.WeatherError) as info:
+            b.fetch_weather_data('Москва')
+    assert 'SECRET-KEY' not in caplog.text
+    assert 'SECRET-KEY' not in str(info.value)
+    assert 'SECRET-KEY' not in ''.join(traceback.format_exception(info.value))
+    assert 'ConnectionError' in caplog.text
+    assert 'Москва' in caplog.text
+
+
+def test_weather_http_error_logs_status_only(b, owm, caplog):
+    class Response:
+        status_code = 401
+
+        def raise_for_status(self):
+            import requests
+            raise requests.HTTPError(f"401 Client Error for url: {b.OWM_URL}?appid={b.OWM_API_KEY}", response=self)
+
+    owm.setattr(b.owm_client, 'get', lambda url, **kwargs: Response())
+    with caplog.at_level(logging.DEBUG):
+        with pytest.raises(b.WeatherError) as info:
+            b.fetch_weather_data('Казань')
+    assert 'SECRET-KEY' not in caplog.text
+    assert 'SECRET-KEY' not in str(info.value)
+    assert 'статус 401' in caplog.text
+
+
+def test_unknown_city_is_cached_for_negative_ttl(b, owm):
+    class Clock:
+        now = 1000.0
+
+        def __call__(self):
+            return self.now
+
+    class Response:
+        status_code = 404
+
+    requested = []
+
+    def get(url, params=None, **kwargs):
+        requested.append(params['q'])
+        return Response()
+
+    clock = Clock()
+    owm.setattr(b.owm_client, 'get', get)
+    owm.setattr(b.weather_cache, 'clock', clock)
+    try:
+        for _ in range(3):
+            with pytest.raises(b.CityNotFoundError):
+                b.get_weather_data('Нигдеград')
+        assert requested == ['Нигдеград']
+
+        clock.now += b.WEATHER_CACHE_NEGATIVE_TTL
+        with pytest.raises(b.CityNotFoundError):
+            b.get_weather_data('Нигдеград')
+        assert requested == ['Нигдеград'] * 2
+    finally:
+        b.weather_cache.clear()
+
+
+def message(chat_id, text):
+    return telebot.types.Message.de_json({
+        'message_id': chat_id, 'date': 0, 'text': text,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Тест'},
+    })
+
+
+def test_next_step_handlers_fire_for_every_chat_in_batch(b):
+    # Переопределяемый метод должен остаться в установленной версии telebot
+    assert hasattr(telebot.TeleBot, '_notify_next_handlers')
+
+    received = []
+    for chat_id in (1, 2):
+        b.bot.register_next_step_handler_by_chat_id(chat_id, lambda m: received.append((m.chat.id, m.text)))
+    batch = [message(1, 'Москва'), message(2, 'Казань')]
+    b.bot._notify_next_handlers(batch)
+
+    assert received == [(1, 'Москва'), (2, 'Казань')]
+    assert batch == []
+
+    # Без ожидающих ввода сообщение остаётся в пачке для обычных обработчиков
+    b.bot.register_next_step_handler_by_chat_id(4, lambda m: received.append((m.chat.id, m.text)))
+    batch = [message(3, '/start'), message(4, 'Омск')]
+    b.bot._notify_next_handlers(batch)
+    assert received[-1] == (4, 'Омск')
+    assert [m.chat.id for m in batch] == [3]
+
+
+# Импорт в отдельном процессе: без файлов в рабочем каталоге и без потоков
+@pytest.mark.parametrize('module', ['botbotbotbot', 'async_bot'])
+def test_import_creates_no_files_or_threads(module, tmp_path):
+    script = (
+        "import os, json, threading\n"
+        "before = threading.active_count()\n"
+        f"import {module}\n"
+        "print(json.dumps({'threads': threading.active_count() - before, 'files': os.listdir('.')}))\n"
+    )
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN='123:TEST', OPENWEATHERMAP_API_KEY='TEST',
+               PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.splitlines()[-1]) == {'threads': 0, 'files': []}
@@ -0,0 +1,238 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from cache import TTLCache
+from state_backend import SQLiteBackend
+
+WAIT = 5
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + WAIT
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_value_expires_after_ttl(clock):
+    cache = TTLCache('t', ttl=10, clock=clock)
+    cache.set('a', 1)
+    clock.now += 9.9
+    assert cache.get('a') == 1
+    assert cache.ttl_left('a') == pytest.approx(0.1)
+    clock.now += 0.1
+    assert cache.get('a') is None
+
+
+def test_get_or_load_reloads_expired_value(clock):
+    cache = TTLCache('t', ttl=10, clock=clock)
+    values = iter([1, 2])
+    assert cache.get_or_load('a', lambda: next(values)) == 1
+    assert cache.get_or_load('a', lambda: next(values)) == 1
+    clock.now += 10
+    assert cache.get_or_load('a', lambda: next(values)) == 2
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+
+def test_lru_eviction_by_entries(clock):
+    cache = TTLCache('t', ttl=10, max_entries=2, clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_eviction_by_bytes(clock):
+    cache = TTLCache('t', ttl=10, max_bytes=10, sizeof=len, clock=clock)
+    cache.set('a', 'xxxx')
+    cache.set('b', 'yyyy')
+    cache.set('c', 'zzzz')
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 8
+
+    # Значение больше всего бюджета не кэшируется и ничего не вытесняет
+    cache.set('d', 'x' * 11)
+    assert cache.get('d') is None
+    assert (cache.get('b'), cache.get('c')) == ('yyyy', 'zzzz')
+
+
+def test_stale_value_is_returned_and_refreshed_once(clock):
+    cache = TTLCache('t', ttl=10, stale_ttl=30, clock=clock)
+    cache.set('a', 1)
+    clock.now += 15
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(WAIT)
+        return 2
+
+    assert [cache.get_or_load('a', loader) for _ in range(5)] == [1] * 5
+    release.set()
+    wait_for(lambda: cache.get('a') == 2)
+    assert len(calls) == 1
+    assert cache.stats()['stale_hits'] == 5
+
+    # После stale_ttl устаревшее значение уже не отдаётся
+    clock.now += 10 + 30
+    assert cache.get_or_load('a', lambda: 3) == 3
+
+
+def test_failed_refresh_keeps_stale_value(clock):
+    cache = TTLCache('t', ttl=10, stale_ttl=30, clock=clock)
+    cache.set('a', 1)
+    clock.now += 15
+
+    def loader():
+        raise ValueError("нет ответа")
+
+    assert cache.get_or_load('a', loader) == 1
+    wait_for(lambda: not cache._inflight)
+    assert cache.get_or_load('a', lambda: 2) == 1
+
+
+def test_negative_result_is_cached_for_negative_ttl(clock):
+    class NotFound(Exception):
+        pass
+
+    cache = TTLCache('t', ttl=10, negative_ttl=60, is_negative=lambda e: isinstance(e, NotFound), clock=clock)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        raise NotFound("город не найден")
+
+    for _ in range(3):
+        with pytest.raises(NotFound):
+            cache.get_or_load('a', loader)
+    assert len(calls) == 1
+    assert cache.stats()['negative_hits'] == 2
+    assert cache.get('a') is None
+
+    clock.now += 60
+    with pytest.raises(NotFound):
+        cache.get_or_load('a', loader)
+    assert len(calls) == 2
+
+
+def run_concurrently(cache, count, loader):
+    results = [None] * count
+    errors = [None] * count
+
+    def call(i):
+        try:
+            results[i] = cache.get_or_load('a', loader)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,), daemon=True) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_single_flight_calls_loader_once():
+    cache = TTLCache('t', ttl=10)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(WAIT)
+        return 'value'
+
+    threads, results, errors = run_concurrently(cache, 8, loader)
+    wait_for(lambda: cache.stats()['coalesced'] == 7)
+    release.set()
+    for thread in threads:
+        thread.join(WAIT)
+
+    assert len(calls) == 1
+    assert results == ['value'] * 8
+    assert errors == [None] * 8
+
+
+def test_single_flight_passes_error_to_followers():
+    cache = TTLCache('t', ttl=10)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(WAIT)
+        raise ValueError("нет ответа")
+
+    threads, results, errors = run_concurrently(cache, 5, loader)
+    wait_for(lambda: cache.stats()['coalesced'] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(WAIT)
+
+    assert len(calls) == 1
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert len({id(e) for e in errors}) == 1
+    # Ошибка без negative_ttl не кэшируется
+    assert cache.get_or_load('a', lambda: 'ok') == 'ok'
+
+
+def test_async_single_flight_calls_loader_once():
+    cache = TTLCache('t', ttl=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_load('a', loader) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['value'] * 5
+    assert len(calls) == 1
+
+
+def test_shared_level_round_trip(tmp_path, clock):
+    backend = SQLiteBackend(str(tmp_path / 'state.db'))
+    first = TTLCache('t', ttl=60, shared=backend, clock=clock)
+    second = TTLCache('t', ttl=60, shared=backend, clock=clock)
+
+    assert first.get_or_load(('Москва', 'cafe'), lambda: [{'id': 1}]) == [{'id': 1}]
+    assert second.get_or_load(('Москва', 'cafe'), lambda: pytest.fail("загрузчик не нужен")) == [{'id': 1}]
+    assert second.stats()['shared_hits'] == 1
+    assert 0 < second.ttl_left(('Москва', 'cafe')) <= 60
+    backend.close()
+
+
+def test_shared_errors_fall_back_to_loader(clock):
+    class Broken:
+        def get(self, ns, key):
+            raise OSError("нет соединения")
+
+        def set(self, ns, key, value, ttl=None):
+            raise OSError("нет соединения")
+
+    cache = TTLCache('t', ttl=60, shared=Broken(), clock=clock)
+    assert cache.get_or_load('a', lambda: 1) == 1
+    assert cache.get('a') == 1
+    assert cache.stats()['shared_errors'] == 2
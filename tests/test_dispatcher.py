@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+
+import telebot
+from telebot import types
+
+from dispatcher import ChatDispatcher
+
+
+def make_bot(num_threads=8, **kwargs):
+    bot = telebot.TeleBot('123:test', threaded=False, validate_token=False)
+    bot.threaded = True
+    bot.worker_pool = ChatDispatcher(bot, num_threads=num_threads, **kwargs)
+    return bot
+
+
+def make_update(update_id, chat_id, text):
+    return types.Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': text,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'}
+    }})
+
+
+# Синтетический поток: сообщения чатов перемешаны, как в пачке getUpdates
+def synthetic_updates(chats, per_chat):
+    updates = []
+    update_id = 0
+    for n in range(per_chat):
+        order = list(range(1, chats + 1))
+        random.shuffle(order)
+        for chat_id in order:
+            update_id += 1
+            updates.append(make_update(update_id, chat_id, str(n)))
+    return updates
+
+
+def test_updates_of_one_chat_run_in_order_and_never_overlap():
+    bot = make_bot()
+    seen = {}
+    active = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    @bot.message_handler(func=lambda message: True)
+    def handle(message):
+        chat_id = message.chat.id
+        with lock:
+            if chat_id in active:
+                overlaps.append(chat_id)
+            active.add(chat_id)
+        time.sleep(random.uniform(0, 0.002))
+        with lock:
+            active.discard(chat_id)
+            seen.setdefault(chat_id, []).append(int(message.text))
+
+    updates = synthetic_updates(chats=20, per_chat=15)
+    for start in range(0, len(updates), 50):
+        bot.process_new_updates(updates[start:start + 50])
+    assert bot.worker_pool.join(10)
+    bot.worker_pool.close()
+
+    assert not overlaps
+    assert sorted(seen) == list(range(1, 21))
+    for chat_id, texts in seen.items():
+        assert texts == list(range(15)), chat_id
+
+
+def test_different_chats_run_concurrently():
+    chats = 4
+    bot = make_bot(num_threads=chats)
+    # Барьер проходится, только если обработчики всех чатов выполняются одновременно
+    barrier = threading.Barrier(chats, timeout=5)
+    passed = []
+
+    @bot.message_handler(func=lambda message: True)
+    def handle(message):
+        barrier.wait()
+        passed.append(message.chat.id)
+
+    bot.process_new_updates([make_update(i, i, 'x') for i in range(1, chats + 1)])
+    assert bot.worker_pool.join(10)
+    bot.worker_pool.close()
+    assert sorted(passed) == list(range(1, chats + 1))
+
+
+def test_slow_chat_does_not_block_other_chats():
+    bot = make_bot(num_threads=2)
+    release = threading.Event()
+    done = []
+
+    @bot.message_handler(func=lambda message: True)
+    def handle(message):
+        if message.chat.id == 1:
+            release.wait(5)
+        done.append(message.chat.id)
+
+    bot.process_new_updates([make_update(1, 1, 'slow'), make_update(2, 1, 'queued')] +
+                            [make_update(10 + i, 2, str(i)) for i in range(5)])
+    deadline = time.monotonic() + 5
+    while done.count(2) < 5 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert done == [2] * 5
+    release.set()
+    assert bot.worker_pool.join(5)
+    bot.worker_pool.close()
+    assert done[5:] == [1, 1]
+
+
+def test_full_queue_rejects_after_timeout():
+    release = threading.Event()
+    dispatcher = ChatDispatcher(num_threads=1, max_pending=2, put_timeout=0.05, key_func=lambda args: args[0])
+    assert dispatcher.put(release.wait, 5)
+    assert dispatcher.put(release.wait, 5)
+    assert not dispatcher.put(release.wait, 6)
+    assert dispatcher.rejected == 1
+    release.set()
+    assert dispatcher.join(5)
+    dispatcher.close()
+
+
+def test_handler_error_does_not_stop_the_chat():
+    bot = make_bot(num_threads=2)
+    seen = []
+
+    @bot.message_handler(func=lambda message: True)
+    def handle(message):
+        if message.text == 'boom':
+            raise RuntimeError("boom")
+        seen.append(message.text)
+
+    bot.process_new_updates([make_update(1, 1, 'a'), make_update(2, 1, 'boom'), make_update(3, 1, 'b')])
+    assert bot.worker_pool.join(5)
+    bot.worker_pool.close()
+    assert seen == ['a', 'b']
+    assert isinstance(bot.worker_pool.exception_info, RuntimeError)
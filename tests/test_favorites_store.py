@@ -0,0 +1,117 @@
+import os
+import json
+import time
+
+import pytest
+
+from favorites_store import FavoritesStore, SharedFavoritesStore
+from state_backend import SQLiteBackend
+
+WAIT = 5
+
+CAFE = {'type': 'node', 'id': 1, 'name': 'Кафе', 'address': 'Тверская, 1'}
+PARK = {'type': 'way', 'id': 2, 'name': 'Парк', 'address': 'Адрес не указан'}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'favorites.json')
+
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + WAIT
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_add_remove_and_membership(path):
+    store = FavoritesStore(path, flush_interval=0)
+
+    assert store.add(1, 'venues', CAFE)
+    assert not store.add('1', 'venues', dict(CAFE))
+    assert store.add(1, 'activities', 'Прогулка')
+    assert not store.add(1, 'activities', 'Прогулка')
+    assert store.has_venue(1, 'node', '1')
+    assert store.find_venue(1, 'node', 1) == CAFE
+    assert store.has_activity(1, 'Прогулка')
+    assert not store.has_venue(2, 'node', 1)
+
+    assert store.remove(1, 'venues', CAFE)
+    assert not store.remove(1, 'venues', CAFE)
+    assert store.remove(1, 'activities', 'Прогулка')
+    assert not store.remove(2, 'activities', 'Прогулка')
+    assert not store.has_venue(1, 'node', 1)
+    assert not store.has_activity(1, 'Прогулка')
+    assert store.get(1) == {'venues': [], 'activities': [], 'queries': []}
+
+
+def test_get_returns_a_copy(path):
+    store = FavoritesStore(path, flush_interval=0)
+    store.add(1, 'venues', CAFE)
+
+    favorites = store.get(1)
+    favorites['venues'].append(PARK)
+    favorites['venues'][0]['name'] = 'Другое'
+
+    assert store.get(1)['venues'] == [CAFE]
+    assert not store.has_venue(1, 'way', 2)
+
+
+def test_changes_are_flushed_on_interval(path):
+    store = FavoritesStore(path, flush_interval=0.05)
+    store.add(1, 'venues', CAFE)
+
+    wait_for(lambda: os.path.exists(path))
+    assert read(path)['1']['venues'] == [CAFE]
+    store.close()
+
+
+def test_failed_write_keeps_old_file(path, monkeypatch):
+    store = FavoritesStore(path, flush_interval=0)
+    store.add(1, 'venues', CAFE)
+    assert store.flush()
+    store.add(1, 'venues', PARK)
+
+    def fail(src, dst):
+        raise OSError("диск заполнен")
+
+    with monkeypatch.context() as m:
+        m.setattr('favorites_store.os.replace', fail)
+        assert not store.flush()
+    assert read(path)['1']['venues'] == [CAFE]
+
+    assert store.flush()
+    assert read(path)['1']['venues'] == [CAFE, PARK]
+
+
+def test_reload_round_trip(path):
+    store = FavoritesStore(path, flush_interval=0)
+    store.add(1, 'venues', CAFE)
+    store.add(1, 'activities', 'Прогулка')
+    store.add(2, 'queries', 'Москва')
+    store.close()
+
+    reloaded = FavoritesStore(path, flush_interval=0)
+    assert reloaded.get(1) == {'venues': [CAFE], 'activities': ['Прогулка'], 'queries': []}
+    assert reloaded.get(2)['queries'] == ['Москва']
+    assert reloaded.has_venue(1, 'node', 1)
+    assert reloaded.has_activity(1, 'Прогулка')
+
+
+def test_shared_store_round_trip(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'state.db'))
+    store = SharedFavoritesStore(backend)
+    store.add(1, 'venues', CAFE)
+    store.add(1, 'venues', PARK)
+    store.remove(1, 'venues', CAFE)
+
+    other = SharedFavoritesStore(backend)
+    assert other.get(1)['venues'] == [PARK]
+    assert other.find_venue(1, 'way', 2) == PARK
+    backend.close()
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from history_store import HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'), keep_per_user=3, compact_every=0)
+    yield store
+    store.close()
+
+
+def entry(city, n):
+    return {'city': city, 'n': n}
+
+
+def count(store):
+    return store._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+
+def test_last_returns_newest_entries_of_one_user(store):
+    for n in range(5):
+        store.append(1, entry('Москва', n))
+    store.append(2, entry('Казань', 0))
+
+    assert store.last(1, 2) == [entry('Москва', 3), entry('Москва', 4)]
+    assert store.last('2') == [entry('Казань', 0)]
+    assert store.last(3) == []
+
+
+def test_iter_entries_is_newest_first_across_users(store):
+    store.append(1, entry('Москва', 0))
+    store.append(2, entry('Казань', 0))
+    store.append(1, entry('Москва', 1))
+
+    assert store.iter_entries() == [entry('Москва', 1), entry('Казань', 0), entry('Москва', 0)]
+    assert store.iter_entries(2) == [entry('Москва', 1), entry('Казань', 0)]
+    assert sorted(store.users()) == ['1', '2']
+
+
+def test_compact_keeps_newest_per_user(store):
+    for n in range(6):
+        store.append(1, entry('Москва', n))
+    store.append(2, entry('Казань', 0))
+
+    assert store.compact() == 3
+    assert store.last(1, 10) == [entry('Москва', 3), entry('Москва', 4), entry('Москва', 5)]
+    assert store.last(2, 10) == [entry('Казань', 0)]
+
+
+def test_compaction_runs_in_background(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'), keep_per_user=2, compact_every=5)
+    for n in range(5):
+        store.append(1, entry('Москва', n))
+    compactor = store._compactor
+    assert compactor is not None
+    compactor.join(5)
+
+    assert store.last(1, 10) == [entry('Москва', 3), entry('Москва', 4)]
+    store.close()
+
+
+def write_legacy(path):
+    legacy = {'1': [entry('Москва', 0), entry('Москва', 1)], '2': [entry('Казань', 0)]}
+    path.write_text(json.dumps(legacy, ensure_ascii=False), encoding='utf-8')
+
+
+def test_migration_moves_legacy_json(store, tmp_path):
+    legacy = tmp_path / 'history.json'
+    write_legacy(legacy)
+
+    assert store.migrate_from_json(str(legacy)) == 3
+    assert not legacy.exists()
+    assert (tmp_path / 'history.json.migrated').exists()
+    assert store.last(1) == [entry('Москва', 0), entry('Москва', 1)]
+    assert store.migrate_from_json(str(legacy)) == 0
+    assert count(store) == 3
+
+
+def test_migration_interrupted_before_rename_is_not_repeated(store, tmp_path, monkeypatch):
+    legacy = tmp_path / 'history.json'
+    write_legacy(legacy)
+
+    def crash(src, dst):
+        raise OSError("остановка перед переименованием")
+
+    with monkeypatch.context() as m:
+        m.setattr('history_store.os.replace', crash)
+        with pytest.raises(OSError):
+            store.migrate_from_json(str(legacy))
+    assert legacy.exists()
+
+    assert store.migrate_from_json(str(legacy)) == 0
+    assert not legacy.exists()
+    assert count(store) == 3
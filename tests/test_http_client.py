@@ -0,0 +1,200 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_client import CircuitBreaker, CircuitOpenError, HttpClient, backoff_delay
+
+
+# Заглушка upstream: отвечает статусами из очереди (дальше - последним)
+class StubServer:
+    def __init__(self, statuses, headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers or {}
+        self.hits = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.hits += 1
+                status = server.statuses.pop(0) if len(server.statuses) > 1 else server.statuses[0]
+                body = b'{"ok": true}'
+                self.send_response(status)
+                for name, value in server.headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/data?q=city&appid=SECRET"
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(statuses, headers=None):
+        servers.append(StubServer(statuses, headers))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(retries=2, breaker=None):
+    return HttpClient('test', connect_timeout=1, read_timeout=1, retries=retries,
+                      backoff_base=0, backoff_max=0, breaker=breaker)
+
+
+def test_retries_until_success(stub):
+    server = stub([503, 502, 200])
+    client = make_client(retries=2)
+    response = client.get(server.url)
+    assert response.status_code == 200
+    assert server.hits == 3
+    assert client.breaker.state == 'closed'
+
+
+def test_gives_up_after_retries_and_returns_last_response(stub):
+    server = stub([503])
+    breaker = CircuitBreaker('test', failure_threshold=1)
+    client = make_client(retries=2, breaker=breaker)
+    response = client.get(server.url)
+    assert response.status_code == 503
+    assert server.hits == 3
+    assert breaker.state == 'open'
+
+
+def test_client_errors_are_not_retried(stub):
+    server = stub([404])
+    client = make_client(retries=2)
+    assert client.get(server.url).status_code == 404
+    assert server.hits == 1
+    assert client.breaker.state == 'closed'
+
+
+def test_retry_after_is_honoured(stub, monkeypatch):
+    server = stub([429, 200], headers={'Retry-After': '0.05'})
+    client = HttpClient('test', retries=1, backoff_base=0, backoff_max=1)
+    delays = []
+    monkeypatch.setattr('http_client.time.sleep', delays.append)
+    assert client.get(server.url).status_code == 200
+    assert delays == [0.05]
+
+
+def test_backoff_delay_bounds(monkeypatch):
+    assert backoff_delay(0, '2', 0.3, 5) == 2.0
+    assert backoff_delay(0, '60', 0.3, 5) == 5
+    monkeypatch.setattr('http_client.random.uniform', lambda low, high: high)
+    assert backoff_delay(0, None, 0.3, 5) == pytest.approx(0.3)
+    assert backoff_delay(3, None, 0.3, 5) == pytest.approx(2.4)
+    assert backoff_delay(10, 'invalid', 0.3, 5) == 5
+
+
+def test_connection_errors_are_retried_without_leaking_query(caplog):
+    client = make_client(retries=2)
+    # Порт закрыт: каждая попытка - ConnectionError
+    with caplog.at_level(logging.WARNING):
+        with pytest.raises(requests.ConnectionError):
+            client.get("http://127.0.0.1:9/data?q=city&appid=SECRET")
+    warnings = [r for r in caplog.records if 'повтор' in r.getMessage()]
+    assert len(warnings) == 2
+    assert 'SECRET' not in caplog.text
+    assert '127.0.0.1:9/data' in caplog.text
+
+
+def test_breaker_opens_and_rejects_without_calling_upstream(stub):
+    server = stub([500])
+    clock = FakeClock()
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30, clock=clock)
+    client = make_client(retries=0, breaker=breaker)
+    client.get(server.url)
+    client.get(server.url)
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        client.get(server.url)
+    assert server.hits == 2
+
+
+def test_half_open_admits_single_probe_and_closes_on_success(stub):
+    server = stub([500, 200])
+    clock = FakeClock()
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30, clock=clock)
+    client = make_client(retries=0, breaker=breaker)
+    client.get(server.url)
+    assert breaker.state == 'open'
+
+    clock.now = 31
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+
+    assert client.get(server.url).status_code == 200
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens_breaker(stub):
+    server = stub([500])
+    clock = FakeClock()
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30, clock=clock)
+    client = make_client(retries=0, breaker=breaker)
+    client.get(server.url)
+    clock.now = 31
+    client.get(server.url)
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        client.get(server.url)
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ContentDecodingError, requests.TooManyRedirects,
+                                   requests.exceptions.InvalidURL, ValueError])
+def test_unexpected_error_in_probe_does_not_wedge_breaker(stub, monkeypatch, error):
+    server = stub([200])
+    clock = FakeClock()
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    client = make_client(retries=0, breaker=breaker)
+
+    clock.now = 31
+    original = client.session.request
+
+    def failing(*args, **kwargs):
+        raise error("boom")
+
+    monkeypatch.setattr(client.session, 'request', failing)
+    with pytest.raises(error):
+        client.get(server.url)
+    assert breaker.state == 'open'
+
+    # После нового таймаута предохранитель снова пропускает пробный запрос
+    monkeypatch.setattr(client.session, 'request', original)
+    clock.now = 62
+    assert client.get(server.url).status_code == 200
+    assert breaker.state == 'closed'
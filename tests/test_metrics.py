@@ -0,0 +1,168 @@
+import re
+import json
+import asyncio
+import urllib.request
+from urllib.error import HTTPError
+
+import pytest
+from telebot import TeleBot
+from telebot.async_telebot import AsyncTeleBot
+
+from metrics import LATENCY_BUCKETS, MetricsRegistry, MetricsServer, SnapshotWriter
+
+# Строка значения: имя{метка="значение",...} число
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? ([0-9.e+-]+|\+Inf)$')
+
+
+def test_render_prometheus_text_format():
+    registry = MetricsRegistry(buckets=(0.01, 0.1, 1.0))
+    timer = registry.timer('handler', 'start')
+    timer.record(0.005, 'ok')
+    timer.record(0.05, 'ok')
+    timer.record(5.0, 'error')
+    registry.add_collector('places_cache', lambda: {'size': 3, 'hit_ratio': 0.5, 'name': 'lru', 'enabled': True})
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP bot_handler_seconds Время выполнения (handler)',
+                         '# TYPE bot_handler_seconds histogram']
+    assert lines[2:8] == [
+        'bot_handler_seconds_bucket{handler="start",le="0.01"} 1',
+        'bot_handler_seconds_bucket{handler="start",le="0.1"} 2',
+        'bot_handler_seconds_bucket{handler="start",le="1.0"} 2',
+        'bot_handler_seconds_bucket{handler="start",le="+Inf"} 3',
+        'bot_handler_seconds_sum{handler="start"} 5.055',
+        'bot_handler_seconds_count{handler="start"} 3',
+    ]
+    assert 'bot_handler_total{handler="start",outcome="ok"} 2' in lines
+    assert 'bot_handler_total{handler="start",outcome="error"} 1' in lines
+    assert 'bot_handler_in_flight{handler="start"} 0' in lines
+    # Сборщики - gauge по полю, нечисловые поля (и bool) пропускаются
+    assert 'bot_size{source="places_cache"} 3' in lines
+    assert 'bot_hit_ratio{source="places_cache"} 0.5' in lines
+    assert not any('name' in line or 'enabled' in line for line in lines)
+    for line in lines:
+        assert line.startswith('# ') or SAMPLE.match(line), line
+
+
+def test_render_escapes_labels_and_skips_broken_collector():
+    registry = MetricsRegistry()
+    registry.timer('call', 'fetch "places"\\').record(0.001, 'empty')
+
+    def broken():
+        raise RuntimeError("сломан")
+
+    registry.add_collector('broken', broken)
+    text = registry.render()
+    assert 'bot_call_total{call="fetch \\"places\\"\\\\",outcome="empty"} 1' in text
+    assert 'broken' not in text
+
+
+def test_snapshot_quantiles_interpolate_within_buckets():
+    registry = MetricsRegistry()
+    timer = registry.timer('call', 'fetch_weather')
+    for elapsed, n in ((0.0005, 50), (0.02, 45), (2.0, 5)):
+        for _ in range(n):
+            timer.record(elapsed, 'ok')
+    registry.timer('call', 'unused')
+
+    entry = registry.snapshot()['timers']['call']['fetch_weather']
+    assert entry['count'] == 100
+    assert (entry['ok'], entry['empty'], entry['error']) == (100, 0, 0)
+    assert entry['p50'] == pytest.approx(0.001)
+    assert entry['p95'] == pytest.approx(0.025)
+    assert entry['p99'] == pytest.approx(1.0 + 1.5 * 4 / 5)
+    assert registry.snapshot()['timers']['call']['unused']['p50'] is None
+
+    # Дольше последней корзины - нижняя граница переполнения
+    timer = registry.timer('call', 'slow')
+    timer.record(100.0, 'ok')
+    assert timer.quantile(0.5) == LATENCY_BUCKETS[-1]
+
+
+def test_instrument_counts_outcomes_and_in_flight():
+    registry = MetricsRegistry()
+    seen = []
+
+    @registry.timed('call')
+    def search(result):
+        seen.append(registry.timer('call', 'search').in_flight)
+        if result is None:
+            raise LookupError("нет данных")
+        return result
+
+    assert search([1]) == [1]
+    assert search([]) == []
+    with pytest.raises(LookupError):
+        search(None)
+    assert seen == [1, 1, 1]
+    entry = registry.snapshot()['timers']['call']['search']
+    assert (entry['ok'], entry['empty'], entry['error'], entry['in_flight']) == (1, 1, 1, 0)
+
+    @registry.timed('call', 'async_search')
+    async def async_search():
+        return []
+
+    assert asyncio.run(async_search()) == []
+    assert registry.snapshot()['timers']['call']['async_search']['empty'] == 1
+
+
+def test_instrument_handlers_wraps_once():
+    registry = MetricsRegistry()
+    bot = TeleBot('123:abc', threaded=False)
+    calls = []
+
+    @bot.message_handler(commands=['start'])
+    def start(message):
+        calls.append(message)
+
+    @bot.callback_query_handler(func=lambda call: True)
+    def callback(call):
+        calls.append(call)
+
+    assert registry.instrument_handlers(bot) == 2
+    assert registry.instrument_handlers(bot) == 0
+    handler = bot.message_handlers[0]['function']
+    assert handler.__name__ == 'start'
+    handler('сообщение')
+    assert calls == ['сообщение']
+    assert registry.snapshot()['timers']['handler']['start']['ok'] == 1
+    assert registry.timer('handler', 'callback').count == 0
+
+
+def test_instrument_handlers_of_async_bot():
+    registry = MetricsRegistry()
+    bot = AsyncTeleBot('123:abc')
+
+    @bot.message_handler(commands=['start'])
+    async def start(message):
+        raise ValueError("ошибка обработчика")
+
+    assert registry.instrument_handlers(bot) == 1
+    with pytest.raises(ValueError):
+        asyncio.run(bot.message_handlers[0]['function']('сообщение'))
+    assert registry.snapshot()['timers']['handler']['start']['error'] == 1
+
+
+def test_server_and_snapshot_file(tmp_path):
+    registry = MetricsRegistry()
+    registry.timer('handler', 'start').record(0.01, 'ok')
+    server = MetricsServer(registry, port=0)
+    server.start()
+    base = f"http://127.0.0.1:{server.port}"
+    try:
+        with urllib.request.urlopen(base + '/metrics', timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert 'bot_handler_seconds_count{handler="start"} 1' in response.read().decode('utf-8')
+        with urllib.request.urlopen(base + '/metrics.json', timeout=5) as response:
+            assert json.load(response)['timers']['handler']['start']['count'] == 1
+        with pytest.raises(HTTPError):
+            urllib.request.urlopen(base + '/other', timeout=5)
+    finally:
+        server.shutdown()
+
+    path = str(tmp_path / 'metrics.json')
+    writer = SnapshotWriter(registry, path, interval=3600)
+    writer.start()
+    writer.stop()
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['timers']['handler']['start']['count'] == 1
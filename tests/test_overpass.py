@@ -0,0 +1,92 @@
+import json
+import os
+import re
+
+import pytest
+
+from area_resolver import AreaInfo
+from overpass import (
+    ElementStream, PlaceCollector, build_overpass_query, collect_places, iter_overpass_elements,
+    parse_overpass_elements
+)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'overpass_out_center.json')
+
+
+@pytest.fixture
+def response():
+    with open(FIXTURE, 'rb') as f:
+        return f.read()
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('order', ['qt', 'nearest'])
+@pytest.mark.parametrize('area', [None, AreaInfo(2555133, 'Москва', 55.49, 37.32, 56.01, 37.95)])
+def test_query_asks_for_coordinates(order, area):
+    query = build_overpass_query('Москва', 'amenity=cafe', 10, order, area=area)
+    # "out tags" не выводит координаты узлов - только "out center" (body)
+    assert 'out tags' not in query
+    assert 'out center qt' in query
+
+
+def test_nodes_ways_and_relations_keep_coordinates(response):
+    data = json.loads(response)
+    places = parse_overpass_elements(data, [], limit=10)
+    by_id = {place['id']: place for place in places}
+    assert by_id[356637521]['lat'] == 55.7601734
+    assert by_id[356637521]['address'] == 'Большая Никитская улица, 13/6'
+    assert by_id[40937632]['lat'] == 55.7558935
+    assert by_id[7412358]['lon'] == 37.5940722
+    assert all(place['lat'] is not None and place['lon'] is not None for place in places)
+
+
+def test_nearest_uses_city_node_as_center(response):
+    elements = json.loads(response)['elements']
+    places = collect_places(elements, [], limit=10, order='nearest')
+    assert 2555133 not in [place['id'] for place in places]
+    assert places[0]['id'] == 40937632
+    assert places[-1]['id'] == 7412358
+
+
+def test_nearest_tolerates_center_node_without_coordinates(response):
+    elements = json.loads(response)['elements']
+    del elements[0]['lat'], elements[0]['lon']
+    places = collect_places(elements, [], limit=10, order='nearest')
+    assert len(places) == 4
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, 100000])
+def test_streaming_parse_matches_json(response, size):
+    expected = json.loads(response)['elements']
+    assert list(iter_overpass_elements(chunks(response, size))) == expected
+
+
+def test_collector_stops_reading_at_limit(response):
+    stream = ElementStream()
+    collector = PlaceCollector([], limit=2)
+    read = 0
+    for chunk in chunks(response, 16):
+        read += len(chunk)
+        if collector.add_all(stream.feed(chunk)) or stream.finished:
+            break
+    assert read < len(response)
+    assert [place['id'] for place in collector.finish()] == [2555133, 356637521]
+
+
+QL_NAME = re.compile(r'\["name"="((?:[^"\\\n]|\\.)*)"\]')
+
+
+def ql_unescape(value):
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+@pytest.mark.parametrize('order', ['qt', 'nearest'])
+def test_city_name_is_escaped(order):
+    city = 'Нью "Васюки" \\ ]; out;\nnode'
+    query = build_overpass_query(city, 'amenity=cafe', 10, order)
+    names = QL_NAME.findall(query)
+    assert names
+    assert [ql_unescape(name) for name in names] == [city] * len(names)
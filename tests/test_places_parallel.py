@@ -0,0 +1,104 @@
+import json
+import asyncio
+import logging
+import threading
+
+import pytest
+
+import async_bot
+import botbotbotbot as b
+
+QUERIES = ['amenity=cafe', 'leisure=park', 'tourism=museum']
+SLOW_QUERY = 'leisure=park'
+DEADLINE = 0.2
+
+
+def overpass_body(query):
+    osm_id = QUERIES.index(query) + 1
+    element = {"type": "node", "id": osm_id, "lat": 55.75, "lon": 37.62, "tags": {"name": query}}
+    return json.dumps({"elements": [element]}).encode('utf-8')
+
+
+def query_of(data):
+    return next(query for query in QUERIES if query in data.decode('utf-8'))
+
+
+class Response:
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=8192):
+        yield self.body
+
+    async def iter_chunked(self, size):
+        yield self.body
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def release():
+    release = threading.Event()
+    yield release
+    release.set()
+
+
+def test_sync_deadline_returns_partial_merge(monkeypatch, release, caplog):
+    def post(url, data=None, **kwargs):
+        query = query_of(data)
+        if query == SLOW_QUERY:
+            release.wait(5)
+        return Response(overpass_body(query))
+
+    monkeypatch.setattr(b.overpass_client, 'post', post)
+    monkeypatch.setattr(b, 'PLACES_DEADLINE', DEADLINE)
+    with caplog.at_level(logging.WARNING):
+        places = b.fetch_places_parallel('Москва', QUERIES, None, None)
+
+    assert [place['name'] for place in places] == ['amenity=cafe', 'tourism=museum']
+    assert "1 из 3 запросов не уложились" in caplog.text
+
+
+def test_sync_all_queries_late_raise_timeout(monkeypatch, release):
+    def post(url, data=None, **kwargs):
+        release.wait(5)
+        return Response(overpass_body(query_of(data)))
+
+    monkeypatch.setattr(b.overpass_client, 'post', post)
+    monkeypatch.setattr(b, 'PLACES_DEADLINE', DEADLINE)
+    with pytest.raises(TimeoutError):
+        b.fetch_places_parallel('Москва', QUERIES, None, None)
+
+
+def test_async_deadline_returns_partial_merge(monkeypatch, caplog):
+    async def post(url, data=None, **kwargs):
+        query = query_of(data)
+        if query == SLOW_QUERY:
+            await asyncio.sleep(5)
+        return Response(overpass_body(query))
+
+    monkeypatch.setattr(async_bot.overpass_client, 'post', post)
+    monkeypatch.setattr(async_bot, 'PLACES_DEADLINE', DEADLINE)
+    with caplog.at_level(logging.WARNING):
+        places = asyncio.run(async_bot.fetch_places_parallel('Москва', QUERIES, None, None))
+
+    assert [place['name'] for place in places] == ['amenity=cafe', 'tourism=museum']
+    assert "1 из 3 запросов не уложились" in caplog.text
+
+
+def test_async_error_and_timeout_without_results_raise_error(monkeypatch):
+    async def post(url, data=None, **kwargs):
+        if query_of(data) == SLOW_QUERY:
+            await asyncio.sleep(5)
+        raise ConnectionError("нет соединения")
+
+    monkeypatch.setattr(async_bot.overpass_client, 'post', post)
+    monkeypatch.setattr(async_bot, 'PLACES_DEADLINE', DEADLINE)
+    with pytest.raises(ConnectionError):
+        asyncio.run(async_bot.fetch_places_parallel('Москва', QUERIES, None, None))
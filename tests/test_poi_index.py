@@ -0,0 +1,156 @@
+import sqlite3
+
+import pytest
+
+import poi_index
+from poi_index import KM_PER_DEGREE, PoiIndex, PoiIndexHandle, open_poi_index
+
+CENTER = (55.75, 37.62)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def node(osm_id, north_km, name=None, tags=None):
+    return {
+        "type": "node",
+        "id": osm_id,
+        "lat": CENTER[0] + north_km / KM_PER_DEGREE,
+        "lon": CENTER[1],
+        "tags": dict(tags or {"amenity": "cafe"}, name=name or f"Кафе {osm_id}"),
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'poi_index.db')
+
+
+@pytest.fixture
+def index(path):
+    index = PoiIndex(path)
+    yield index
+    index.close()
+
+
+def ids(places):
+    return [place["id"] for place in places]
+
+
+def count(index, table):
+    return index._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_import_fills_rtree_by_category(index):
+    result = index.import_elements('Москва', [
+        node(1, 0.5),
+        node(2, 3),
+        node(3, 1, tags={"leisure": "park"}),
+        node(4, 2, tags={"shop": "bakery"}),
+    ], CENTER)
+
+    assert result == {"places": 3, "changed": 3, "removed": 0, "categories": ["Кафе", "Парки"]}
+    assert count(index, 'poi') == count(index, 'poi_rtree') == 3
+    assert ids(index.search('Москва', 'Кафе')) == [1, 2]
+    assert ids(index.search('г. москва', 'Парки')) == [3]
+    assert index.search('Москва', 'Музеи') is None
+    assert index.search('Казань', 'Кафе') is None
+
+
+def test_reimport_is_incremental(index):
+    index.import_elements('Москва', [node(1, 1), node(2, 2), node(3, 3), node(10, 1, tags={"leisure": "park"})],
+                          CENTER)
+    result = index.import_elements('Москва', [node(1, 1), node(2, 2, name="Новое название"), node(4, 4)], CENTER)
+
+    assert result["changed"] == 2
+    assert result["removed"] == 1
+    places = index.search('Москва', 'Кафе')
+    assert ids(places) == [1, 2, 4]
+    assert places[1]["name"] == "Новое название"
+    assert count(index, 'poi_rtree') == count(index, 'poi') == 4
+    # Категории, которых нет в новой выгрузке, остаются как были
+    assert ids(index.search('Москва', 'Парки')) == [10]
+    generations = {(row["category"], row["generation"]) for row in index.stats()}
+    assert generations == {("Кафе", 2), ("Парки", 1)}
+
+
+def test_search_widens_window_until_enough_places(index, monkeypatch):
+    index.import_elements('Москва', [node(1, 0.5), node(2, 3), node(3, 30), node(4, 300)], CENTER)
+    windows = []
+    window = index._window
+
+    def recording_window(city, category, bbox):
+        windows.append(bbox)
+        return window(city, category, bbox)
+
+    monkeypatch.setattr(index, '_window', recording_window)
+
+    assert ids(index.search('Москва', 'Кафе', limit=1)) == [1]
+    assert len(windows) == 1
+
+    windows.clear()
+    assert ids(index.search('Москва', 'Кафе', limit=2)) == [1, 2]
+    assert len(windows) == 3
+
+    # Дальше POI_MAX_RADIUS_KM окно не растёт - остальное полным просмотром
+    windows.clear()
+    assert ids(index.search('Москва', 'Кафе', limit=4)) == [1, 2, 3, 4]
+    assert windows[-1] is None
+
+
+def test_search_from_other_center(index):
+    index.import_elements('Москва', [node(1, 0), node(2, 10)], CENTER)
+    center = (CENTER[0] + 10 / KM_PER_DEGREE, CENTER[1])
+    assert ids(index.search('Москва', 'Кафе', center=center)) == [2, 1]
+
+
+def test_readonly_index_reads_while_importer_writes(index, path):
+    index.import_elements('Москва', [node(1, 1)], CENTER)
+    reader = open_poi_index(path)
+
+    assert reader.readonly
+    with pytest.raises(RuntimeError):
+        reader.import_elements('Москва', [node(2, 2)], CENTER)
+    with pytest.raises(sqlite3.OperationalError):
+        reader._conn.execute("DELETE FROM poi")
+
+    index.import_elements('Москва', [node(1, 1), node(2, 2)], CENTER)
+    assert ids(reader.search('Москва', 'Кафе')) == [1, 2]
+    reader.close()
+
+
+def test_handle_opens_index_created_after_start(path):
+    clock = Clock()
+    handle = PoiIndexHandle(path, recheck_interval=60, clock=clock)
+    assert open_poi_index(path) is None
+    assert handle.get() is None
+
+    writer = PoiIndex(path)
+    writer.import_elements('Москва', [node(1, 1)], CENTER)
+    clock.now += 59
+    assert handle.get() is None
+
+    clock.now += 1
+    index = handle.get()
+    assert index is not None and index.readonly
+    assert ids(index.search('Москва', 'Кафе')) == [1]
+    assert handle.get() is index
+    handle.close()
+    writer.close()
+
+
+def test_handle_rechecks_without_opening_on_every_call(path, monkeypatch):
+    opened = []
+    monkeypatch.setattr(poi_index, 'open_poi_index', lambda db_path: opened.append(db_path))
+    clock = Clock()
+    handle = PoiIndexHandle(path, recheck_interval=60, clock=clock)
+    for _ in range(5):
+        handle.get()
+    clock.now += 60
+    handle.get()
+    assert opened == [path, path]
@@ -0,0 +1,157 @@
+import pytest
+
+from prewarm import DemandTracker, Prewarmer
+
+CATEGORIES = ['Кафе', 'Парки', 'Музеи']
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Upstream:
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+        self.failing = set()
+
+    def refresher(self, kind):
+        def make(city, *rest):
+            category = rest[0] if len(rest) == 2 else None
+            return lambda: self.call(kind, city, category)
+        return make
+
+    def call(self, kind, city, category):
+        self.calls.append((self.clock.now, kind, city, category))
+        if city in self.failing:
+            raise ConnectionError("нет ответа")
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def upstream(clock):
+    return Upstream(clock)
+
+
+def make_prewarmer(clock, upstream, history=(), tracker=None, **kwargs):
+    options = dict(top_categories=1, budget=100, rate=0, jitter=0.5, backoff_base=60, backoff_max=600)
+    options.update(kwargs)
+    return Prewarmer(
+        upstream.refresher('weather'), upstream.refresher('places'), CATEGORIES,
+        history=lambda: list(history), tracker=tracker,
+        clock=clock, sleep=clock.sleep, rng=lambda: 0.5, **options
+    )
+
+
+def test_hot_cities_rank_history_and_recent_searches(clock, upstream):
+    tracker = DemandTracker(window=3600, clock=clock)
+    tracker.record('Казань', 'Музеи')
+    clock.now += 4000
+    # Поиски весят вдвое больше записи в истории, старые - не учитываются
+    tracker.record('казань ', 'Парки')
+    tracker.record('Тула', 'Музеи')
+    tracker.record('Тула', 'Музеи')
+    history = ['Москва', 'Москва', 'Москва', 'москва', 'Омск', None]
+    prewarmer = make_prewarmer(clock, upstream, history, tracker, top_cities=3)
+
+    assert prewarmer.hot_cities() == ['Москва', 'Тула', 'казань ']
+    assert prewarmer.hot_categories('Тула') == ['Музеи']
+    assert prewarmer.hot_categories('Москва') == ['Музеи']
+    assert prewarmer.plan()[:2] == [('weather', 'Москва', None), ('places', 'Москва', 'Музеи')]
+
+
+def test_budget_caps_requests_per_cycle(clock, upstream):
+    prewarmer = make_prewarmer(clock, upstream, ['Москва', 'Казань', 'Омск'], budget=4)
+    assert prewarmer.run_once() == 4
+    assert len(upstream.calls) == 4
+    assert prewarmer.stats()['requests'] == 4
+
+
+def test_rate_limit_spaces_requests(clock, upstream):
+    prewarmer = make_prewarmer(clock, upstream, ['Москва', 'Казань'], rate=2)
+    assert prewarmer.run_once() == 4
+    times = [call[0] for call in upstream.calls]
+    assert [b - a for a, b in zip(times, times[1:])] == [0.5, 0.5, 0.5]
+
+
+def test_skips_entries_that_are_still_fresh(clock, upstream):
+    horizons = []
+
+    def weather(city, horizon):
+        horizons.append(horizon)
+        return None
+
+    prewarmer = make_prewarmer(clock, upstream, ['Москва'], interval=600)
+    prewarmer.weather_refresher = weather
+    assert prewarmer.run_once() == 1
+    assert horizons == [900]
+    assert prewarmer.stats()['skipped'] == 1
+
+
+def test_failed_task_backs_off_exponentially(clock, upstream):
+    upstream.failing.add('Казань')
+    prewarmer = make_prewarmer(clock, upstream, ['Москва', 'Казань'], max_failures=10)
+
+    assert prewarmer.run_once() == 4
+    assert prewarmer.stats()['errors'] == 2
+    assert prewarmer.stats()['backoff'] == 2
+
+    # Задержка: 60 с * (1 + jitter * rng) = 75 с, до неё Казань пропускается
+    clock.now += 74
+    upstream.calls.clear()
+    assert prewarmer.run_once() == 2
+    assert {call[2] for call in upstream.calls} == {'Москва'}
+
+    clock.now += 1
+    upstream.calls.clear()
+    assert prewarmer.run_once() == 4
+    # Вторая ошибка подряд - задержка удваивается
+    clock.now += 149
+    upstream.calls.clear()
+    prewarmer.run_once()
+    assert {call[2] for call in upstream.calls} == {'Москва'}
+
+    upstream.failing.clear()
+    clock.now += 1
+    prewarmer.run_once()
+    assert prewarmer.stats()['backoff'] == 0
+
+
+def test_consecutive_failures_stop_the_cycle(clock, upstream):
+    upstream.failing.update(['Москва', 'Казань'])
+    prewarmer = make_prewarmer(clock, upstream, ['Москва', 'Казань'], max_failures=3)
+    assert prewarmer.run_once() == 3
+
+
+def test_kill_switch_stops_cycle(clock, upstream):
+    prewarmer = make_prewarmer(clock, upstream, ['Москва', 'Казань'], kill_switch=lambda: len(upstream.calls) >= 1)
+    assert prewarmer.run_once() == 1
+    assert upstream.calls == [(1000.0, 'weather', 'Москва', None)]
+
+
+def test_loop_skips_cycles_while_killed(clock, upstream):
+    switch = [True, True]
+    prewarmer = make_prewarmer(clock, upstream, ['Москва'], interval=0.001,
+                               kill_switch=lambda: bool(switch) and switch.pop())
+
+    def weather(city, horizon):
+        prewarmer.stop()
+        return lambda: upstream.call('weather', city, None)
+
+    prewarmer.weather_refresher = weather
+    prewarmer._loop()
+    assert prewarmer.cycles == 1
+    assert len(upstream.calls) == 1
@@ -0,0 +1,97 @@
+import json
+import threading
+from collections import Counter
+
+import pytest
+
+from activities_index import ACTIVITY_AXES, ActivityCatalog
+from recommendations import RecommendationEngine, main
+
+ACTIVITIES = {
+    'ясно_активное_средний_пара': ['велосипед', 'каяк'],
+    'ясно_расслабленное_низкий_один': ['парк'],
+    'дождь_расслабленное_средний_один': ['кино'],
+    'дождь_активное_низкий_компания': ['боулинг'],
+    'снег_экстремальное_неограниченный_компания': ['сноуборд'],
+}
+CODES = {'ясно': 800, 'дождь': 500, 'снег': 600}
+CITY_WEATHER = {'москва': 'ясно', 'казань': 'дождь', 'мурманск': 'снег'}
+
+REQUESTS = [
+    {'city': 'Москва', 'mood': 'активное', 'budget': 'средний', 'people': 'пара'},
+    {'city': ' москва', 'mood': 'расслабленное', 'budget': 'низкий', 'people': 'один'},
+    {'city': 'Казань', 'mood': 'расслабленное', 'budget': 'средний', 'people': 'один'},
+    {'city': 'КАЗАНЬ', 'mood': 'активное', 'budget': 'средний', 'people': 'компания'},
+    {'city': 'Мурманск', 'mood': 'экстремальное', 'budget': 'низкий', 'people': 'пара'},
+    {'city': 'Москва', 'mood': 'активное', 'budget': 'средний', 'people': 'пара'},
+    {'city': 'Казань', 'mood': 'экстремальное', 'budget': 'неограниченный', 'people': 'один'},
+]
+
+
+class CountingWeather:
+    def __init__(self):
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, city):
+        key = ' '.join(city.split()).casefold()
+        with self.lock:
+            self.calls[key] += 1
+        if key not in CITY_WEATHER:
+            raise LookupError(f"город не найден: {city}")
+        return {'weather_code': CODES[CITY_WEATHER[key]], 'temp': 5}
+
+
+def describe(code):
+    return next(name for name, value in CODES.items() if value == code)
+
+
+@pytest.fixture
+def activities_path(tmp_path):
+    path = tmp_path / 'activities.json'
+    path.write_text(json.dumps(ACTIVITIES, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def engine(activities_path):
+    return RecommendationEngine(ActivityCatalog(str(activities_path), ACTIVITY_AXES), CountingWeather(), describe)
+
+
+def test_batch_fetches_weather_once_per_city(engine):
+    results = engine.recommend_batch(REQUESTS + [('Нигдеград', 'активное', 'низкий', 'один')])
+
+    assert engine.weather_source.calls == {'москва': 1, 'казань': 1, 'мурманск': 1, 'нигдеград': 1}
+    assert results[0]['activities'] == ['велосипед', 'каяк']
+    assert results[0]['match'] == 'exact'
+    assert results[2]['weather'] == 'дождь'
+    assert 'нигдеград' in results[-1]['error'].casefold()
+    assert 'activities' not in results[-1]
+
+
+def test_batch_matches_single_requests(engine):
+    batch = engine.recommend_batch(REQUESTS)
+    single = [engine.recommend(r['city'], r['mood'], r['budget'], r['people']) for r in REQUESTS]
+    assert batch == single
+
+
+def test_cli_output_matches_handler_path(engine, activities_path, tmp_path):
+    requests_path = tmp_path / 'requests.jsonl'
+    requests_path.write_text(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in REQUESTS), encoding='utf-8')
+    weather_path = tmp_path / 'weather.json'
+    weather_path.write_text(json.dumps({'Москва': 'ясно', 'Казань': 'дождь', 'Мурманск': 'снег'},
+                                       ensure_ascii=False), encoding='utf-8')
+    output_path = tmp_path / 'results.jsonl'
+
+    assert main([str(requests_path), '-o', str(output_path), '--activities', str(activities_path),
+                 '--weather-map', str(weather_path)]) == 0
+
+    lines = [json.loads(line) for line in output_path.read_text(encoding='utf-8').splitlines()]
+    assert len(lines) == len(REQUESTS)
+    for request, line in zip(REQUESTS, lines):
+        # Обработчик бота: погода уже известна, варианты - engine.options()
+        weather = CITY_WEATHER[' '.join(request['city'].split()).casefold()]
+        options, level = engine.options(weather, request['mood'], request['budget'], request['people'])
+        assert (line['activities'], line['match']) == (options, level)
+        assert line['weather'] == weather
+        assert {k: line[k] for k in request} == request
@@ -0,0 +1,97 @@
+import re
+
+from result_sets import BASE62, ResultSetStore, encode_base62, new_handle
+
+HANDLE = re.compile(r'^[0-9A-Za-z]{6}$')
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def places(count, place_type='node'):
+    return [{'type': place_type, 'id': 100 + i, 'name': f'Место {i}'} for i in range(count)]
+
+
+def test_handles_are_short_base62():
+    assert encode_base62(0) == '0'
+    assert encode_base62(61) == 'z'
+    assert encode_base62(62) == '10'
+    assert all(HANDLE.match(new_handle()) for _ in range(200))
+    assert set(''.join(new_handle() for _ in range(200))) <= set(BASE62)
+
+
+def test_put_and_find_by_type_and_id():
+    store = ResultSetStore()
+    result_set = store.put(42, 'Москва', 'Кафе', places(3) + places(1, 'way'))
+
+    assert HANDLE.match(result_set.handle)
+    assert store.get(result_set.handle) is result_set
+    assert result_set.find('node', 101)['name'] == 'Место 1'
+    # id из callback_data приходит строкой
+    assert result_set.find('node', '102')['name'] == 'Место 2'
+    assert result_set.find('way', 100)['name'] == 'Место 0'
+    assert result_set.find('relation', 100) is None
+    assert store.get('nohandle') is None
+
+
+def test_pages():
+    result_set = ResultSetStore().put(42, 'Москва', 'Кафе', places(19))
+
+    assert result_set.pages(8) == 3
+    assert result_set.page(0, 8) == (0, result_set.places[:8])
+    assert result_set.page(2, 8) == (2, result_set.places[16:])
+    # Номер за пределами набора прижимается к первой/последней странице
+    assert result_set.page(7, 8)[0] == 2
+    assert result_set.page(-1, 8)[0] == 0
+    assert result_set.page_of('node', 100 + 8, 8) == 1
+    assert result_set.page_of('node', 999, 8) == 0
+
+    empty = ResultSetStore().put(42, 'Москва', 'Кафе', [])
+    assert empty.pages(8) == 1
+    assert empty.page(3, 8) == (0, [])
+
+
+def test_other_chat_cannot_use_handle():
+    store = ResultSetStore()
+    result_set = store.put(42, 'Москва', 'Кафе', places(2))
+
+    assert store.get(result_set.handle, chat_id=43) is None
+    assert store.get(result_set.handle, chat_id=42) is result_set
+    # Набор при этом не удаляется
+    assert len(store) == 1
+
+
+def test_sets_expire_after_ttl():
+    clock = Clock()
+    store = ResultSetStore(ttl=60, clock=clock)
+    old = store.put(42, 'Москва', 'Кафе', places(2))
+    clock.now += 30
+    fresh = store.put(42, 'Москва', 'Парки', places(2))
+
+    clock.now += 31
+    assert store.get(old.handle) is None
+    assert store.get(fresh.handle) is fresh
+    assert store.stats() == {'sets': 1, 'expired': 1, 'evicted': 0}
+
+    # Устаревшие наборы удаляются и при добавлении новых, без обращений к ним
+    clock.now += 60
+    store.put(42, 'Казань', 'Кафе', places(1))
+    assert store.stats() == {'sets': 1, 'expired': 2, 'evicted': 0}
+
+
+def test_lru_evicts_least_recently_used():
+    store = ResultSetStore(max_sets=2, clock=Clock())
+    first = store.put(1, 'Москва', 'Кафе', places(1))
+    second = store.put(2, 'Москва', 'Кафе', places(1))
+    assert store.get(first.handle) is first
+
+    third = store.put(3, 'Москва', 'Кафе', places(1))
+    assert store.get(second.handle) is None
+    assert store.get(first.handle) is first
+    assert store.get(third.handle) is third
+    assert store.stats() == {'sets': 2, 'expired': 0, 'evicted': 1}
@@ -0,0 +1,224 @@
+import time
+import asyncio
+import threading
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+from fake_services import FakeServices
+from send_queue import AsyncSendGate, RateLimits, SendQueue, retry_after_of
+
+API = 'https://api.telegram.org/bot123:abc/'
+WAIT = 5
+
+
+class Response:
+    def __init__(self, status_code=200, payload=None, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers or {}
+
+    def json(self):
+        if self.payload is None:
+            raise ValueError("не JSON")
+        return self.payload
+
+
+class Sender:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.hold = {}
+
+    # Запросы к чату chat_id ждут release(chat_id)
+    def block(self, chat_id):
+        self.hold[chat_id] = threading.Event()
+
+    def release(self, chat_id):
+        self.hold.pop(chat_id).set()
+
+    def __call__(self, method, url, params=None, **kwargs):
+        with self.lock:
+            self.calls.append((url.rsplit('/', 1)[-1], dict(params or {})))
+        hold = self.hold.get((params or {}).get('chat_id'))
+        if hold is not None:
+            hold.wait(WAIT)
+        return Response(200, {'ok': True, 'result': params})
+
+
+def fast_limits():
+    return RateLimits(global_rate=1000, chat_rate=1000, chat_burst=1000, group_rate=1000)
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + WAIT
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def call_async(queue, method_name, **params):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(queue('post', API + method_name, params=params)))
+    thread.start()
+    return thread, results
+
+
+def test_callback_answers_go_before_queued_messages():
+    sender = Sender()
+    sender.block(1)
+    queue = SendQueue(fast_limits(), workers=1, send=sender)
+    first, _ = call_async(queue, 'sendMessage', chat_id=1, text='первое')
+    wait_for(lambda: sender.calls)
+    others = [call_async(queue, 'sendMessage', chat_id=2, text='второе')[0]]
+    wait_for(lambda: queue.stats()['queued'] == 1)
+    others.append(call_async(queue, 'answerCallbackQuery', callback_query_id='cb')[0])
+    wait_for(lambda: queue.stats()['queued'] == 2)
+
+    sender.release(1)
+    for thread in [first] + others:
+        thread.join(WAIT)
+    assert [name for name, _ in sender.calls] == ['sendMessage', 'answerCallbackQuery', 'sendMessage']
+    queue.close()
+
+
+def test_pending_edits_of_one_message_coalesce():
+    sender = Sender()
+    sender.block(9)
+    queue = SendQueue(fast_limits(), workers=1, send=sender)
+    blocker, _ = call_async(queue, 'sendMessage', chat_id=9, text='занят')
+    wait_for(lambda: sender.calls)
+    edits = []
+    for text in ['1', '2', '3']:
+        edits.append(call_async(queue, 'editMessageText', chat_id=1, message_id=5, text=text))
+        wait_for(lambda: queue.stats()['queued'] + queue.stats()['coalesced'] == len(edits))
+    other = call_async(queue, 'editMessageText', chat_id=1, message_id=6, text='другое')
+
+    sender.release(9)
+    for thread, _ in edits + [other, (blocker, None)]:
+        thread.join(WAIT)
+    assert sender.calls[1:] == [
+        ('editMessageText', {'chat_id': 1, 'message_id': 5, 'text': '3'}),
+        ('editMessageText', {'chat_id': 1, 'message_id': 6, 'text': 'другое'}),
+    ]
+    # Все схлопнутые вызовы получают ответ единственного запроса
+    assert {results[0].payload['result']['text'] for _, results in edits} == {'3'}
+    assert queue.stats()['coalesced'] == 2
+    queue.close()
+
+
+def test_one_chat_is_sent_serially_while_others_proceed():
+    sender = Sender()
+    sender.block(1)
+    queue = SendQueue(fast_limits(), workers=4, send=sender)
+    threads = [call_async(queue, 'sendMessage', chat_id=1, text='1-1')[0]]
+    wait_for(lambda: sender.calls)
+    threads += [call_async(queue, 'sendMessage', chat_id=1, text=f'1-{i}')[0] for i in (2, 3)]
+    wait_for(lambda: queue.stats()['queued'] == 2)
+    threads.append(call_async(queue, 'sendMessage', chat_id=2, text='2-1')[0])
+
+    # Чат 2 не ждёт чат 1, второй запрос чата 1 не обгоняет первый
+    wait_for(lambda: any(params['chat_id'] == 2 for _, params in sender.calls))
+    assert [params['text'] for _, params in sender.calls if params['chat_id'] == 1] == ['1-1']
+
+    sender.release(1)
+    for thread in threads:
+        thread.join(WAIT)
+    assert [params['text'] for _, params in sender.calls if params['chat_id'] == 1] == ['1-1', '1-2', '1-3']
+    queue.close()
+
+
+def test_retry_after_of_reads_parameters_then_header():
+    assert retry_after_of(Response(429, {'ok': False, 'parameters': {'retry_after': 7}})) == 7
+    assert retry_after_of(Response(429, None, {'Retry-After': '3'})) == 3
+    assert retry_after_of(Response(429, {'ok': False})) == 1.0
+
+
+def test_429_blocks_chat_and_requeues_request():
+    services = FakeServices()
+    base = services.start()
+    services.flood(1, retry_after=0.3)
+    limits = fast_limits()
+    queue = SendQueue(limits, workers=2)
+    try:
+        started = time.monotonic()
+        response = queue('post', f"{base}/bot123:abc/sendMessage", params={'chat_id': 1, 'text': 'привет'})
+        elapsed = time.monotonic() - started
+
+        assert response.status_code == 200
+        assert response.json()['result']['text'] == 'привет'
+        assert services.snapshot() == {'sendMessage': 2, '429': 1}
+        assert elapsed >= 0.3
+        assert queue.stats()['throttled'] == 1
+        # Отложен только этот чат
+        assert limits.delay(2) == 0
+    finally:
+        queue.close()
+        services.stop()
+
+
+def test_429_gives_up_after_max_retries():
+    services = FakeServices()
+    base = services.start()
+    services.flood(10, retry_after=0.01)
+    queue = SendQueue(fast_limits(), workers=1, max_retries=2)
+    try:
+        response = queue('post', f"{base}/bot123:abc/sendMessage", params={'chat_id': 1, 'text': 'привет'})
+        assert response.status_code == 429
+        assert services.snapshot()['429'] == 3
+    finally:
+        queue.close()
+        services.stop()
+
+
+class AsyncApi:
+    def __init__(self, floods=0):
+        self.calls = []
+        self.floods = floods
+
+    async def __call__(self, token, url, method='get', params=None, files=None, **kwargs):
+        self.calls.append((url, dict(params or {})))
+        if self.floods:
+            self.floods -= 1
+            raise ApiTelegramException(url, None, {
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                'parameters': {'retry_after': 0.2}
+            })
+        return dict(params or {})
+
+
+def test_async_gate_coalesces_edits_waiting_for_tokens():
+    api = AsyncApi()
+    gate = AsyncSendGate(RateLimits(global_rate=1000, chat_rate=10, chat_burst=1))
+    send = gate.wrap(api)
+
+    async def run():
+        await send('token', 'sendMessage', 'post', {'chat_id': 1, 'text': 'меню'})
+        return await asyncio.gather(*[
+            send('token', 'editMessageText', 'post', {'chat_id': 1, 'message_id': 5, 'text': text})
+            for text in ['1', '2', '3']
+        ])
+
+    results = asyncio.run(run())
+    assert api.calls[1:] == [('editMessageText', {'chat_id': 1, 'message_id': 5, 'text': '3'})]
+    assert [result['text'] for result in results] == ['3', '3', '3']
+    assert (gate.sent, gate.coalesced) == (2, 2)
+    assert gate._pending == {}
+
+
+def test_async_gate_retries_after_429():
+    api = AsyncApi(floods=1)
+    limits = fast_limits()
+    gate = AsyncSendGate(limits)
+    send = gate.wrap(api)
+
+    started = time.monotonic()
+    result = asyncio.run(send('token', 'sendMessage', 'post', {'chat_id': 1, 'text': 'привет'}))
+    assert result['text'] == 'привет'
+    assert len(api.calls) == 2
+    assert time.monotonic() - started >= 0.2
+    assert gate.throttled == 1
+
+    api.floods = 10
+    with pytest.raises(ApiTelegramException):
+        asyncio.run(AsyncSendGate(limits, max_retries=0).wrap(api)('token', 'sendMessage', 'post', {'chat_id': 2}))
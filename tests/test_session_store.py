@@ -0,0 +1,153 @@
+import threading
+
+import pytest
+
+from session_store import SESSION_NAMESPACE, SessionStore
+from state_backend import SQLiteBackend
+
+WAIT = 5
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+# SQLite, в котором отдельные операции можно задержать
+class SlowBackend(SQLiteBackend):
+    def __init__(self, path):
+        super().__init__(path)
+        self.blocked = {}
+
+    def block(self, method):
+        entered, release = threading.Event(), threading.Event()
+        self.blocked[method] = (entered, release)
+        return entered, release
+
+    def _wait(self, method):
+        if method in self.blocked:
+            entered, release = self.blocked.pop(method)
+            entered.set()
+            release.wait(WAIT)
+
+    def get(self, ns, key):
+        self._wait('get')
+        return super().get(ns, key)
+
+    def set(self, ns, key, value, ttl=None):
+        self._wait('set')
+        return super().set(ns, key, value, ttl)
+
+    def set_many(self, ns, items, ttl=None):
+        self._wait('set_many')
+        return super().set_many(ns, items, ttl)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SlowBackend(str(tmp_path / 'state.db'))
+    yield backend
+    backend.close()
+
+
+def run(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_slow_load_does_not_block_sessions_in_memory(backend):
+    store = SessionStore(backend=backend, flush_interval=0)
+    store[1] = {'city': 'Москва'}
+    entered, release = backend.block('get')
+    loading = run(store.get, 2)
+    assert entered.wait(WAIT)
+    assert store[1]['city'] == 'Москва'
+    store[3] = {'city': 'Томск'}
+    release.set()
+    loading.join(WAIT)
+    assert store.get(2) is None
+
+
+def test_slow_flush_does_not_block_sessions_in_memory(backend):
+    store = SessionStore(backend=backend, flush_interval=0)
+    store[1] = {'city': 'Москва'}
+    entered, release = backend.block('set_many')
+    flushing = run(store.flush)
+    assert entered.wait(WAIT)
+    store[1]['step'] = 'awaiting_city'
+    assert store[1]['city'] == 'Москва'
+    release.set()
+    flushing.join(WAIT)
+    # изменение после снимка будет записано следующим flush
+    assert store.flush() == 1
+    assert '"awaiting_city"' in backend.get(SESSION_NAMESPACE, 1)
+
+
+def test_failed_flush_keeps_sessions_dirty(backend, monkeypatch):
+    store = SessionStore(backend=backend, flush_interval=0)
+    store[1] = {'city': 'Москва'}
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(backend, 'set_many', fail)
+    with pytest.raises(OSError):
+        store.flush()
+    monkeypatch.undo()
+    assert store.flush() == 1
+
+
+def test_evicted_session_is_saved_and_reloaded(backend):
+    store = SessionStore(max_sessions=1, backend=backend, flush_interval=0)
+    store[1] = {'city': 'Москва'}
+    store[2] = {'city': 'Томск'}
+    assert store.stats()['evicted'] == 1
+    assert store[1]['city'] == 'Москва'
+
+
+def test_evicted_session_is_read_from_memory_while_saving(backend):
+    store = SessionStore(max_sessions=2, backend=backend, flush_interval=0)
+    store[1] = {'city': 'Москва'}
+    session = store[1]
+    store[2] = {'city': 'Томск'}
+    store.flush()
+    session['city'] = 'Омск'
+    entered, release = backend.block('set')
+    evicting = run(store.__setitem__, 3, {'city': 'Казань'})
+    assert entered.wait(WAIT)
+    # запись ещё идёт, но старая версия из хранилища не читается
+    assert store[1]['city'] == 'Омск'
+    assert evicting.is_alive()
+    release.set()
+    evicting.join(WAIT)
+
+
+def test_pop_before_eviction_save_is_not_resurrected(backend):
+    store = SessionStore(max_sessions=1, backend=backend, flush_interval=0)
+    store[1] = {'city': 'Москва'}
+    store.flush()
+    store[1]['city'] = 'Омск'
+    entered, release = backend.block('set')
+    evicting = run(store.__setitem__, 2, {'city': 'Томск'})
+    assert entered.wait(WAIT)
+    popping = run(store.pop, 1)
+    release.set()
+    evicting.join(WAIT)
+    popping.join(WAIT)
+    assert backend.get(SESSION_NAMESPACE, 1) is None
+    assert store.get(1) is None
+
+
+def test_idle_session_expires(backend):
+    clock = Clock()
+    store = SessionStore(idle_ttl=60, backend=backend, flush_interval=0, clock=clock)
+    store[1] = {'city': 'Москва'}
+    store.flush()
+    clock.now += 61
+    assert store.get(1) is None
+    assert backend.get(SESSION_NAMESPACE, 1) is None
+    assert store.stats()['expired'] == 1
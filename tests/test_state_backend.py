@@ -0,0 +1,141 @@
+import time
+
+import pytest
+
+from fake_services import FakeRedis
+from state_backend import RedisBackend, SQLiteBackend, open_state_backend
+
+TTL = 0.2
+
+
+@pytest.fixture
+def fake_redis():
+    redis = FakeRedis()
+    redis.start()
+    yield redis
+    redis.stop()
+
+
+@pytest.fixture
+def redis_backend(fake_redis):
+    backend = open_state_backend(fake_redis.url)
+    yield backend
+    backend.close()
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        backend = open_state_backend(f"sqlite://{tmp_path / 'state.db'}")
+        assert isinstance(backend, SQLiteBackend)
+        yield backend
+        backend.close()
+    else:
+        backend = request.getfixturevalue('redis_backend')
+        assert isinstance(backend, RedisBackend)
+        yield backend
+
+
+def test_get_set_with_ttl(backend):
+    assert backend.get('sessions', 1) is None
+    backend.set('sessions', 1, '{"step": 1}')
+    backend.set('sessions', 2, 'скоро истечёт', ttl=TTL)
+    backend.set_many('weather', [('москва', '+5'), ('казань', '+7')], ttl=60)
+
+    assert backend.get('sessions', 1) == '{"step": 1}'
+    assert backend.get('sessions', 2) == 'скоро истечёт'
+    assert backend.get('weather', 'казань') == '+7'
+    # Пространства имён не пересекаются
+    assert backend.get('weather', 1) is None
+
+    time.sleep(TTL + 0.1)
+    assert backend.get('sessions', 2) is None
+    assert backend.get('sessions', 1) == '{"step": 1}'
+    backend.delete('sessions', 1)
+    assert backend.get('sessions', 1) is None
+
+
+def test_add_only_when_key_missing_or_expired(backend):
+    assert backend.add('locks', 'prewarm', 'a', ttl=TTL)
+    assert not backend.add('locks', 'prewarm', 'b', ttl=TTL)
+    assert backend.get('locks', 'prewarm') == 'a'
+
+    time.sleep(TTL + 0.1)
+    assert backend.add('locks', 'prewarm', 'b', ttl=TTL)
+    assert backend.get('locks', 'prewarm') == 'b'
+
+
+def test_push_keeps_last_items(backend):
+    for i in range(5):
+        backend.push('history', 42, f'запрос {i}', keep=3)
+    backend.push('history', 7, 'другой', keep=3)
+
+    assert backend.range('history', 42, 10) == ['запрос 2', 'запрос 3', 'запрос 4']
+    assert backend.range('history', 42, 2) == ['запрос 3', 'запрос 4']
+    assert backend.range('history', 7, 10) == ['другой']
+    assert backend.range('history', 1, 10) == []
+
+
+def test_sqlite_purge_removes_expired(tmp_path):
+    class Clock:
+        now = 1000.0
+
+        def __call__(self):
+            return self.now
+
+    clock = Clock()
+    backend = SQLiteBackend(str(tmp_path / 'state.db'), clock=clock)
+    backend.set('cache', 'a', '1', ttl=10)
+    backend.set('cache', 'b', '2')
+    clock.now += 10
+    assert backend.get('cache', 'a') is None
+    assert backend.purge() == 1
+    assert backend.get('cache', 'b') == '2'
+    backend.close()
+
+
+def test_redis_reconnects_after_idle_close(fake_redis, redis_backend):
+    redis_backend.set('sessions', 1, 'до')
+    fake_redis.close_clients()
+
+    # Закрытое соединение замечается до отправки, так что повтор безопасен и для RPUSH
+    redis_backend.push('history', 1, 'запрос', keep=3)
+    assert redis_backend.range('history', 1, 10) == ['запрос']
+    assert redis_backend.get('sessions', 1) == 'до'
+
+
+def test_redis_does_not_repeat_push_after_lost_reply(fake_redis, redis_backend):
+    redis_backend.push('history', 1, 'первый')
+    fake_redis.drop_replies(1)
+
+    with pytest.raises(OSError):
+        redis_backend.push('history', 1, 'второй')
+    assert redis_backend.range('history', 1, 10) == ['первый', 'второй']
+
+
+def test_redis_add_after_lost_reply_raises(fake_redis, redis_backend):
+    fake_redis.drop_replies(1)
+    with pytest.raises(OSError):
+        redis_backend.add('locks', 'prewarm', 'a')
+    # Ключ занят нами, но повтор вернул бы False - ошибка честнее
+    assert redis_backend.get('locks', 'prewarm') == 'a'
+
+
+def test_redis_retries_idempotent_commands_after_lost_reply(fake_redis, redis_backend):
+    redis_backend.set('sessions', 1, 'значение')
+    fake_redis.drop_replies(1)
+    assert redis_backend.get('sessions', 1) == 'значение'
+    fake_redis.drop_replies(1)
+    redis_backend.set('sessions', 1, 'новое', ttl=60)
+    assert redis_backend.get('sessions', 1) == 'новое'
+
+
+def test_open_state_backend_urls(tmp_path):
+    assert open_state_backend('') is None
+    with pytest.raises(ValueError):
+        open_state_backend('rediss://host:6380/0')
+    backend = open_state_backend('redis://:p%40ss@redis.local:6380/2')
+    assert (backend.host, backend.port, backend.db, backend.password) == ('redis.local', 6380, 2, 'p@ss')
+    backend = open_state_backend(str(tmp_path / 'state.db'))
+    assert isinstance(backend, SQLiteBackend)
+    backend.close()
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from weather import DEFAULT_WEATHER, WEATHER_CODE_SPACE, WEATHER_TYPES, WeatherCodes, parse_weather_response
+
+
+# Старая цепочка if/elif из botbotbotbot.get_weather_description
+def legacy_weather_description(weather_code):
+    if weather_code == 800:
+        return "ясно"
+    elif weather_code in [801, 802]:
+        return "облачно"
+    elif weather_code in [803, 804]:
+        return "пасмурно"
+    elif weather_code in [300, 301, 302, 310, 311, 312, 313, 314, 321, 500, 501, 502, 503, 504, 511, 520, 521, 522, 531]:
+        return "дождь"
+    elif weather_code in [600, 601, 602, 611, 612, 613, 615, 616, 620, 621, 622]:
+        return "снег"
+    else:
+        return "разнообразно"
+
+
+# Намеренные отличия: коды, которые старая функция не знала и считала
+# "разнообразно", получают категорию своей группы - грозы и пропущенные
+# коды мороси/дождя - дождь, снег 6xx - снег, туман/дымка/пыль - пасмурно
+NEW_GROUPS = {
+    "дождь": [(200, 232), (300, 321), (500, 531)],
+    "снег": [(600, 622)],
+    "пасмурно": [(701, 771)],
+}
+CHANGED = {code: category for category, ranges in NEW_GROUPS.items() for start, end in ranges
+           for code in range(start, end + 1) if legacy_weather_description(code) == "разнообразно"}
+
+
+@pytest.fixture(scope='module')
+def codes():
+    return WeatherCodes()
+
+
+def test_every_code_matches_legacy_or_documented_change(codes):
+    mismatches = [(code, legacy_weather_description(code), codes.describe(code))
+                  for code in range(WEATHER_CODE_SPACE)
+                  if codes.describe(code) != CHANGED.get(code, legacy_weather_description(code))]
+    assert mismatches == []
+
+
+def test_codes_known_to_legacy_keep_category(codes):
+    for code in range(WEATHER_CODE_SPACE):
+        old = legacy_weather_description(code)
+        if old != "разнообразно":
+            assert codes.describe(code) == old, code
+
+
+@pytest.mark.parametrize('code', [-1, WEATHER_CODE_SPACE, 10 ** 6])
+def test_out_of_range_codes_use_default(codes, code):
+    assert codes.describe(code) == DEFAULT_WEATHER == legacy_weather_description(code)
+
+
+def test_every_code_gets_a_known_category(codes):
+    assert set(codes.table) <= set(WEATHER_TYPES)
+
+
+def test_custom_ranges_from_file(tmp_path):
+    path = tmp_path / 'codes.json'
+    path.write_text(json.dumps({"ясно": ["800-801"], "снег": [[600, 699]]}), encoding='utf-8')
+    codes = WeatherCodes.from_file(str(path))
+    assert codes.describe(801) == "ясно"
+    assert codes.describe(650) == "снег"
+    assert codes.describe(500) == DEFAULT_WEATHER
+
+
+def test_bad_file_falls_back_to_defaults(tmp_path):
+    path = tmp_path / 'codes.json'
+    path.write_text(json.dumps({"град": [906]}), encoding='utf-8')
+    assert WeatherCodes.from_file(str(path)).table == WeatherCodes().table
+
+
+def test_parse_weather_response():
+    data = {'cod': 200, 'main': {'temp': 3.5, 'humidity': 81}, 'wind': {'speed': 4.2},
+            'weather': [{'id': 501, 'description': 'дождь'}]}
+    assert parse_weather_response(data) == {'temp': 3.5, 'weather_code': 501, 'description': 'дождь',
+                                            'humidity': 81, 'wind': 4.2}
@@ -0,0 +1,90 @@
+import http.client
+import logging
+import threading
+
+import pytest
+
+from webhook_server import SECRET_HEADER, WebhookServer
+
+UPDATE = b'{"update_id": 1}'
+
+
+class FakeBot:
+    def __init__(self):
+        self.received = []
+        self.done = threading.Event()
+
+    def process_new_updates(self, updates):
+        self.received.extend(update.update_id for update in updates)
+        self.done.set()
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def start(secret_token=None, host='127.0.0.1', route=None):
+        bot = FakeBot()
+        server = WebhookServer(bot, host=host, port=0, secret_token=secret_token, route=route)
+        server.start()
+        servers.append(server)
+        return server, bot.received, bot.done
+
+    yield start
+    for server in servers:
+        server.shutdown(timeout=5)
+
+
+def post(server, secret=None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+    conn.putrequest('POST', server.path)
+    conn.putheader('Content-Type', 'application/json')
+    conn.putheader('Content-Length', str(len(UPDATE)))
+    if secret is not None:
+        conn.putheader(SECRET_HEADER, secret)
+    conn.endheaders(UPDATE)
+    status = conn.getresponse().status
+    conn.close()
+    return status
+
+
+def test_valid_secret_is_accepted(make_server):
+    server, received, done = make_server('s3cret')
+    assert post(server, 's3cret') == 200
+    assert done.wait(5)
+    assert received == [1]
+
+
+@pytest.mark.parametrize('secret', [None, 'wrong', 'секрет'.encode('utf-8'), b'\xff\xfe'])
+def test_bad_secret_is_rejected(make_server, secret):
+    server, received, done = make_server('s3cret')
+    assert post(server, secret) == 403
+    assert received == []
+
+
+def test_non_ascii_configured_secret(make_server):
+    server, received, done = make_server('секрет')
+    assert post(server, 'секрет'.encode('utf-8')) == 200
+    assert done.wait(5)
+
+
+def test_missing_secret_is_logged_at_startup(make_server, caplog):
+    with caplog.at_level(logging.WARNING):
+        make_server(None)
+    assert 'WEBHOOK_SECRET' in caplog.text
+
+
+def test_route_rejection_answers_429(make_server):
+    accepted = [True, False]
+    routed = []
+
+    def route(body):
+        routed.append(body)
+        return accepted.pop(0)
+
+    server, received, done = make_server(route=route)
+    assert post(server) == 200
+    assert post(server) == 429
+    assert routed == [UPDATE, UPDATE]
+    assert (server.received, server.rejected) == (1, 1)
+    assert received == []
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from workers import WorkerPool, update_chat_id
+
+
+def update(chat_id, update_id=1):
+    return json.dumps({'update_id': update_id, 'message': {'chat': {'id': chat_id}, 'text': 'hi'}}).encode('utf-8')
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(None, 2, max_queue=2)
+    yield pool
+    for updates in pool.queues:
+        updates.cancel_join_thread()
+        updates.close()
+
+
+def test_update_chat_id():
+    assert update_chat_id({'update_id': 5, 'callback_query': {'from': {'id': 7}, 'message': {'chat': {'id': 9}}}}) == 9
+    assert update_chat_id({'update_id': 5, 'inline_query': {'from': {'id': 7}}}) == 7
+    assert update_chat_id({'update_id': 5}) == 5
+
+
+def test_full_worker_queue_does_not_block_other_workers(pool):
+    assert pool.route(update(2, 1))
+    assert pool.route(update(4, 2))
+    # очередь процесса 0 заполнена: route не ждёт, а отклоняет
+    assert not pool.route(update(6, 3))
+    assert pool.route(update(1, 4))
+    assert pool.route(update(3, 5))
+    stats = pool.stats()
+    assert (stats['routed_0'], stats['rejected_0']) == (2, 1)
+    assert (stats['routed_1'], stats['rejected_1']) == (2, 0)
+
+
+def test_unparseable_update_is_dropped(pool):
+    assert pool.route(b'not json')
+    assert pool.routed == [0, 0]
@@ -0,0 +1,78 @@
+import json
+import logging
+
+# Нормализация погоды OpenWeatherMap: разбор ответа API и перевод кода
+# погоды (200-804) в одну из категорий бота. Соответствие задаётся
+# данными - диапазонами кодов для каждой категории - и при загрузке
+# разворачивается в плотную таблицу, индексируемую кодом.
+# Своё соответствие можно положить в JSON-файл (WEATHER_CODES_FILE)
+# в том же формате, что и WEATHER_CODE_RANGES.
+
+WEATHER_TYPES = ('ясно', 'облачно', 'пасмурно', 'дождь', 'снег', 'разнообразно')
+DEFAULT_WEATHER = 'разнообразно'
+WEATHER_CODE_SPACE = 1000
+
+# Группы кодов OWM: 2xx гроза, 3xx морось, 5xx дождь, 6xx снег,
+# 7xx туман/дымка/пыль, 800 ясно, 80x облачность
+WEATHER_CODE_RANGES = {
+    "ясно": [800],
+    "облачно": [801, 802],
+    "пасмурно": [[701, 771], [803, 804]],
+    "дождь": [[200, 232], [300, 321], [500, 531]],
+    "снег": [[600, 622]],
+    "разнообразно": [781]
+}
+
+
+def expand_codes(spec):
+    for item in spec:
+        if isinstance(item, (list, tuple)):
+            start, end = item
+            yield from range(int(start), int(end) + 1)
+        elif isinstance(item, str) and '-' in item:
+            start, end = item.split('-', 1)
+            yield from range(int(start), int(end) + 1)
+        else:
+            yield int(item)
+
+
+class WeatherCodes:
+    def __init__(self, ranges=WEATHER_CODE_RANGES, default=DEFAULT_WEATHER, size=WEATHER_CODE_SPACE):
+        self.default = default
+        self.table = [default] * size
+        for category, spec in ranges.items():
+            if category not in WEATHER_TYPES:
+                raise ValueError(f"Неизвестная категория погоды: {category}")
+            for code in expand_codes(spec):
+                if not 0 <= code < size:
+                    raise ValueError(f"Код погоды вне диапазона: {code}")
+                self.table[code] = category
+
+    @classmethod
+    def from_file(cls, path=None):
+        if not path:
+            return cls()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except Exception as e:
+            logging.error("Ошибка при загрузке кодов погоды из %s: %s", path, e)
+            return cls()
+
+    def describe(self, weather_code):
+        if 0 <= weather_code < len(self.table):
+            return self.table[weather_code]
+        return self.default
+
+
+def parse_weather_response(data):
+    if data['cod'] != 200:
+        raise Exception(data.get('message', 'Unknown error'))
+
+    return {
+        'temp': data['main']['temp'],
+        'weather_code': data['weather'][0]['id'],
+        'description': data['weather'][0]['description'],
+        'humidity': data['main']['humidity'],
+        'wind': data['wind']['speed']
+    }
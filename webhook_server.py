@@ -0,0 +1,169 @@
+import hmac
+import json
+import queue
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+# Режим webhook: локальный HTTP-сервер принимает обновления Telegram,
+# проверяет секретный токен, сразу отвечает 200 и ставит обновление
+# в очередь; отдельный поток передаёт его в bot.process_new_updates
+# (или в on_update). Если задан route (WorkerPool.route при нескольких
+# процессах), обновление передаётся ему прямо из обработчика запроса:
+# False - не принято, ответ 429.
+# GET /healthz - проверка живости, при остановке очередь дочитывается.
+
+WEBHOOK_HOST = '0.0.0.0'
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = '/webhook'
+WEBHOOK_MAX_QUEUE = 1000
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+
+
+def process_update(bot, body):
+    update = types.Update.de_json(body.decode('utf-8'))
+    bot.process_new_updates([update])
+
+
+class WebhookServer:
+    def __init__(self, bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                 secret_token=None, max_queue=WEBHOOK_MAX_QUEUE, on_update=None, route=None):
+        self.bot = bot
+        self.host = host
+        self.on_update = on_update or (lambda body: process_update(bot, body))
+        self.route = route
+        self.path = path
+        self.secret_token = secret_token
+        self.updates = queue.Queue(maxsize=max_queue)
+        self.draining = threading.Event()
+        self.received = 0
+        self.rejected = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._consumer = threading.Thread(target=self._consume, name="webhook-consumer", daemon=True)
+        self._serve_thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, code, payload=b''):
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if self.path == '/healthz':
+                    status = 'draining' if server.draining.is_set() else 'ok'
+                    body = json.dumps({
+                        'status': status,
+                        'queued': server.updates.qsize(),
+                        'received': server.received,
+                    }).encode('utf-8')
+                    self._reply(503 if server.draining.is_set() else 200, body)
+                else:
+                    self._reply(404)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+                if not server.check_secret(self.headers.get(SECRET_HEADER)):
+                    logging.warning("Webhook: неверный секретный токен")
+                    self._reply(403)
+                    return
+                if server.draining.is_set():
+                    self._reply(503)
+                    return
+                if not server.accept(body):
+                    # Telegram повторит доставку позже
+                    server.rejected += 1
+                    self._reply(429)
+                    return
+                server.received += 1
+                self._reply(200)
+
+            def log_message(self, format, *args):
+                logging.debug("Webhook: " + format, *args)
+
+        return Handler
+
+    # Сравнение байтов: compare_digest на строках с не-ASCII символами
+    # бросает TypeError, и запрос остался бы без ответа. http.server
+    # декодирует заголовки как latin-1 - обратное кодирование даёт байты запроса
+    def check_secret(self, token):
+        if not self.secret_token:
+            return True
+        if token is None:
+            return False
+        try:
+            received = token.encode('latin-1')
+        except UnicodeEncodeError:
+            return False
+        return hmac.compare_digest(received, self.secret_token.encode('utf-8'))
+
+    def accept(self, body):
+        if self.route is not None:
+            return self.route(body)
+        try:
+            self.updates.put_nowait(body)
+        except queue.Full:
+            return False
+        return True
+
+    def _log_start(self):
+        logging.info("Webhook сервер слушает порт %s, путь %s", self.port, self.path)
+        if self.secret_token:
+            return
+        if self.host in LOOPBACK_HOSTS:
+            logging.warning("Webhook: WEBHOOK_SECRET не задан, обновления принимаются без проверки")
+        else:
+            logging.warning("Webhook: WEBHOOK_SECRET не задан, а сервер слушает %s - любой может "
+                            "отправить боту поддельное обновление", self.host or 'все интерфейсы')
+
+    def _consume(self):
+        while True:
+            body = self.updates.get()
+            if body is None:
+                return
+            try:
+                self.on_update(body)
+            except Exception as e:
+                logging.error("Webhook: ошибка обработки обновления: %s", e)
+
+    def start(self):
+        self._consumer.start()
+        self._serve_thread = threading.Thread(target=self.httpd.serve_forever, name="webhook-http", daemon=True)
+        self._serve_thread.start()
+        self._log_start()
+
+    def serve_forever(self):
+        self._consumer.start()
+        self._log_start()
+        self.httpd.serve_forever()
+
+    # Плавная остановка: перестаём принимать обновления, дочитываем очередь
+    # и ждём завершения уже запущенных обработчиков
+    def shutdown(self, timeout=30):
+        self.draining.set()
+        threading.Thread(target=self.httpd.shutdown, daemon=True).start()
+        self.updates.put(None)
+        self._consumer.join(timeout)
+        pool = getattr(self.bot, 'worker_pool', None)
+        if pool is not None and hasattr(pool, 'join'):
+            pool.join(timeout)
+        self.httpd.server_close()
+        logging.info("Webhook сервер остановлен")
@@ -0,0 +1,170 @@
+import os
+import json
+import queue
+import time
+import signal
+import threading
+import logging
+import multiprocessing
+
+# Несколько процессов-обработчиков за одним webhook: основной процесс
+# принимает обновления и раскладывает их по очередям процессов по chat_id
+# (chat_id % N), так что все обновления одного чата обрабатывает один
+# процесс - по порядку, со своими next_step handler, наборами мест и
+# лимитами отправки. Общее состояние - в state_backend.py.
+# Процессы запускаются через spawn (в родителе уже работают потоки),
+# номер и число процессов передаются в переменных окружения
+# BOT_WORKER_INDEX и BOT_WORKER_COUNT. Упавший процесс перезапускается.
+# Заполненная очередь одного процесса не задерживает остальные: его
+# обновления отклоняются (WebhookServer отвечает 429, Telegram повторит
+# доставку), обновления других процессов принимаются как обычно.
+
+WORKER_MAX_QUEUE = 1000
+WORKER_CHECK_INTERVAL = 1.0
+WORKER_STOP_TIMEOUT = 30
+UPDATE_KINDS = ('message', 'edited_message', 'callback_query', 'channel_post', 'edited_channel_post',
+                'my_chat_member', 'chat_member', 'chat_join_request')
+
+
+def update_chat_id(update):
+    for kind in UPDATE_KINDS:
+        body = update.get(kind)
+        if body is None:
+            continue
+        if kind == 'callback_query':
+            chat = (body.get('message') or {}).get('chat')
+        else:
+            chat = body.get('chat')
+        if chat is not None:
+            return chat.get('id')
+        return (body.get('from') or {}).get('id')
+    for body in update.values():
+        if isinstance(body, dict) and isinstance(body.get('from'), dict):
+            return body['from'].get('id')
+    return update.get('update_id')
+
+
+def worker_env(index, count):
+    return {'BOT_WORKER_INDEX': str(index), 'BOT_WORKER_COUNT': str(count)}
+
+
+# Цикл процесса-обработчика: handle(body) для каждого обновления до None
+def serve_updates(updates, handle):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    while True:
+        body = updates.get()
+        if body is None:
+            return
+        try:
+            handle(body)
+        except Exception as e:
+            logging.error("Ошибка обработки обновления в процессе %s: %s", os.getpid(), e)
+
+
+class WorkerPool:
+    def __init__(self, target, count, args=(), env=worker_env, max_queue=WORKER_MAX_QUEUE,
+                 check_interval=WORKER_CHECK_INTERVAL):
+        self.target = target
+        self.count = count
+        self.args = args
+        self.env = env
+        self.check_interval = check_interval
+        self.context = multiprocessing.get_context('spawn')
+        self.queues = [self.context.Queue(max_queue) for _ in range(count)]
+        self.processes = [None] * count
+        self.routed = [0] * count
+        self.rejected = [0] * count
+        self.restarts = 0
+        self._stop = threading.Event()
+        self._supervisor = None
+
+    # Переменные окружения процесса выставляются только на время запуска
+    def _spawn(self, index):
+        env = self.env(index, self.count) if self.env else {}
+        saved = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        try:
+            process = self.context.Process(
+                target=self.target, args=(index, self.queues[index]) + tuple(self.args),
+                name=f"bot-worker-{index}", daemon=True
+            )
+            process.start()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self.processes[index] = process
+        logging.info("Запущен процесс-обработчик %s (pid %s)", index, process.pid)
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+        self._supervisor = threading.Thread(target=self._supervise, name="workers-supervisor", daemon=True)
+        self._supervisor.start()
+
+    def _supervise(self):
+        while not self._stop.wait(self.check_interval):
+            for index, process in enumerate(self.processes):
+                if process.is_alive() or self._stop.is_set():
+                    continue
+                logging.error("Процесс-обработчик %s завершился (код %s), перезапуск", index, process.exitcode)
+                self.restarts += 1
+                self._spawn(index)
+
+    def shard(self, chat_id):
+        try:
+            return int(chat_id) % self.count
+        except (TypeError, ValueError):
+            return hash(chat_id) % self.count
+
+    # Тело обновления (bytes) - в очередь процесса его чата, без ожидания.
+    # False - очередь процесса заполнена, обновление не принято
+    def route(self, body):
+        try:
+            chat_id = update_chat_id(json.loads(body))
+        except (ValueError, AttributeError) as e:
+            logging.warning("Не удалось разобрать обновление: %s", e)
+            return True
+        index = self.shard(chat_id)
+        try:
+            self.queues[index].put_nowait(body)
+        except queue.Full:
+            self.rejected[index] += 1
+            logging.warning("Очередь процесса-обработчика %s заполнена, обновление отклонено", index)
+            return False
+        self.routed[index] += 1
+        return True
+
+    def stats(self):
+        stats = {'workers': self.count, 'restarts': self.restarts,
+                 'alive': sum(1 for p in self.processes if p is not None and p.is_alive())}
+        for index, updates in enumerate(self.queues):
+            stats[f'routed_{index}'] = self.routed[index]
+            stats[f'rejected_{index}'] = self.rejected[index]
+            try:
+                stats[f'queued_{index}'] = updates.qsize()
+            except NotImplementedError:
+                pass
+        return stats
+
+    # Остановка: None в каждую очередь, процессы дочитывают очередь и
+    # сохраняют состояние; не успевшие за timeout завершаются принудительно
+    def stop(self, timeout=WORKER_STOP_TIMEOUT):
+        self._stop.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+        for updates in self.queues:
+            updates.put(None)
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.warning("Процесс-обработчик %s не завершился за %s с, остановка", index, timeout)
+                process.kill()
+                process.join()
+        logging.info("Процессы-обработчики остановлены")